@@ -0,0 +1,49 @@
+import ast
+
+from ast_utils import walk_detectors, FormulaDetector, FutureFlagsDetector, LoopSpanDetector, CatchSpanDetector
+from nn_extractor import NNModelDetector
+from recursion_detector import RecursionDetector
+from call_graph import CallGraphDetector
+
+# Detectors run on every program, in this order. A new detector only needs to
+# subclass ast_utils.Detector and be registered here, it adds no extra parse.
+# One marked optional only runs when analyze() is asked for it by name.
+DETECTORS = [
+    FormulaDetector,
+    FutureFlagsDetector,
+    LoopSpanDetector,
+    CatchSpanDetector,
+    NNModelDetector,
+    RecursionDetector,
+    CallGraphDetector,
+]
+
+def register(detector):
+    if detector not in DETECTORS:
+        DETECTORS.append(detector)
+    return detector
+
+def analyze(code, optional=()):
+    """
+    Parses the source once and runs every registered detector over a single
+    walk of the tree, the optional ones only when their name is in optional.
+    Returns a dict with each detector's result under its name, plus "tree",
+    which compile() can take instead of the source. A source that doesn't
+    parse gets empty results and tree None.
+    """
+    detectors = [
+        detector() for detector in DETECTORS
+        if not detector.optional or detector.name in optional
+    ]
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        # compile() reports the error, every detector falls back to its empty state
+        tree = ast.Module(body=[], type_ignores=[])
+        results = walk_detectors(tree, detectors)
+        results["tree"] = None
+        return results
+
+    results = walk_detectors(tree, detectors)
+    results["tree"] = tree
+    return results
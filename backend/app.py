@@ -1,19 +1,367 @@
-from flask import Flask, request, jsonify
+import json
+
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
-from executor import run_code
+import pool
+import cache
+import jobs
+from budgets import BUDGET_FIELDS
+
+# steps per message when a cached result is replayed as a stream
+REPLAY_BATCH = 200
+
+# "full": every step carries its before/after variable dicts
+# "table": steps reference a shared table of states and distinct values
+STATE_FORMATS = ("full", "table")
+
+# "list": array values as nested lists, "binary": base64 of the raw buffer
+ARRAY_ENCODINGS = ("list", "binary")
+
+# "full": every call, "collapsed": the top levels with repeated calls grouped,
+# the rest is fetched from /calls
+CALL_TREE_FORMATS = ("full", "collapsed")
+
+# "all": every user function is traced, "visualized": helpers the call graph
+# shows to be side-effect free (call_graph.CallGraphDetector) run untraced
+TRACE_SCOPES = ("all", "visualized")
+
+# options that only shape /execute's response, not what a re-run computes
+RESPONSE_OPTIONS = ("state_format", "array_encoding", "capture_activations", "call_tree_format")
 
 app = Flask(__name__)
 CORS(app)
 
+def whole_number(value):
+    # value as an int, None when it isn't one (true and false aren't either)
+    if isinstance(value, bool):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+def count_option(name, default):
+    # a whole number, anything else falls back to the default like the formats do
+    value = whole_number(request.json.get(name, default))
+    return default if value is None else value
+
+def window_option(value):
+    # [start, stop] of a tile's rows or cols, None when it isn't two whole numbers
+    if not isinstance(value, list) or len(value) != 2:
+        return None
+    window = [whole_number(v) for v in value]
+    return None if None in window else window
+
+def invalid(name):
+    return jsonify({"success": False, "error": f"Invalid {name}"}), 400
+
+def budget_option(requested):
+    # the fields that are positive numbers, the others keep the server's ceiling
+    if not isinstance(requested, dict):
+        return {}
+    budget = {}
+    for k in BUDGET_FIELDS:
+        value = requested.get(k)
+        if value is None or isinstance(value, bool):
+            continue
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            continue
+        if value > 0:
+            budget[k] = value
+    return budget
+
+def run_options():
+    # opt-in: keep the first/last iterations of hot loops, summarise the rest
+    fold_loops = bool(request.json.get('fold_loops', False))
+    fold_head = count_option('fold_head', 3)
+    fold_tail = count_option('fold_tail', 3)
+
+    # user-defined modules (by __name__) traced alongside the main program
+    trace_modules = request.json.get('trace_modules')
+    if not isinstance(trace_modules, list):
+        trace_modules = []
+    trace_modules = [m for m in trace_modules if isinstance(m, str)]
+
+    # per-request limits, capped by the server-wide budgets
+    budget = budget_option(request.json.get('budget'))
+
+    state_format = request.json.get('state_format', 'full')
+    if state_format not in STATE_FORMATS:
+        state_format = 'full'
+
+    array_encoding = request.json.get('array_encoding', 'list')
+    if array_encoding not in ARRAY_ENCODINGS:
+        array_encoding = 'list'
+
+    # opt-in: summaries of every torch layer's output during the program's forward calls
+    capture_activations = bool(request.json.get('capture_activations', False))
+
+    trace_scope = request.json.get('trace_scope', 'all')
+    if trace_scope not in TRACE_SCOPES:
+        trace_scope = 'all'
+
+    call_tree_format = request.json.get('call_tree_format', 'full')
+    if call_tree_format not in CALL_TREE_FORMATS:
+        call_tree_format = 'full'
+
+    return {
+        "code": request.json.get('code', ''),
+        "fold_loops": fold_loops,
+        "fold_head": fold_head,
+        "fold_tail": fold_tail,
+        "trace_modules": trace_modules,
+        "budget": budget,
+        "trace_scope": trace_scope,
+        "state_format": state_format,
+        "array_encoding": array_encoding,
+        "capture_activations": capture_activations,
+        "call_tree_format": call_tree_format
+    }
+
 @app.route('/execute', methods=['POST'])
 def execute():
-    code = request.json.get('code', '')
-    if not code:
+    options = run_options()
+    if not options["code"]:
         return jsonify({"success": False, "error": "No code provided"}), 400
-    
-    return jsonify(run_code(code))
+
+    # identical earlier run, nothing is executed
+    key = cache.cache_key(options)
+    payload = cache.lookup(key)
+    if payload is not None:
+        return Response(payload, mimetype="application/json")
+
+    # runs in a pre-started worker process, not in the server
+    result = pool.execute(**options)
+    payload = cache.store(key, result)
+    if payload is not None:
+        return Response(payload, mimetype="application/json")
+    return jsonify(result)
+
+def ndjson(message):
+    return json.dumps(message, separators=(",", ":")) + "\n"
+
+def replay(result):
+    # a cached result in the message format of /execute/stream
+    steps = result["steps"]
+    for start in range(0, max(len(steps), 1), REPLAY_BATCH):
+        message = {
+            "type": "steps",
+            "steps": steps[start:start + REPLAY_BATCH],
+            "calls": result["call_tree"] if start == 0 else []
+        }
+        if "states" in result:
+            # the whole tables go with the first batch, like the calls
+            message["values"] = result["values"] if start == 0 else []
+            message["states"] = result["states"] if start == 0 else []
+            message["lines"] = result["lines"] if start == 0 else {}
+        yield message
+    yield {
+        "type": "done",
+        "nn_models": result["nn_models"],
+        "recursive_funcs": result["recursive_funcs"],
+        "truncated": result["truncated"]
+    }
+
+def merge(result, message):
+    # adds a "steps" or "done" stream message to a result in /execute's format
+    if message["type"] == "steps":
+        result["steps"] += message["steps"]
+        result["call_tree"] += message["calls"]
+        if "states" in message:
+            result.setdefault("values", []).extend(message["values"])
+            result.setdefault("states", []).extend(message["states"])
+            result.setdefault("lines", {}).update(message["lines"])
+    elif message["type"] == "done":
+        result.update({k: v for k, v in message.items() if k != "type"})
+
+def collect(messages, key):
+    # passes the stream through and caches the assembled result at the end,
+    # unless it grew past what a single cache entry may hold
+    result = {"success": True, "steps": [], "call_tree": []}
+    size = 0
+    for message in messages:
+        line = ndjson(message)
+        yield line
+
+        if result is None:
+            continue
+        size += len(line)
+        if size > cache.results.max_entry or message["type"] == "error":
+            result = None
+            continue
+        merge(result, message)
+        if message["type"] == "done":
+            cache.store(key, result)
+
+@app.route('/execute/stream', methods=['POST'])
+def execute_stream():
+    # same request as /execute, answered as newline-delimited JSON messages:
+    # {"type": "steps", ...} batches while the program runs, then "done" or "error"
+    options = run_options()
+    if not options["code"]:
+        return jsonify({"success": False, "error": "No code provided"}), 400
+
+    key = cache.cache_key(options)
+    payload = cache.lookup(key)
+    if payload is not None:
+        lines = map(ndjson, replay(json.loads(payload)))
+    elif key is not None:
+        lines = collect(pool.stream(**options), key)
+    else:
+        lines = map(ndjson, pool.stream(**options))
+
+    return Response(stream_with_context(lines), mimetype="application/x-ndjson")
+
+def job_messages(options, key, cancelled):
+    # the /execute/stream messages of a job, answered from and stored in the
+    # result cache like the stream
+    payload = cache.lookup(key)
+    if payload is not None:
+        yield from replay(json.loads(payload))
+        return
+
+    messages = pool.stream(cancelled, **options)
+    result = {"success": True, "steps": [], "call_tree": []}
+    try:
+        for message in messages:
+            yield message
+            merge(result, message)
+            if message["type"] == "done":
+                cache.store(key, result)
+    finally:
+        messages.close()
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    # same request as /execute, answered at once with a job id. The run's
+    # stream messages are fetched with GET /jobs/<id>, DELETE cancels it.
+    options = run_options()
+    if not options["code"]:
+        return jsonify({"success": False, "error": "No code provided"}), 400
+
+    key = cache.cache_key(options)
+    try:
+        job = jobs.job_queue.submit(lambda cancelled: job_messages(options, key, cancelled))
+    except jobs.QueueFull as e:
+        # saturated: turned away right away, the client retries later
+        return jsonify({"success": False, "error": f"Too many jobs, try again later ({e})"}), 429, {"Retry-After": "1"}
+
+    return jsonify({"success": True, "job_id": job.id, "status": job.status}), 202, {"Location": f"/jobs/{job.id}"}
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    # status, step progress and the messages from index ?since= on
+    job = jobs.job_queue.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": f"No job {job_id}"}), 404
+    since = max(request.args.get('since', 0, type=int), 0)
+    return Response(job.view(since, jobs.job_queue.position(job)), mimetype="application/json")
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    job = jobs.job_queue.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": f"No job {job_id}"}), 404
+    jobs.job_queue.cancel(job)
+    return jsonify({"success": True, "job_id": job.id, "status": job.status})
+
+def rerun_refused(code):
+    # /tile and /calls run the program again and index into that trace. A
+    # program cache.is_deterministic rejects (random numbers, clocks, ...)
+    # would show data of a different run than /execute's, it is refused.
+    if cache.is_deterministic(code):
+        return None
+    error = "The program isn't deterministic, a second run would not match the first"
+    return jsonify({"success": False, "error": error}), 400
+
+@app.route('/tile', methods=['POST'])
+def tile():
+    # a zoomed window of one array variable at one step of the /execute trace:
+    # {"step", "name", "state": "before" | "after", "rows": [start, stop], "cols": [start, stop]}
+    options = run_options()
+    if not options["code"]:
+        return jsonify({"success": False, "error": "No code provided"}), 400
+    refused = rerun_refused(options["code"])
+    if refused is not None:
+        return refused
+    # the response format options don't change the tile
+    for name in RESPONSE_OPTIONS:
+        del options[name]
+
+    step = whole_number(request.json.get('step', 0))
+    if step is None:
+        return invalid("step")
+    options.update({
+        "step": step,
+        "name": str(request.json.get('name', '')),
+        "state": 'before' if request.json.get('state') == 'before' else 'after'
+    })
+    # left out for the whole array
+    for name in ('rows', 'cols'):
+        window = request.json.get(name)
+        if window is not None:
+            window = window_option(window)
+            if window is None:
+                return invalid(name)
+        options[name] = window
+
+    # the program runs again, the result cache makes repeated tiles free
+    key = cache.cache_key(options)
+    payload = cache.lookup(key)
+    if payload is not None:
+        return Response(payload, mimetype="application/json")
+
+    result = pool.tile(**options)
+    payload = cache.store(key, result)
+    if payload is not None:
+        return Response(payload, mimetype="application/json")
+    return jsonify(result)
+
+@app.route('/calls', methods=['POST'])
+def calls():
+    # the collapsed call tree below one call of the /execute trace:
+    # {"call_id", "offset": child groups the client already has}
+    options = run_options()
+    if not options["code"]:
+        return jsonify({"success": False, "error": "No code provided"}), 400
+    refused = rerun_refused(options["code"])
+    if refused is not None:
+        return refused
+    for name in RESPONSE_OPTIONS:
+        del options[name]
+
+    # no call_id for the calls at the top
+    call_id = request.json.get('call_id')
+    if call_id is not None:
+        call_id = whole_number(call_id)
+        if call_id is None:
+            return invalid("call_id")
+    options.update({
+        "call_id": call_id,
+        "offset": max(count_option('offset', 0), 0)
+    })
+
+    # the program runs again, cached like /tile
+    key = cache.cache_key(options)
+    payload = cache.lookup(key)
+    if payload is not None:
+        return Response(payload, mimetype="application/json")
+
+    result = pool.calls(**options)
+    payload = cache.store(key, result)
+    if payload is not None:
+        return Response(payload, mimetype="application/json")
+    return jsonify(result)
 
 @app.route('/health', methods=['GET'])
 def health():
     return {"status": "OK", "message": "Backend running"}
 
+if __name__ == "__main__":
+    # spawned and forkserver workers import this file as __mp_main__, only
+    # the server itself gets here. Served by a WSGI server instead the pool
+    # starts on the first request.
+    pool.warm_start()
+    app.run()
@@ -0,0 +1,138 @@
+import os
+import sys
+import math
+
+# cells per side of the pooled grid sent with a large array's summary, and
+# of the tiles returned for a zoomed window
+THUMBNAIL_SIZE = int(os.environ.get("DHRISTI_THUMBNAIL_SIZE", 64))
+
+HISTOGRAM_BINS = 32
+QUANTILES = {"p1": 0.01, "p25": 0.25, "p50": 0.5, "p75": 0.75, "p99": 0.99}
+
+# pooled cells are for drawing, a few digits keep their JSON short
+SIGNIFICANT_DIGITS = 4
+
+# dtype kinds that are summarized: bool, int, uint, float
+NUMERIC_KINDS = "biuf"
+
+# Only called for values that already are numpy arrays (or tensors turned into
+# one), so numpy is taken from sys.modules rather than imported here.
+
+
+def as_grid(array):
+    # 2-D view that is pooled and tiled: a vector is one row, the leading
+    # dimensions of an n-D array are stacked as rows
+    if array.ndim == 0:
+        return array.reshape(1, 1)
+    if array.ndim == 1:
+        return array.reshape(1, -1)
+    return array.reshape(-1, array.shape[-1])
+
+
+def rounded(values):
+    np = sys.modules["numpy"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        magnitude = np.floor(np.log10(np.abs(values)))
+    magnitude = np.where(np.isfinite(magnitude), magnitude, 0)
+    scale = 10.0 ** (SIGNIFICANT_DIGITS - 1 - magnitude)
+    return np.round(values * scale) / scale
+
+
+def window(span, n):
+    # [start, stop) clamped to the axis, the whole axis when span is None
+    if span is None:
+        return 0, n
+    start = min(max(int(span[0]), 0), n)
+    stop = min(max(int(span[1]), start), n)
+    return start, stop
+
+
+def pool_grid(grid, size=THUMBNAIL_SIZE, rows=None, cols=None, finite=None):
+    """
+    Mean and max over equal blocks of grid[rows, cols], with blocks as small
+    as possible while at most size x size of them remain. NaN and inf are
+    left out of both, a block without a finite value is None. With a block of
+    1 x 1 the "mean" cells are the exact values. finite is np.isfinite of
+    the window when the caller already has it.
+    """
+    np = sys.modules["numpy"]
+    r0, r1 = window(rows, grid.shape[0])
+    c0, c1 = window(cols, grid.shape[1])
+    part = grid[r0:r1, c0:c1].astype(np.float64, copy=False)
+    block = [max(1, math.ceil((r1 - r0) / size)), max(1, math.ceil((c1 - c0) / size))]
+
+    tile = {"shape": list(grid.shape), "rows": [r0, r1], "cols": [c0, c1], "block": block}
+    if part.size == 0:
+        tile["mean"] = tile["max"] = []
+        return tile
+
+    row_starts = np.arange(0, part.shape[0], block[0])
+    col_starts = np.arange(0, part.shape[1], block[1])
+
+    def pooled(ufunc, values):
+        return ufunc.reduceat(ufunc.reduceat(values, row_starts, axis=0), col_starts, axis=1)
+
+    if finite is None:
+        finite = np.isfinite(part)
+    counts = pooled(np.add, finite.astype(np.int64))
+    sums = pooled(np.add, np.where(finite, part, 0.0))
+    maxes = pooled(np.maximum, np.where(finite, part, -np.inf))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        means = sums / counts
+
+    empty = counts == 0
+    tile["mean"] = np.where(empty, None, rounded(means)).tolist()
+    tile["max"] = np.where(empty, None, rounded(maxes)).tolist()
+    return tile
+
+
+def distribution(array, finite=None):
+    # NaN / inf counts, quantiles and a histogram of the finite values,
+    # finite is np.isfinite of the array when the caller already has it
+    np = sys.modules["numpy"]
+    values = array.reshape(-1).astype(np.float64, copy=False)
+    finite = np.isfinite(values) if finite is None else finite.reshape(-1)
+    kept = values[finite]
+    nan = int(np.count_nonzero(np.isnan(values[~finite]))) if kept.size < values.size else 0
+
+    result = {"nan": nan, "inf": int(values.size - kept.size - nan)}
+    if kept.size:
+        # min and max come out of the same partition as the quantiles, the
+        # histogram doesn't look for them again
+        low, *quantiles, high = np.quantile(kept, [0.0, *QUANTILES.values(), 1.0])
+        counts, edges = np.histogram(kept, bins=HISTOGRAM_BINS, range=(low, high))
+        result["quantiles"] = dict(zip(QUANTILES, rounded(np.array(quantiles)).tolist()))
+        result["histogram"] = {
+            "min": float(edges[0]),
+            "max": float(edges[-1]),
+            "counts": counts.tolist()
+        }
+    return result
+
+
+def lod_summary(array):
+    # extra summary fields of a large array, {} for dtypes that aren't numeric.
+    # One float64 copy and one finite mask serve the distribution and the
+    # thumbnail.
+    if array.dtype.kind not in NUMERIC_KINDS:
+        return {}
+    np = sys.modules["numpy"]
+    grid = as_grid(array).astype(np.float64, copy=False)
+    finite = np.isfinite(grid)
+    summary = distribution(grid, finite)
+    summary["thumbnail"] = pool_grid(grid, finite=finite)
+    return summary
+
+
+def to_array(value):
+    # numpy view of an ndarray or tensor variable, None for anything else
+    np = sys.modules.get("numpy")
+    if np is not None and isinstance(value, np.ndarray):
+        return value
+    torch = sys.modules.get("torch")
+    if torch is not None and isinstance(value, torch.Tensor):
+        try:
+            return value.detach().cpu().numpy()
+        except (TypeError, RuntimeError):
+            return None
+    return None
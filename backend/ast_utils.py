@@ -1,55 +1,137 @@
 import ast
-import sympy as sp
 import __future__
 
-def find_candidate_expressions(source):
-    try:
-        tree = ast.parse(source)
-    except:
-        return {}
-    
-    formulas = {}
+
+class Detector:
+    """
+    One static check over the user's source. The analysis parses the code
+    once and walks the tree once, handing every node whose type is listed in
+    node_types to visit(). result() is stored under name. An optional one
+    only runs when analysis.analyze() is asked for it.
+    """
+
+    name = None
+    node_types = ()
+    optional = False
+
+    def begin(self, tree):
+        pass
+
+    def visit(self, node):
+        pass
+
+    def result(self):
+        return None
+
+
+def walk_detectors(tree, detectors):
+    # single ast.walk, each node only goes to the detectors that asked for its type
+    dispatch = {}
+    for detector in detectors:
+        detector.begin(tree)
+        for node_type in detector.node_types:
+            dispatch.setdefault(node_type, []).append(detector.visit)
+
     for node in ast.walk(tree):
-        if isinstance(node, (ast.Assign, ast.AnnAssign, ast.Return)):
-            val = node.value if isinstance(node, ast.Assign) or isinstance(node, ast.AnnAssign) else node.value
-            if val is None:
+        visits = dispatch.get(type(node))
+        if visits:
+            for visit in visits:
+                visit(node)
+
+    return {detector.name: detector.result() for detector in detectors}
+
+
+class FormulaDetector(Detector):
+    # line number -> {"expr", "latex"} for assignments and returns of an
+    # expression, "latex" is filled in by latex.render_formulas during the run
+    name = "formulas"
+    node_types = (ast.Assign, ast.AnnAssign, ast.Return)
+
+    def begin(self, tree):
+        self.formulas = {}
+
+    def visit(self, node):
+        val = node.value
+        if val is None:
+            return
+
+        if isinstance(val, (ast.BinOp, ast.UnaryOp, ast.Call, ast.BoolOp, ast.Compare)):
+            try:
+                src = ast.unparse(val)
+            except:
+                src = "<expr>"
+
+            self.formulas[getattr(node, "lineno", None)] = {"expr": src, "latex": None}
+
+    def result(self):
+        return self.formulas
+
+
+class FutureFlagsDetector(Detector):
+    # compiler flags of the module's `from __future__ import ...` statements
+    name = "future_flags"
+
+    def begin(self, tree):
+        self.flags = 0
+
+        for node in tree.body:
+            if not isinstance(node, ast.ImportFrom):
                 continue
-            
-            if isinstance(val, (ast.BinOp, ast.UnaryOp, ast.Call, ast.BoolOp, ast.Compare)):
-                try:
-                    src = ast.unparse(val)
-                except:
-                    src = "<expr>"
-                
-                latex = None
-                try:
-                    sym = sp.sympify(src)
-                    latex = sp.latex(sym)
-                except:
-                    latex = None
-
-                formulas[getattr(node, "lineno", None)] = {"expr": src, "latex": latex}
-    
-    return formulas
-
-def get_future_flags(code):
-    try:
-        tree = ast.parse(code)
-    except:
-        return 0
-    
-    flags = 0
-
-    for node in tree.body:
-        if not isinstance(node, ast.ImportFrom):
-            continue
-        if node.module != "__future__":
-            continue
-
-        for alias in node.names:
-            feature = alias.name
-            if hasattr(__future__, feature):
-                flags |= getattr(__future__, feature).compiler_flag
-
-    return flags
+            if node.module != "__future__":
+                continue
+
+            for alias in node.names:
+                feature = alias.name
+                if hasattr(__future__, feature):
+                    self.flags |= getattr(__future__, feature).compiler_flag
+
+    def result(self):
+        return self.flags
+
+
+class LoopSpanDetector(Detector):
+    # header line -> last line of the loop body
+    name = "loop_spans"
+    node_types = (ast.For, ast.AsyncFor, ast.While)
+
+    def begin(self, tree):
+        self.spans = {}
+
+    def visit(self, node):
+        self.spans[node.lineno] = node.end_lineno
+
+    def result(self):
+        return self.spans
+
+
+def swallows(statements):
+    # return, break or continue in a finally clause drop the exception in flight
+    for statement in statements:
+        for node in ast.walk(statement):
+            if isinstance(node, (ast.Return, ast.Break, ast.Continue)):
+                return True
+    return False
+
+
+class CatchSpanDetector(Detector):
+    # (first, last) lines of try bodies that catch BaseException: a bare
+    # except, except BaseException, or a finally that swallows the exception
+    name = "catch_spans"
+    node_types = (ast.Try,)
+
+    def begin(self, tree):
+        self.spans = []
+
+    def visit(self, node):
+        catches = swallows(node.finalbody) or any(
+            handler.type is None or any(
+                getattr(n, "id", getattr(n, "attr", None)) == "BaseException"
+                for n in ast.walk(handler.type)
+            )
+            for handler in node.handlers
+        )
+        if catches:
+            self.spans.append((node.body[0].lineno, node.body[-1].end_lineno))
 
+    def result(self):
+        return self.spans
@@ -0,0 +1,54 @@
+"""
+/execute latency of a program with many formula lines, with the LaTeX cache
+cold and warm.
+
+Every run uses a fresh program (the constants change), so "cold" pays for
+sympy on each formula, rendered on the latex threads while the program runs.
+"warm" runs the same programs again and finds every formula in the cache.
+sympy is imported up front, as the worker pool does.
+
+    python benchmarks/bench_formulas.py
+    python benchmarks/bench_formulas.py --formulas 200 --runs 10
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sympy
+
+import executor
+import latex
+
+LINE = "y{i} = x * {c} + x ** 2 / ({c} + {i}) - sqrt(x + {i})"
+
+def program(formulas, run):
+    lines = ["import numpy as np", "from math import sqrt", "x = 3.0", "z = np.zeros(3)"]
+    lines += [LINE.format(i=i, c=run + 1) for i in range(formulas)]
+    return "\n".join(lines) + "\n"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--formulas", type=int, default=50)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    programs = [program(args.formulas, run) for run in range(args.runs)]
+    executor.run_code(program(1, -1)) # starts the latex threads
+
+    print(f"{'cache':>6} {'seconds/run':>12} {'timed out':>10}")
+    for label in ("cold", "warm"):
+        timed_out = 0
+        start = time.perf_counter()
+        for code in programs:
+            result = executor.run_code(code)
+            assert result["success"], result.get("error")
+            timed_out += result.get("formulas_timed_out", 0)
+        elapsed = (time.perf_counter() - start) / args.runs
+        print(f"{label:>6} {elapsed:>12.4f} {timed_out:>10}")
+    print(f"cached formulas: {len(latex.rendered)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Response size and JSON parse time of the "full" and "table" state formats.
+
+Runs a loop that keeps an array alive while a couple of scalars change, so
+most of every state is unchanged from the step before. Reports the size of
+the /execute payload in each format and how long json.loads takes on it,
+which stands in for the browser's JSON.parse.
+
+    python benchmarks/bench_payload.py
+    python benchmarks/bench_payload.py --iters 5000 --size 100
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import executor
+
+PROGRAM = """
+data = list(range({size}))
+s = 0
+for i in range({iters}):
+    s += data[i % {size}]
+"""
+
+def parse_time(payload, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        json.loads(payload)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iters", type=int, default=2000)
+    parser.add_argument("--size", type=int, default=30, help="elements of the array kept alive")
+    args = parser.parse_args()
+
+    code = PROGRAM.format(iters=args.iters, size=args.size)
+    print(f"{'format':<8} {'steps':>7} {'KB':>9} {'parse ms':>9}")
+    for state_format in ("full", "table"):
+        result = executor.run_code(code, state_format=state_format)
+        payload = json.dumps(result, separators=(",", ":"))
+        print(f"{state_format:<8} {len(result['steps']):>7} {len(payload) / 1024:>9.0f} {parse_time(payload) * 1000:>9.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+run_code latency with serialization overlapped with the traced run, against
+the same phases run one after another.
+
+"python" is a pure Python loop, the serializer thread and the traced thread
+take turns on the GIL. "numpy" multiplies matrices in every iteration, numpy
+releases the GIL inside the kernel and the serializer works meanwhile. The
+phase timings are the ones run_code reports, "serialize" being what was left
+once the program stopped. The worker thread is off on a single core, force
+it with DHRISTI_SERIALIZE_THREAD=1.
+
+    python benchmarks/bench_pipeline.py
+    python benchmarks/bench_pipeline.py --iterations 2000 --size 300
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy
+
+import executor
+from analysis import analyze
+
+PROGRAMS = {
+    "python": """
+total = 0
+values = []
+for i in range({iterations}):
+    total += i * i
+    values.append(total % 7)
+""",
+    "numpy": """
+import numpy as np
+a = np.ones(({size}, {size})) / {size}
+b = np.eye({size})
+for i in range({iterations}):
+    b = a @ b
+    trace = float(b[0, 0])
+""",
+}
+
+def sequential(code):
+    # analysis, run, serialization, each waiting for the one before
+    start = time.perf_counter()
+    analysis = analyze(code)
+    session = executor.new_session(analysis, False, 3, 3, None, None)
+    compiled, sandbox_globals = executor.prepare_sandbox(code, analysis)
+    executor.execute_traced(session, compiled, sandbox_globals)
+    serializer = executor.StepSerializer(session, code, analysis["formulas"])
+    serializer.steps(len(session.execution_log))
+    serializer.calls(final=True)
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--size", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'program':>8} {'sequential':>11} {'pipelined':>10} {'execute':>8} {'serialize':>10} {'background':>11}")
+    for name, source in PROGRAMS.items():
+        code = source.format(iterations=args.iterations, size=args.size)
+        executor.run_code(code)
+
+        before = min(sequential(code) for _ in range(args.repeat))
+        runs = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            result = executor.run_code(code)
+            assert result["success"], result.get("error")
+            runs.append((time.perf_counter() - start, result["timings"]))
+        elapsed, timings = min(runs, key=lambda run: run[0])
+        print(
+            f"{name:>8} {before:>11.3f} {elapsed:>10.3f} {timings['execute']:>8.3f} "
+            f"{timings['serialize']:>10.3f} {timings['serialize_background']:>11.3f}"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Import cost of the backend modules and time to a first /health answer.
+
+Every measurement runs in a fresh interpreter. Import times come from
+`python -X importtime` (cumulative, so a module includes everything it pulls
+in) along with the heaviest modules each one drags along. The /health figure
+covers importing app.py and answering one request through Flask's test
+client, with the worker pool disabled.
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --modules app executor --top 5
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ["app", "pool", "cache", "executor", "tracer", "analysis", "serializer", "imports", "numpy", "torch", "sympy"]
+
+HEALTH = """
+import time
+start = time.perf_counter()
+import app
+response = app.app.test_client().get("/health")
+assert response.status_code == 200
+print(time.perf_counter() - start)
+"""
+
+def import_times(module):
+    # (cumulative us of module, [(cumulative us, name), ...] of its direct imports)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND, capture_output=True, text=True
+    )
+    rows = [] # (nesting level, cumulative us, name) in the order imports finished
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        try:
+            us = int(cumulative)
+        except ValueError:
+            continue # header row
+        name = name[1:] # separator space
+        rows.append(((len(name) - len(name.lstrip())) // 2, us, name.strip()))
+
+    # a module's imports are listed right before it, one level deeper
+    for i, (level, us, name) in enumerate(rows):
+        if level == 0 and name == module:
+            deps = []
+            for dep_level, dep_us, dep_name in reversed(rows[:i]):
+                if dep_level == 0:
+                    break
+                if dep_level == 1:
+                    deps.append((dep_us, dep_name))
+            return us, sorted(deps, reverse=True)
+    return 0, []
+
+def health_time():
+    env = dict(os.environ, DHRISTI_WORKERS="0")
+    proc = subprocess.run([sys.executable, "-c", HEALTH], cwd=BACKEND, capture_output=True, text=True, env=env)
+    return float(proc.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modules", nargs="+", default=MODULES)
+    parser.add_argument("--top", type=int, default=3, help="heaviest dependencies listed per module")
+    args = parser.parse_args()
+
+    print(f"{'module':<12} {'import ms':>10}  heaviest dependencies")
+    for module in args.modules:
+        total, deps = import_times(module)
+        heaviest = ", ".join(f"{name} {us / 1000:.0f}" for us, name in deps[:args.top])
+        print(f"{module:<12} {total / 1000:>10.1f}  {heaviest}")
+
+    print(f"\nimport app + first /health: {health_time() * 1000:.0f} ms")
+
+if __name__ == "__main__":
+    main()
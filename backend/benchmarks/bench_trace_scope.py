@@ -0,0 +1,62 @@
+"""
+Run time and trace size with trace_scope "all" and "visualized".
+
+Runs a small dense network written by hand, whose forward pass goes through
+the user's own dot() and sigmoid() once per neuron per sample. With
+"visualized" the call graph marks those (and forward()) as helpers and they
+run untraced, the training loop itself is still traced line by line.
+
+    python benchmarks/bench_trace_scope.py
+    python benchmarks/bench_trace_scope.py --samples 500 --width 32
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import executor
+from analysis import analyze
+
+PROGRAM = """
+import math
+
+def dot(a, b):
+    return sum(x * y for x, y in zip(a, b))
+
+def sigmoid(z):
+    return 1 / (1 + math.exp(-z))
+
+def forward(W, b, x):
+    return [sigmoid(dot(w, x) + bias) for w, bias in zip(W, b)]
+
+W = [[0.01 * (i - j) for j in range({width})] for i in range({width})]
+b = [0.0] * {width}
+total = 0.0
+for k in range({samples}):
+    x = [k * 0.001] * {width}
+    out = forward(W, b, x)
+    total += out[0]
+"""
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", type=int, default=100)
+    parser.add_argument("--width", type=int, default=16)
+    args = parser.parse_args()
+
+    code = PROGRAM.format(samples=args.samples, width=args.width)
+    helpers = [h["name"] for h in analyze(code, ("call_graph",))["call_graph"]["helpers"]]
+    print(f"helpers: {', '.join(helpers) or '-'}")
+
+    print(f"{'scope':>10} {'steps':>8} {'seconds':>9}")
+    for scope in ("all", "visualized"):
+        start = time.perf_counter()
+        result = executor.run_code(code, trace_scope=scope)
+        elapsed = time.perf_counter() - start
+        assert result["success"], result.get("error")
+        print(f"{scope:>10} {len(result['steps']):>8} {elapsed:>9.3f}")
+
+if __name__ == "__main__":
+    main()
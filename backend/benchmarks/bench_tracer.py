@@ -0,0 +1,68 @@
+"""
+Per-step tracing cost as the trace grows.
+
+Runs a program with deep recursion inside a loop (lots of interleaved
+frames with entries waiting for their "after" state) at increasing step
+counts and reports the cost per step. Only tracing is timed, not
+serialization. The per-step figure should stay flat across sizes.
+
+    python benchmarks/bench_tracer.py
+    python benchmarks/bench_tracer.py --sizes 1000 10000 100000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tracer
+
+PROGRAM = """
+def down(n):
+    if n == 0:
+        return 0
+    return down(n - 1) + 1
+
+total = 0
+for i in range({iters}):
+    total += down({depth})
+"""
+
+def trace(iters, depth):
+    code = PROGRAM.format(iters=iters, depth=depth)
+    compiled = compile(code, "<user_code>", "exec")
+    sandbox_globals = {"__name__": "__main__"}
+
+    session = tracer.TraceSession()
+    start = time.perf_counter()
+    session.start(compiled)
+    try:
+        exec(compiled, sandbox_globals, sandbox_globals)
+    finally:
+        session.stop()
+    session.close_all_entries(sandbox_globals)
+    elapsed = time.perf_counter() - start
+
+    return len(session.execution_log), elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--depth", type=int, default=50)
+    args = parser.parse_args()
+
+    # calibrate how many steps one loop iteration produces
+    one, _ = trace(1, args.depth)
+    two, _ = trace(2, args.depth)
+    per_iter = two - one
+
+    print(f"backend: {'sys.monitoring' if tracer.USE_MONITORING else 'sys.settrace'}")
+    print(f"{'target':>10} {'steps':>10} {'seconds':>9} {'us/step':>9}")
+    for size in args.sizes:
+        iters = max(1, size // per_iter)
+        steps, elapsed = trace(iters, args.depth)
+        print(f"{size:>10} {steps:>10} {elapsed:>9.3f} {elapsed / steps * 1e6:>9.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import os
+import sys
+import time
+
+# Server-wide ceilings. A request may ask for less, never for more.
+MAX_SECONDS = float(os.environ.get("DHRISTI_MAX_SECONDS", 20)) # wall time of the traced program
+MAX_STEPS = int(os.environ.get("DHRISTI_MAX_STEPS", 200_000)) # traced events
+MAX_SNAPSHOT_MB = float(os.environ.get("DHRISTI_MAX_SNAPSHOT_MB", 256)) # copied variable states
+MAX_RSS_MB = float(os.environ.get("DHRISTI_MAX_RSS_MB", 2048)) # resident memory of the process
+
+# limits a request can set, keyword arguments of Budget
+BUDGET_FIELDS = ("seconds", "steps", "snapshot_mb", "rss_mb")
+
+# reading RSS is a syscall, only look every this many steps
+RSS_CHECK_INTERVAL = 1024
+
+MB = 1024 * 1024
+
+
+class BudgetExceeded(BaseException):
+    # BaseException so user code catching Exception can't swallow it
+    def __init__(self, reason, limit):
+        super().__init__(f"{reason} budget of {limit:g} exceeded")
+        self.reason = reason
+        self.limit = limit
+
+
+def rss_bytes():
+    # current resident set size, peak RSS where /proc is unavailable
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        return 0
+
+
+def clamp(requested, ceiling):
+    if requested is None:
+        return ceiling
+    return max(0, min(float(requested), ceiling))
+
+
+class Budget:
+    """
+    Limits of one traced run. check() is called by the tracer on every call
+    and line event and raises BudgetExceeded once any limit is passed.
+    """
+
+    def __init__(self, seconds=None, steps=None, snapshot_mb=None, rss_mb=None):
+        self.seconds = clamp(seconds, MAX_SECONDS)
+        self.steps = int(clamp(steps, MAX_STEPS))
+        self.snapshot_bytes = clamp(snapshot_mb, MAX_SNAPSHOT_MB) * MB
+        self.rss_bytes = clamp(rss_mb, MAX_RSS_MB) * MB
+        self.deadline = None
+        self.next_rss_check = 0
+        self.cancelled = False
+
+    def start(self):
+        self.deadline = time.monotonic() + self.seconds
+        self.next_rss_check = 0
+
+    def cancel(self):
+        # stops the run at its next step, e.g. when the client disconnected
+        self.cancelled = True
+
+    def check(self, steps, snapshot_bytes):
+        if self.cancelled:
+            raise BudgetExceeded("cancelled", 0)
+        if steps >= self.steps:
+            raise BudgetExceeded("steps", self.steps)
+        if time.monotonic() > self.deadline:
+            raise BudgetExceeded("seconds", self.seconds)
+        if snapshot_bytes > self.snapshot_bytes:
+            raise BudgetExceeded("snapshot_mb", self.snapshot_bytes / MB)
+        if steps >= self.next_rss_check:
+            self.next_rss_check = steps + RSS_CHECK_INTERVAL
+            if rss_bytes() > self.rss_bytes:
+                raise BudgetExceeded("rss_mb", self.rss_bytes / MB)
@@ -0,0 +1,178 @@
+import os
+import ast
+import json
+import sys
+import hashlib
+import threading
+from collections import OrderedDict
+
+import pool
+
+# Results of earlier runs, keyed by the program and the options it ran with.
+# The memory tier is an LRU bounded in bytes, the optional disk tier keeps
+# results across restarts.
+CACHE_MB = float(os.environ.get("DHRISTI_CACHE_MB", 128)) # 0 disables caching
+CACHE_DIR = os.environ.get("DHRISTI_CACHE_DIR") or None # unset keeps the cache in memory only
+
+# bump when the shape of run_code's result changes, old entries stop matching
+CACHE_VERSION = 1
+
+# a single result may take at most this share of the memory tier
+MAX_ENTRY_SHARE = 0.25
+
+# reading any of these makes a program's trace depend on more than its source
+NONDETERMINISTIC_MODULES = {
+    "random", "time", "datetime", "secrets", "uuid", "os", "sys",
+    "threading", "multiprocessing", "subprocess", "socket", "urllib", "requests"
+}
+NONDETERMINISTIC_CALLS = {"hash", "id", "input", "open"} # hash() of str/bytes is salted per process
+RANDOM_ATTRS = {"seed", "shuffle", "permutation", "choice", "normal", "uniform", "bernoulli", "multinomial", "poisson"}
+
+# budgets that stop a run at a point that varies between runs
+UNSTABLE_TRUNCATION = {"seconds", "rss_mb", "cancelled"}
+
+# stands in for the hash seed of runs in this process when it is random, the
+# disk tier then never serves them to another process
+PROCESS_TOKEN = f"{os.getpid()}-{os.urandom(8).hex()}"
+
+
+def is_deterministic(code):
+    # static check: anything touching randomness, clocks, the environment or
+    # object identity is never cached
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return True
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            if any(alias.name.split(".")[0] in NONDETERMINISTIC_MODULES for alias in node.names):
+                return False
+        elif isinstance(node, ast.ImportFrom):
+            if (node.module or "").split(".")[0] in NONDETERMINISTIC_MODULES:
+                return False
+        elif isinstance(node, ast.Name):
+            # the sandbox pre-imports random and datetime, so a bare name is enough
+            if node.id in NONDETERMINISTIC_MODULES:
+                return False
+        elif isinstance(node, ast.Call):
+            if isinstance(node.func, ast.Name) and node.func.id in NONDETERMINISTIC_CALLS:
+                return False
+        elif isinstance(node, ast.Attribute):
+            # np.random.*, torch.rand / randn / randint / randperm, ...
+            if "rand" in node.attr or node.attr in RANDOM_ATTRS:
+                return False
+    return True
+
+
+def cache_key(options):
+    # None when the run must not be cached. The key covers the source, which
+    # also fixes its __future__ flags, and every option that changes the trace.
+    if CACHE_MB <= 0 or options.get("trace_modules"):
+        # allow-listed modules are read from disk, their source isn't in the key
+        return None
+    if not is_deterministic(options["code"]):
+        return None
+
+    keyed = {
+        "version": CACHE_VERSION,
+        "python": sys.version_info[:2],
+        # the iteration order of a set of strings depends on it
+        "hash_seed": pool.hash_seed() or PROCESS_TOKEN,
+        "options": options
+    }
+    return hashlib.sha256(json.dumps(keyed, sort_keys=True).encode()).hexdigest()
+
+
+def is_cacheable(result):
+    if not result.get("success"):
+        return False
+    if result.get("formulas_timed_out"):
+        # a later run gets their LaTeX from the latex module's cache
+        return False
+    truncated = result.get("truncated")
+    return truncated is None or truncated["reason"] not in UNSTABLE_TRUNCATION
+
+
+class ResultCache:
+    """
+    Serialized run_code results by cache key. Entries are kept as JSON bytes,
+    so their size is exact and a hit can be sent without serializing again.
+    """
+
+    def __init__(self, max_bytes, directory=None):
+        self.max_bytes = max_bytes
+        self.max_entry = max_bytes * MAX_ENTRY_SHARE
+        self.directory = directory
+        self.entries = OrderedDict() # key -> payload, least recently used first
+        self.nbytes = 0
+        self.lock = threading.Lock()
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def get(self, key):
+        with self.lock:
+            payload = self.entries.get(key)
+            if payload is not None:
+                self.entries.move_to_end(key)
+                return payload
+
+        if not self.directory:
+            return None
+        try:
+            with open(self.path(key), "rb") as f:
+                payload = f.read()
+        except OSError:
+            return None
+
+        self.remember(key, payload)
+        return payload
+
+    def remember(self, key, payload):
+        if len(payload) > self.max_entry:
+            return
+        with self.lock:
+            if key in self.entries:
+                return
+            self.entries[key] = payload
+            self.nbytes += len(payload)
+            while self.nbytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.nbytes -= len(evicted)
+
+    def put(self, key, payload):
+        self.remember(key, payload)
+        if not self.directory:
+            return
+
+        # write to a temporary file first so readers never see half a result
+        path = self.path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(payload)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+
+results = ResultCache(CACHE_MB * 1024 * 1024, CACHE_DIR)
+
+def lookup(key):
+    return results.get(key) if key is not None else None
+
+def store(key, result):
+    # returns the stored payload, None when the result wasn't cached
+    if key is None or not is_cacheable(result):
+        return None
+    try:
+        payload = json.dumps(result, separators=(",", ":")).encode()
+    except (TypeError, ValueError):
+        return None
+    results.put(key, payload)
+    return payload
@@ -0,0 +1,224 @@
+import ast
+
+from ast_utils import Detector
+
+# method calls that change the object they are called on. Names ending in a
+# single "_" are torch / numpy-style in-place ops (add_, mul_, zero_, ...).
+MUTATING_METHODS = {
+    "append", "extend", "insert", "pop", "remove", "clear", "update", "add",
+    "discard", "setdefault", "popitem", "sort", "reverse", "fill", "resize",
+    "put", "itemset", "appendleft", "popleft", "extendleft", "rotate"
+}
+
+FUNCTION_TYPES = (ast.FunctionDef, ast.AsyncFunctionDef)
+LOOP_TYPES = (ast.For, ast.AsyncFor, ast.While, ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)
+
+
+def base_name(node):
+    # x for x[i].attr[j], None when the chain doesn't start at a name
+    while isinstance(node, (ast.Subscript, ast.Attribute)):
+        node = node.value
+    return node.id if isinstance(node, ast.Name) else None
+
+
+def strongly_connected(graph):
+    # Tarjan's algorithm, iterative so deep call chains don't hit the recursion limit
+    index, low, on_stack = {}, {}, set()
+    stack, components = [], []
+    for root in graph:
+        if root in index:
+            continue
+        work = [(root, iter(graph[root]))]
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        while work:
+            node, edges = work[-1]
+            for succ in edges:
+                if succ not in index:
+                    index[succ] = low[succ] = len(index)
+                    stack.append(succ)
+                    on_stack.add(succ)
+                    work.append((succ, iter(graph[succ])))
+                    break
+                if succ in on_stack:
+                    low[node] = min(low[node], index[succ])
+            else:
+                work.pop()
+                if work:
+                    low[work[-1][0]] = min(low[work[-1][0]], low[node])
+                if low[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(component)
+    return components
+
+
+class CallGraphDetector(Detector):
+    """
+    Static call graph of the user's functions, by name (obj.f() counts as a
+    call of every function named f), and which of them a visualization needs
+    traced:
+
+    - functions in a cycle of the graph (direct or mutual recursion)
+    - functions that change state their caller can see: global / nonlocal
+      declarations, stores into or mutating methods on a parameter or a
+      global
+    - functions called from module level outside a loop, the program's
+      entry points
+    - every function that can reach one of the first two
+
+    The rest are "helpers", like a user's own dot() or sigmoid(), whose work
+    shows up in the line that called them. Their first line matches the
+    co_firstlineno of their code object.
+    """
+
+    name = "call_graph"
+    # only trace_scope "visualized" uses it
+    optional = True
+    node_types = (
+        *FUNCTION_TYPES, *LOOP_TYPES, ast.Call, ast.Global, ast.Nonlocal,
+        ast.Name, ast.Subscript, ast.Attribute, ast.AugAssign
+    )
+
+    def begin(self, tree):
+        self.functions = []
+        self.loops = []
+        self.calls = [] # (call node, called name)
+        self.declarations = [] # global / nonlocal statements
+        self.stores = [] # (node, name) of local names bound
+        self.mutations = [] # (node, base name) of objects changed in place
+
+    def visit(self, node):
+        if isinstance(node, FUNCTION_TYPES):
+            self.functions.append(node)
+        elif isinstance(node, LOOP_TYPES):
+            self.loops.append(node)
+        elif isinstance(node, ast.Call):
+            func = node.func
+            if isinstance(func, ast.Name):
+                self.calls.append((node, func.id))
+            elif isinstance(func, ast.Attribute):
+                self.calls.append((node, func.attr))
+                attr = func.attr
+                if attr in MUTATING_METHODS or (attr.endswith("_") and not attr.startswith("_")):
+                    self.mutations.append((node, base_name(func.value)))
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            self.declarations.append(node)
+        elif isinstance(node, ast.Name):
+            if isinstance(node.ctx, ast.Store):
+                self.stores.append((node, node.id))
+        elif isinstance(node, (ast.Subscript, ast.Attribute)):
+            if isinstance(node.ctx, (ast.Store, ast.Del)):
+                self.mutations.append((node, base_name(node.value)))
+        elif isinstance(node, ast.AugAssign):
+            # x += ... on a parameter changes an array or list in place
+            if isinstance(node.target, ast.Name):
+                self.mutations.append((node, node.target.id))
+
+    def scopes(self):
+        """
+        Innermost function around each call, store, mutation and declaration
+        (None at module level) and whether a loop or comprehension of that
+        same function is around it too, by id(node). One sweep over source
+        positions with a stack of the open functions and loops: nodes nest
+        the way their (start, end) positions do, as recursion_detector.contains
+        compares them.
+        """
+        def start(node):
+            return (node.lineno, node.col_offset)
+
+        def end(node):
+            return (node.end_lineno, node.end_col_offset)
+
+        queries = [node for node, _ in self.calls] + [node for node, _ in self.stores]
+        queries += [node for node, _ in self.mutations] + self.declarations
+        # functions and loops before the nodes starting where they do, outer ones first
+        events = [(start(node), 0, tuple(-n for n in end(node)), i, node) for i, node in enumerate(self.functions + self.loops)]
+        events += [(start(node), 1, (), i, node) for i, node in enumerate(queries)]
+        events.sort(key=lambda event: event[:4])
+
+        functions = set(map(id, self.functions))
+        scopes = {}
+        stack = [((float("inf"),), None, 0)] # (end, scope, loops open inside scope)
+        for position, kind, _, _, node in events:
+            while stack[-1][0] <= position:
+                stack.pop()
+            _, scope, loops = stack[-1]
+            if kind == 1:
+                scopes[id(node)] = (scope, loops > 0)
+            elif id(node) in functions:
+                stack.append((end(node), node, 0))
+            else:
+                stack.append((end(node), scope, loops + 1))
+        return scopes
+
+    def result(self):
+        names = {func.name for func in self.functions}
+        graph = {name: set() for name in names}
+        scopes = self.scopes()
+        entries = set()
+        for node, called in self.calls:
+            if called not in names:
+                continue
+            scope, in_loop = scopes[id(node)]
+            if scope is not None:
+                graph[scope.name].add(called)
+            elif not in_loop:
+                entries.add(called)
+
+        local_names = {} # function -> names it binds itself
+        for node, name in self.stores:
+            scope = scopes[id(node)][0]
+            if scope is not None:
+                local_names.setdefault(scope, set()).add(name)
+
+        seeds = {scopes[id(node)][0].name for node in self.declarations if scopes[id(node)][0] is not None}
+        for node, name in self.mutations:
+            scope = scopes[id(node)][0]
+            if scope is None or name is None:
+                continue
+            args = scope.args
+            params = {a.arg for a in (*args.posonlyargs, *args.args, *args.kwonlyargs, args.vararg, args.kwarg) if a}
+            if name in params or name not in local_names.get(scope, ()):
+                seeds.add(scope.name)
+
+        recursive = [
+            sorted(component)
+            for component in strongly_connected({name: sorted(callees) for name, callees in graph.items()})
+            if len(component) > 1 or component[0] in graph[component[0]]
+        ]
+        seeds.update(name for component in recursive for name in component)
+
+        # everything that can reach a seed, walking the graph backwards
+        callers = {name: set() for name in names}
+        for name, callees in graph.items():
+            for called in callees:
+                callers[called].add(name)
+        traced = set(seeds)
+        pending = list(seeds)
+        while pending:
+            for caller in callers[pending.pop()]:
+                if caller not in traced:
+                    traced.add(caller)
+                    pending.append(caller)
+        traced |= entries
+
+        helpers = [
+            {
+                "name": func.name,
+                "lineno": min([func.lineno] + [d.lineno for d in func.decorator_list])
+            }
+            for func in self.functions
+            if func.name not in traced
+        ]
+        return {
+            "calls": {name: sorted(callees) for name, callees in sorted(graph.items())},
+            "recursive": recursive,
+            "helpers": sorted(helpers, key=lambda h: h["lineno"])
+        }
@@ -0,0 +1,104 @@
+import os
+from collections import deque
+
+# levels below the expanded call sent per response, and at most this many
+# call entries in it, what is left is fetched with /calls
+CALL_TREE_DEPTH = int(os.environ.get("DHRISTI_CALL_TREE_DEPTH", 4))
+CALL_TREE_NODES = int(os.environ.get("DHRISTI_CALL_TREE_NODES", 200))
+
+
+class CallIndex:
+    """
+    Parent / child index over a session's call_tree (which is in call order,
+    every parent before its children), with calls keyed the way memoization
+    would key them: by function name and serialized arguments.
+
+    The first call with a key is canonical, later ones are repeats of it and
+    their subtrees aren't walked unless expanded. Sibling calls with the same
+    key form one entry with a count, so fib(20) is a few dozen entries
+    instead of 22k nodes.
+    """
+
+    def __init__(self, calls, signature):
+        self.calls = {}
+        self.children = {} # parent call_id -> child call_ids in call order
+        self.signatures = {}
+        self.canonical = {} # signature -> first call_id with it
+        self.repeats = {} # signature -> number of calls with it
+        for c in calls:
+            call_id = c["call_id"]
+            sig = signature(c)
+            self.calls[call_id] = c
+            self.children.setdefault(c["parent_id"], []).append(call_id)
+            self.signatures[call_id] = sig
+            self.canonical.setdefault(sig, call_id)
+            self.repeats[sig] = self.repeats.get(sig, 0) + 1
+
+        # calls in each subtree, children come after their parent
+        self.sizes = dict.fromkeys(self.calls, 1)
+        for c in reversed(calls):
+            parent = c["parent_id"]
+            if parent in self.sizes:
+                self.sizes[parent] += self.sizes[c["call_id"]]
+
+    def groups(self, call_id):
+        # [first call_id, count] per distinct child key, in call order
+        grouped = {}
+        for child in self.children.get(call_id, ()):
+            group = grouped.get(self.signatures[child])
+            if group is None:
+                grouped[self.signatures[child]] = [child, 1]
+            else:
+                group[1] += 1
+        return list(grouped.values())
+
+    def entry(self, call_id, count, encode):
+        sig = self.signatures[call_id]
+        entry = encode(self.calls[call_id])
+        entry["calls"] = self.sizes[call_id]
+        if count > 1:
+            entry["count"] = count
+        if self.repeats[sig] > 1:
+            entry["repeats"] = self.repeats[sig]
+        if self.canonical[sig] != call_id:
+            entry["repeat_of"] = self.canonical[sig]
+        return entry
+
+    def expand(self, encode, call_id=None, offset=0, depth=CALL_TREE_DEPTH, max_nodes=CALL_TREE_NODES):
+        """
+        Entries for the calls below call_id (below the top when None),
+        breadth first, skipping its first offset child groups. An entry
+        whose child groups were not all sent has "hidden" set to how many
+        are missing, "hidden" of the response is the same for call_id.
+        encode turns a call_tree node into its JSON-safe entry.
+        """
+        entries = []
+        hidden = 0
+        queue = deque([(call_id, 0, None)])
+        while queue:
+            parent, level, parent_entry = queue.popleft()
+            groups = self.groups(parent)
+            if parent_entry is None:
+                groups = groups[offset:]
+
+            shown = 0
+            for child, count in groups:
+                if level >= depth or len(entries) >= max_nodes:
+                    break
+                entry = self.entry(child, count, encode)
+                entries.append(entry)
+                shown += 1
+                if "repeat_of" in entry:
+                    # a repeat's own calls are only sent when it is expanded
+                    rest = len(self.groups(child))
+                    if rest:
+                        entry["hidden"] = rest
+                else:
+                    queue.append((child, level + 1, entry))
+
+            rest = len(groups) - shown
+            if rest and parent_entry is None:
+                hidden = rest
+            elif rest:
+                parent_entry["hidden"] = rest
+        return {"calls": entries, "hidden": hidden}
@@ -1,216 +1,628 @@
+import os
 import sys
+import json
 import math
-import numpy as np
-import torch
-import sympy as sp
+import time
 import traceback
-import types
+import queue
+import threading
+from itertools import islice
 
 import tracer
-from ast_utils import find_candidate_expressions, get_future_flags
-from serializer import safe_json
-from nn_extractor import extract_sequential_models, extract_manual_dense_layers, extract_weight_stack_dense
-from recursion_detector import extract_recursive_function
+from budgets import Budget, BudgetExceeded
+from steplog import EVENTS, FOLD, FOLDED
+from analysis import analyze
+from serializer import safe_json, BINARY_MAX_ELEMENTS
+from array_summary import THUMBNAIL_SIZE, NUMERIC_KINDS, as_grid, pool_grid, to_array
+from nn_introspect import ActivationRecorder, fill_dense_models, runtime_models
+from call_tree import CallIndex
+from latex import render_formulas, fill_formulas
 from imports import STDLIB_MODULES
+from cache import UNSTABLE_TRUNCATION
+from lazy import lazy_module
 
-printed_output = []
+# sandbox globals, imported the first time a program touches them
+np = lazy_module("numpy")
+torch = lazy_module("torch")
+sp = lazy_module("sympy")
+
+# stdout lines from folded loop iterations kept on the fold record
+FOLD_STDOUT_LINES = 10
+
+# traced lines between two streamed batches
+STREAM_BATCH = 200
+# batches the tracer may run ahead of a slow client before it waits
+STREAM_QUEUE = 8
+
+# optional detectors (analysis.analyze) a trace_scope needs
+SCOPE_DETECTORS = {"visualized": ("call_graph",)}
+
+# run_code serializes the trace on a worker thread while the program runs.
+# With a single core that only adds switching, so it is off there by default.
+SERIALIZE_THREAD = int(os.environ.get("DHRISTI_SERIALIZE_THREAD", int((os.cpu_count() or 1) > 1))) # 0 serializes after the run
 
 def traced_print(*args, **kwargs):
     text = " ".join(str(a) for a in args)
 
-    lineno = tracer.current_lineno
+    session = tracer.current_session()
+    # nothing is recorded once a budget stopped the run
+    lineno = session.current_lineno if session is not None and session.tripped is None else None
 
     if lineno is not None:
         # Store with execution index (how many line events we've seen)
-        printed_output.append({
+        session.printed_output.append({
             "lineno": lineno,
             "text": text,
-            "step_index": len(tracer.execution_log) - 1  # Current step
+            "step_index": len(session.execution_log) - 1  # Current step
         })
 
     sys.__stdout__.write(text + "\n")
 
-def run_code(code):
-    tracer.execution_log.clear()
-    tracer.last_line = None
-    tracer.current_lineno = None
-    tracer.call_stack.clear()
-    tracer.call_counter = 0
-    tracer.call_tree.clear()
-    printed_output.clear()
+def new_session(analysis, fold_loops, fold_head, fold_tail, trace_modules, budget, trace_scope="all"):
+    fold_config = (max(0, fold_head), max(1, fold_tail)) if fold_loops else None
+    # "visualized": the call graph's helper functions run untraced
+    helpers = analysis["call_graph"]["helpers"] if trace_scope == "visualized" else ()
+    return tracer.TraceSession(
+        fold=fold_config,
+        spans=analysis["loop_spans"] if fold_config else None,
+        modules=trace_modules,
+        budget=Budget(**(budget or {})),
+        untraced={(h["name"], h["lineno"]) for h in helpers},
+        catches=analysis["catch_spans"]
+    )
 
+def prepare_sandbox(code, analysis):
+    safe_builtins = dict(__builtins__)
+    safe_builtins["print"] = traced_print
 
-    formula_map = find_candidate_expressions(code)
-    nn_models = []
+    # the tree the analysis already parsed, the source only when it didn't parse
+    source = analysis["tree"] if analysis["tree"] is not None else code
+    compiled = compile(source, "<user_code>", "exec", flags=analysis["future_flags"], dont_inherit=True)
+    sandbox_globals = {
+        "__name__": "__main__",
+        "__builtins__": safe_builtins,
+        #Scientific computing
+        "np": np,
+        "torch": torch,
+        "sp": sp,
+        "math": math,
+        #Standard library
+        **STDLIB_MODULES
+    }
+    return compiled, sandbox_globals
 
-    # Highest confidence: explicit framework models
-    seq = extract_sequential_models(code)
-    if seq:
-        nn_models = seq
+def execute_traced(session, compiled, sandbox_globals, recorder=None):
+    if recorder is not None:
+        recorder.start()
+    session.start(compiled)
+    try:
+        exec(compiled, sandbox_globals, sandbox_globals)
+    except BudgetExceeded:
+        # partial run, everything traced so far is still returned
+        pass
+    finally:
+        session.stop()
+        if recorder is not None:
+            recorder.stop()
 
-    else:
-        # Static weight-stack inference (MULTI-LAYER)
-        stack = extract_weight_stack_dense(code)
-        if stack:
-            nn_models = stack
+        # whatever is still open sees the program's final globals
+        session.close_all_entries(sandbox_globals)
 
-        else:
-            # Heuristic fallback (SINGLE-LAYER)
-            manual = extract_manual_dense_layers(code)
-            if manual:
-                nn_models = manual
+def collect_nn_models(nn_models, sandbox_globals, recorder=None):
+    # live torch models replace the source analysis' nn.Sequential guesses,
+    # which also covers those assigned to self.x inside a Module or in a function
+    fill_dense_models(nn_models, sandbox_globals)
+    live = runtime_models(sandbox_globals, recorder)
+    if not live:
+        return nn_models
+    return live + [m for m in nn_models if m.get("type") != "Sequential"]
 
-    recursive_funcs = extract_recursive_function(code)
 
-    safe_builtins = dict(__builtins__)
-    safe_builtins["print"] = traced_print
+class StepSerializer:
+    """
+    Builds the JSON-safe steps and call-tree nodes of a session, reading
+    straight from the step columns. steps() and calls() only return what is
+    new since the previous call, so a streamed run can serialize its trace in
+    batches while the program is still running.
 
-    try:
-        future_flags = get_future_flags(code)
-        compiled = compile(code, "<user_code>", "exec", flags=future_flags, dont_inherit=True)
-        sandbox_globals = {
-            "__name__": "__main__",
-            "__builtins__": safe_builtins,
-            #Scientific computing
-            "np": np,
-            "torch": torch,
-            "sp": sp,
-            "math": math,
-            #Standard library
-            **STDLIB_MODULES
-        }
+    With state_format "table" a step is the row [event, func, lineno, before,
+    after] with a dict of its stdout, return_value and fold appended when it
+    has any. Code and formula of a line are sent once in the "lines" table.
+    before/after and call arguments are indices into the "states" table,
+    where each state is the snapshot store's delta [parent state index or
+    None, {name: value index}] plus [removed names] if any, and every stored
+    copy is serialized once into the "values" table. tables() returns the
+    entries added since its previous call.
+
+    With array_encoding "binary" numeric arrays and tensors are sent as raw
+    buffers (see serializer.safe_json) and up to BINARY_MAX_ELEMENTS of them
+    are sent in full instead of as a summary.
+
+    With call_tree_format "collapsed" no calls are sent until the run ends,
+    then the top of the call tree comes as call_tree.CallIndex entries.
+    """
+
+    def __init__(self, session, code, formula_map, state_format="full", array_encoding="list", call_tree_format="full"):
+        self.session = session
+        self.code_lines = code.split('\n')
+        self.formula_map = formula_map
+        self.next_step = 0
+        self.printed_seen = 0
+        self.printed_by_step = {}
+        self.fold_stdout = None
+        self.next_call = 0
+        self.pending_calls = [] # calls that had not returned at the last batch
+        # stored snapshot copies are never mutated, so each one (and each
+        # whole state) is serialized once no matter how many steps share it
+        self.memo = {}
+        self.states = {} # snapshot id -> serialized state, or its table index
+        self.state_format = state_format
+        self.binary = array_encoding == "binary"
+        self.max_elements = BINARY_MAX_ELEMENTS if self.binary else 30
+        self.value_index = {} # id(stored copy) -> index in the value table
+        self.new_values = []
+        self.new_states = []
+        self.new_lines = {}
+        self.lines_sent = set()
+        self.call_tree_format = call_tree_format
+        self.call_index = None
+
+    def steps(self, end):
+        session = self.session
+        log = session.execution_log
+        code_lines = self.code_lines
+
+        # Match prints to specific step indices
+        printed_by_step = self.printed_by_step
+        for p in session.printed_output[self.printed_seen:]:
+            printed_by_step.setdefault(p["step_index"], []).append(p["text"])
+        self.printed_seen = len(session.printed_output)
+
+        # Source lines and formulas are shared per line number, not per step.
+        safe_steps = []
+        for idx in range(self.next_step, end):
+            kind = log.kind[idx]
+            printed = printed_by_step.pop(idx, None)
+            if kind == FOLDED:
+                # slot of a folded loop iteration, its output goes to the fold record
+                if self.fold_stdout is not None and printed:
+                    self.fold_stdout[:] = (self.fold_stdout + printed)[-FOLD_STDOUT_LINES:]
+                continue
+
+            event = EVENTS[kind]
+            ln = log.get(log.lineno, idx)
 
-        sys.settrace(tracer.tracer)
-        try:
-            exec(compiled, sandbox_globals, sandbox_globals)
-        finally:
-            sys.settrace(None)
-
-
-            if tracer.execution_log:
-                final_locals = {}
-                for k, v in sandbox_globals.items():
-                    if not k.startswith("__") and not isinstance(v, types.ModuleType):
-                        final_locals[k] = v
-                for entry in reversed(tracer.execution_log):
-                    if entry.get("after") and entry["event"] == "line":
-                        final_locals = entry["after"]
-                        break
-                    elif entry.get("before") and entry["event"] == "line":
-                        final_locals = entry["before"]
-                        break
-                
-                for entry in reversed(tracer.execution_log):
-                    if entry.get("event") == "line" and entry.get("after") is None:
-                        entry["after"] = final_locals
-                        break
-
-        # lines = code.rstrip().split("\n")
-        # last = lines[-1]
-
-        # if last and not last.startswith(("return", "print")):
-        #     lines[-1] = f"__expr_result__ = {last}"
-
-        # code = "\n".join(lines)
-
-        # Add code lines and match prints to specific step indices
-        code_lines = code.split('\n')
-        for idx, step in enumerate(tracer.execution_log):
-            ln = step.get("lineno")
-            if isinstance(ln, int) and 1 <= ln <= len(code_lines):
-                step['code'] = code_lines[ln - 1]
-            else:
-                step['code'] = None
-            
             # Add stdout for THIS specific execution of this line
-            if step.get("event") == "line":
-                step["stdout"] = [
-                    p["text"] 
-                    for p in printed_output 
-                    if p["step_index"] == idx
-                ]
+            if event in ("line", "fold"):
+                stdout = printed or []
             else:
-                step["stdout"] = []
-        '''
-        {
-            "event": "line",
-            "lineno": 5,
-            "before": {...},
-            "after": {...},
-            "stdout": ["Starting execution..."]
-            }
-        '''
+                stdout = []
 
-        # Convert to JSON-safe format
-        safe_steps = []
-        for s in tracer.execution_log:
             ss = {
-                "event": s.get("event"),
-                "func": s.get("func"),
-                "lineno": s.get("lineno"),
-                "code": s.get("code"),
-                "stdout" : s.get("stdout", [])
+                "event": event,
+                "func": log.func_name(idx),
+                "lineno": ln,
+                "code": code_lines[ln - 1] if ln is not None and 1 <= ln <= len(code_lines) else None,
+                "stdout" : stdout
             }
-            
-            # Process before/after states
-            for key in ("before", "after"):
-                if s.get(key) is None:
-                    ss[key] = None
-                else:
-                    ss[key] = {name: safe_json(val) for name, val in s[key].items()}
-            
+
+            # Process before/after states, rebuilt from the snapshot store
+            for key, column in (("before", log.before), ("after", log.after)):
+                snap_id = log.get(column, idx)
+                ss[key] = self.state(snap_id)
+
             # Process return value
-            if "return_value" in s:
-                ss["return_value"] = safe_json(s["return_value"])
-            
+            if idx in log.return_values:
+                ss["return_value"] = self.safe(log.return_values[idx])
+
+            # Summary of the loop iterations folded into this step
+            if kind == FOLD:
+                summary = log.folds[idx]
+                ss["fold"] = {
+                    "iterations": summary["iterations"],
+                    "changed": {
+                        name: {k: self.safe(v) for k, v in stats.items()}
+                        for name, stats in summary["changed"].items()
+                    }
+                }
+                self.fold_stdout = stdout
+
             # Add formula if exists
-            ln = s.get("lineno")
-            if ln and ln in formula_map:
-                ss["formula"] = formula_map[ln]
-            else:
-                ss["formula"] = None
-            
+            ss["formula"] = self.formula_map.get(ln) if ln else None
+
+            if self.state_format == "table":
+                ss = self.row(ss)
             safe_steps.append(ss)
-        
-        for m in nn_models:
-            try:
-                X = sandbox_globals.get(m["input"])
-                W = sandbox_globals.get(m["weights"])
-                b = sandbox_globals.get(m.get("biases"))
-
-                # ---- NUMPY / MATRIX ----
-                if isinstance(W, list) and isinstance(W[0], list):
-                    m["type"] = "manual_dense"
-                    m["input_size"] = len(X)
-                    m["output_size"] = len(W)
-                    m["weights"] = W
-                    m["biases"] = b if isinstance(b, list) else [0]*len(W)
-
-                # ---- SINGLE NEURON ----
-                elif isinstance(W, list):
-                    m["type"] = "manual_dense"
-                    m["input_size"] = len(X)
-                    m["output_size"] = 1
-                    m["weights"] = [W]
-                    m["biases"] = [b] if b is not None else [0]
-
-            except Exception:
-                continue
 
+        self.next_step = max(self.next_step, end)
+        return safe_steps
+
+    def safe(self, value, memo=None):
+        return safe_json(value, self.max_elements, memo, self.binary)
+
+    def state(self, snap_id):
+        if self.state_format == "table":
+            return self.state_ref(snap_id)
+        if snap_id is None:
+            return None
+        safe_state = self.states.get(snap_id)
+        if safe_state is None:
+            memo = self.memo
+            state = self.session.snapshots.resolve(snap_id)
+            safe_state = self.states[snap_id] = {name: self.safe(val, memo) for name, val in state.items()}
+        return safe_state
+
+    def state_ref(self, snap_id):
+        # index in the state table, the parent of a delta gets its index first
+        if snap_id is None:
+            return None
+        index = self.states.get(snap_id)
+        if index is None:
+            parent, changes, removed = self.session.snapshots.delta(snap_id)
+            entry = [self.state_ref(parent), {name: self.value_ref(val) for name, val in changes.items()}]
+            if removed:
+                entry.append(list(removed))
+            index = self.states[snap_id] = len(self.states)
+            self.new_states.append(entry)
+        return index
+
+    def value_ref(self, value):
+        index = self.value_index.get(id(value))
+        if index is None:
+            index = self.value_index[id(value)] = len(self.value_index)
+            self.new_values.append(self.safe(value))
+        return index
+
+    def row(self, ss):
+        ln = ss["lineno"]
+        if ln not in self.lines_sent:
+            self.lines_sent.add(ln)
+            self.new_lines[ln] = {"code": ss["code"], "formula": ss["formula"]}
+
+        row = [ss["event"], ss["func"], ln, ss["before"], ss["after"]]
+        extra = {key: ss[key] for key in ("return_value", "fold") if key in ss}
+        if ss["stdout"] or "fold" in ss:
+            # a fold record's stdout is still filled in by the iterations after it
+            extra["stdout"] = ss["stdout"]
+        if extra:
+            row.append(extra)
+        return row
+
+    def tables(self):
+        values, self.new_values = self.new_values, []
+        states, self.new_states = self.new_states, []
+        lines, self.new_lines = self.new_lines, {}
+        return {"values": values, "states": states, "lines": lines}
 
+    def calls(self, final=False):
+        if self.call_tree_format == "collapsed":
+            return self.expand_calls()["calls"] if final else []
 
+        # a call node is sent once its return value is known
+        session = self.session
+        candidates = self.pending_calls + session.call_tree[self.next_call:]
+        self.next_call = len(session.call_tree)
+
+        if final:
+            ready, self.pending_calls = candidates, []
+        else:
+            live = {c["call_id"] for c in session.call_stack}
+            ready = [c for c in candidates if c["call_id"] not in live]
+            self.pending_calls = [c for c in candidates if c["call_id"] in live]
+
+        return [self.call_node(c) for c in ready]
+
+    def call_node(self, c):
         return {
+            **c,
+            "args" : self.state(c["args"]),
+            "return_value" : self.safe(c["return_value"])
+        }
+
+    def signature(self, c):
+        # what memoization would key the call on, stored copies are
+        # serialized once however many calls share them
+        args = self.session.snapshots.resolve(c["args"]) or {}
+        values = {name: self.safe(value, self.memo) for name, value in args.items()}
+        return c["func"], json.dumps(values, sort_keys=True, default=str)
+
+    def expand_calls(self, call_id=None, offset=0):
+        if self.call_index is None:
+            self.call_index = CallIndex(self.session.call_tree, self.signature)
+        return self.call_index.expand(self.call_node, call_id, offset)
+
+class Timings(dict):
+    # seconds per phase of a run, each measured from the end of the previous one
+    def __init__(self):
+        super().__init__()
+        self.start = self.last = time.perf_counter()
+
+    def lap(self, phase):
+        now = time.perf_counter()
+        self[phase] = round(now - self.last, 6)
+        self.last = now
+
+    def report(self, **extra):
+        return {**self, **extra, "total": round(self.last - self.start, 6)}
+
+
+class SerializerThread:
+    """
+    Runs a StepSerializer's steps() on a worker thread while the program is
+    still being traced. Every STREAM_BATCH traced lines the trace callback
+    hands over session.settled(), rows below it won't change any more, and
+    the worker serializes up to there. It only reads stored snapshot copies,
+    which are never mutated, and the serializer's own state. The worker
+    makes real progress while the traced thread releases the GIL (numpy and
+    torch kernels, I/O, sleeps), with pure Python programs they take turns.
+    Without SERIALIZE_THREAD no thread starts and finish() serializes it all.
+    """
+
+    def __init__(self, serializer):
+        self.serializer = serializer
+        self.bounds = queue.Queue()
+        self.steps = []
+        self.error = None
+        self.busy = 0.0 # seconds spent serializing on the worker
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        if SERIALIZE_THREAD:
+            self.serializer.session.listen(self.cut, STREAM_BATCH)
+            self.thread.start()
+
+    def cut(self):
+        # inside the trace callback, nothing is traced while it runs
+        self.bounds.put(self.serializer.session.settled())
+
+    def run(self):
+        while True:
+            end = self.bounds.get()
+            if end is None:
+                return
+            if self.error is not None:
+                continue
+            start = time.perf_counter()
+            try:
+                self.steps += self.serializer.steps(end)
+            except Exception as e:
+                self.error = e
+            self.busy += time.perf_counter() - start
+
+    def stop(self):
+        if self.thread.is_alive():
+            self.bounds.put(None)
+            self.thread.join()
+
+    def finish(self):
+        # every step, once the program has stopped
+        self.stop()
+        if self.error is not None:
+            raise self.error
+        return self.steps + self.serializer.steps(len(self.serializer.session.execution_log))
+
+def run_code(code, fold_loops=False, fold_head=3, fold_tail=3, trace_modules=None, budget=None, state_format="full", array_encoding="list", capture_activations=False, call_tree_format="full", trace_scope="all"):
+    session = None
+    worker = None
+    try:
+        timings = Timings()
+        # one parse and one tree walk for every static detector
+        analysis = analyze(code, SCOPE_DETECTORS.get(trace_scope, ()))
+        nn_models = analysis["nn_models"]
+        recursive_funcs = analysis["recursive_funcs"]
+        # LaTeX renders on its own threads while the program runs
+        pending_formulas = render_formulas(analysis["formulas"])
+        timings.lap("analysis")
+
+        session = new_session(analysis, fold_loops, fold_head, fold_tail, trace_modules, budget, trace_scope)
+        compiled, sandbox_globals = prepare_sandbox(code, analysis)
+        recorder = ActivationRecorder(session) if capture_activations else None
+        # Convert to JSON-safe format, the settled part of the trace while
+        # the program still runs
+        serializer = StepSerializer(session, code, analysis["formulas"], state_format, array_encoding, call_tree_format)
+        worker = SerializerThread(serializer)
+        worker.start()
+        timings.lap("prepare")
+
+        execute_traced(session, compiled, sandbox_globals, recorder)
+        timings.lap("execute")
+
+        safe_steps = worker.finish()
+        call_tree = serializer.calls(final=True)
+        tables = serializer.tables() if state_format == "table" else {}
+        timings.lap("serialize")
+
+        formulas_timed_out = fill_formulas(pending_formulas)
+        timings.lap("formulas")
+
+        nn_models = collect_nn_models(nn_models, sandbox_globals, recorder)
+        timings.lap("nn_models")
+
+        result = {
             "success": True, 
             "steps": safe_steps, 
             "nn_models" : nn_models,
-            "call_tree" : tracer.call_tree,
-            "recursive_funcs" : recursive_funcs
+            "call_tree" : call_tree,
+            "recursive_funcs" : recursive_funcs,
+            "truncated" : session.truncated,
+            # "serialize" is what was left once the program stopped
+            "timings" : timings.report(serialize_background=round(worker.busy, 6))
         }
+        result.update(tables)
+        if formulas_timed_out:
+            # sent without LaTeX this time, see cache.is_cacheable
+            result["formulas_timed_out"] = formulas_timed_out
+        return result
 
     except Exception as e:
-        sys.settrace(None)
+        if session is not None:
+            session.stop()
+        if worker is not None:
+            worker.stop()
         return {
             "success": False, 
             "error": str(e),
             "traceback": traceback.format_exc()
-        }
\ No newline at end of file
+        }
+
+def run_code_tile(code, step, name, state="after", rows=None, cols=None, fold_loops=False, fold_head=3, fold_tail=3, trace_modules=None, budget=None, trace_scope="all"):
+    """
+    Runs the program again and returns a window of one array variable at one
+    step, pooled to at most THUMBNAIL_SIZE cells a side (see
+    array_summary.pool_grid). step indexes the steps run_code returns with
+    the same options, rows / cols are [start, stop) of the array's 2-D grid.
+    Only meaningful for deterministic programs, /tile refuses the others.
+    """
+    session = None
+    try:
+        analysis = analyze(code, SCOPE_DETECTORS.get(trace_scope, ()))
+        session = new_session(analysis, fold_loops, fold_head, fold_tail, trace_modules, budget, trace_scope)
+        compiled, sandbox_globals = prepare_sandbox(code, analysis)
+        execute_traced(session, compiled, sandbox_globals)
+        if session.truncated is not None and session.truncated["reason"] in UNSTABLE_TRUNCATION:
+            # stopped at a point that varies between runs, its steps don't line up
+            return {"success": False, "error": f"Run stopped by its {session.truncated['reason']} budget", "traceback": ""}
+
+        # folded iterations have no step of their own
+        log = session.execution_log
+        idx = next(islice(log.live_indices(), step, None), None) if step >= 0 else None
+        if idx is None:
+            return {"success": False, "error": f"No step {step}", "traceback": ""}
+
+        column = log.before if state == "before" else log.after
+        variables = session.snapshots.resolve(log.get(column, idx)) or {}
+        array = to_array(variables.get(name))
+        if array is None or array.dtype.kind not in NUMERIC_KINDS:
+            return {"success": False, "error": f"{name} is not a numeric array at step {step}", "traceback": ""}
+
+        return {
+            "success": True,
+            "tile": pool_grid(as_grid(array), THUMBNAIL_SIZE, rows, cols)
+        }
+
+    except Exception as e:
+        if session is not None:
+            session.stop()
+        return {
+            "success": False, 
+            "error": str(e),
+            "traceback": traceback.format_exc()
+        }
+
+def run_code_calls(code, call_id, offset=0, fold_loops=False, fold_head=3, fold_tail=3, trace_modules=None, budget=None, trace_scope="all"):
+    """
+    Runs the program again and returns the collapsed call tree below one
+    call of run_code's trace: {"calls": [...], "hidden": n} as described in
+    call_tree.CallIndex.expand, with full argument dicts. Like
+    run_code_tile only meaningful for deterministic programs.
+    """
+    session = None
+    try:
+        analysis = analyze(code, SCOPE_DETECTORS.get(trace_scope, ()))
+        session = new_session(analysis, fold_loops, fold_head, fold_tail, trace_modules, budget, trace_scope)
+        compiled, sandbox_globals = prepare_sandbox(code, analysis)
+        execute_traced(session, compiled, sandbox_globals)
+        if session.truncated is not None and session.truncated["reason"] in UNSTABLE_TRUNCATION:
+            # stopped at a point that varies between runs, its calls don't line up
+            return {"success": False, "error": f"Run stopped by its {session.truncated['reason']} budget", "traceback": ""}
+
+        serializer = StepSerializer(session, code, analysis["formulas"], call_tree_format="collapsed")
+        if call_id is not None and not 0 <= call_id < len(session.call_tree):
+            return {"success": False, "error": f"No call {call_id}", "traceback": ""}
+
+        return {"success": True, **serializer.expand_calls(call_id, offset)}
+
+    except Exception as e:
+        if session is not None:
+            session.stop()
+        return {
+            "success": False, 
+            "error": str(e),
+            "traceback": traceback.format_exc()
+        }
+
+def run_code_stream(code, fold_loops=False, fold_head=3, fold_tail=3, trace_modules=None, budget=None, state_format="full", array_encoding="list", capture_activations=False, call_tree_format="full", trace_scope="all"):
+    """
+    Generator variant of run_code. The program runs in a background thread
+    and every STREAM_BATCH traced lines the settled part of the trace is sent
+    as a {"type": "steps", "steps", "calls"} message, in the "table" format
+    along with the "values" and "states" the batch added. The run ends with a
+    {"type": "done", ...} message holding the remaining metadata, or with
+    {"type": "error", ...}.
+    """
+    try:
+        timings = Timings()
+        analysis = analyze(code, SCOPE_DETECTORS.get(trace_scope, ()))
+        nn_models = analysis["nn_models"]
+        recursive_funcs = analysis["recursive_funcs"]
+        pending_formulas = render_formulas(analysis["formulas"])
+        timings.lap("analysis")
+
+        session = new_session(analysis, fold_loops, fold_head, fold_tail, trace_modules, budget, trace_scope)
+        compiled, sandbox_globals = prepare_sandbox(code, analysis)
+        recorder = ActivationRecorder(session) if capture_activations else None
+        timings.lap("prepare")
+    except Exception as e:
+        yield {"type": "error", "error": str(e), "traceback": traceback.format_exc()}
+        return
+
+    serializer = StepSerializer(session, code, analysis["formulas"], state_format, array_encoding, call_tree_format)
+    messages = queue.Queue(maxsize=STREAM_QUEUE)
+    formulas_timed_out = 0
+
+    def flush(final=False):
+        nonlocal formulas_timed_out
+        # the first batch waits for the formulas still rendering, its lines
+        # carry them
+        formulas_timed_out += fill_formulas(pending_formulas)
+        end = len(session.execution_log) if final else session.settled()
+        steps = serializer.steps(end)
+        calls = serializer.calls(final)
+        if steps or calls:
+            message = {"type": "steps", "steps": steps, "calls": calls}
+            if state_format == "table":
+                message.update(serializer.tables())
+            messages.put(message)
+
+    def run():
+        try:
+            session.listen(flush, STREAM_BATCH)
+            # batches are serialized and sent inside "execute"
+            execute_traced(session, compiled, sandbox_globals, recorder)
+            timings.lap("execute")
+            flush(final=True)
+            timings.lap("serialize")
+            models = collect_nn_models(nn_models, sandbox_globals, recorder)
+            timings.lap("nn_models")
+            done = {
+                "type": "done",
+                "nn_models": models,
+                "recursive_funcs": recursive_funcs,
+                "truncated": session.truncated,
+                "timings": timings.report()
+            }
+            if formulas_timed_out:
+                done["formulas_timed_out"] = formulas_timed_out
+            messages.put(done)
+        except Exception as e:
+            messages.put({"type": "error", "error": str(e), "traceback": traceback.format_exc()})
+        finally:
+            messages.put(None)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    try:
+        while True:
+            message = messages.get()
+            if message is None:
+                break
+            yield message
+    finally:
+        if thread.is_alive():
+            # the client went away, stop the program and let the thread finish
+            session.budget.cancel()
+            while thread.is_alive():
+                try:
+                    messages.get(timeout=0.1)
+                except queue.Empty:
+                    pass
@@ -1,38 +1,35 @@
-import abc, array, bisect, calendar, cmath, collections
-import copy as copy_module
-import datetime, decimal, doctest, fractions, functools
-import hashlib, heapq, io, itertools, json, locale
-import operator, pickle, pprint, random, re, string
-import types, typing, unittest
+from lazy import lazy_module
 
+# Standard library modules available in the sandbox without an import. They
+# are lazy proxies, nothing is imported until a program first uses one.
 STDLIB_MODULES = {
-    "abc": abc,
-    "array": array,
-    "bisect": bisect,
-    "calendar": calendar,
-    "cmath": cmath,
-    "collections": collections,
-    "copy": copy_module,
-    "datetime": datetime,
-    "decimal": decimal,
-    "doctest": doctest,
-    "fractions": fractions,
-    "functools": functools,
-    "hashlib": hashlib,
-    "heapq": heapq,
-    "io": io,
-    "itertools": itertools,
-    "json": json,
-    "locale": locale,
-    "operator": operator,
-    "pickle": pickle,
-    "pprint": pprint,
-    "random": random,
-    "re": re,
-    "string": string,
-    "types": types,
-    "typing": typing,
-    "unittest": unittest,
+    "abc": lazy_module("abc"),
+    "array": lazy_module("array"),
+    "bisect": lazy_module("bisect"),
+    "calendar": lazy_module("calendar"),
+    "cmath": lazy_module("cmath"),
+    "collections": lazy_module("collections"),
+    "copy": lazy_module("copy"),
+    "datetime": lazy_module("datetime"),
+    "decimal": lazy_module("decimal"),
+    "doctest": lazy_module("doctest"),
+    "fractions": lazy_module("fractions"),
+    "functools": lazy_module("functools"),
+    "hashlib": lazy_module("hashlib"),
+    "heapq": lazy_module("heapq"),
+    "io": lazy_module("io"),
+    "itertools": lazy_module("itertools"),
+    "json": lazy_module("json"),
+    "locale": lazy_module("locale"),
+    "operator": lazy_module("operator"),
+    "pickle": lazy_module("pickle"),
+    "pprint": lazy_module("pprint"),
+    "random": lazy_module("random"),
+    "re": lazy_module("re"),
+    "string": lazy_module("string"),
+    "types": lazy_module("types"),
+    "typing": lazy_module("typing"),
+    "unittest": lazy_module("unittest"),
 }
 
 
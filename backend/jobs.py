@@ -0,0 +1,186 @@
+import os
+import json
+import time
+import uuid
+import threading
+from collections import deque
+
+import pool
+
+# Runs submitted through /jobs. JOB_SLOTS of them execute at once, JOB_QUEUE
+# more wait for a slot and anything past that is turned away right away, so
+# a burst gets fast 429s instead of requests piling up in the server.
+JOB_SLOTS = int(os.environ.get("DHRISTI_JOB_SLOTS", max(pool.POOL_SIZE, 1)))
+JOB_QUEUE = int(os.environ.get("DHRISTI_JOB_QUEUE", 16))
+# seconds a finished job and its result are kept for the client to fetch
+JOB_TTL = float(os.environ.get("DHRISTI_JOB_TTL", 300))
+# messages all jobs together keep, past it finished jobs are dropped oldest
+# first before their JOB_TTL is up
+JOB_MAX_MB = float(os.environ.get("DHRISTI_JOB_MAX_MB", 256))
+
+FINISHED = ("done", "failed", "cancelled")
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Job:
+    """
+    One submitted run. source(cancelled) returns its /execute/stream messages,
+    they are kept as JSON bytes as they arrive so a client can poll for the
+    part it hasn't seen, and their size is exact. status goes "queued" ->
+    "running" -> "done" | "failed" | "cancelled", a queued job can also be
+    cancelled directly.
+    """
+
+    def __init__(self, source):
+        self.id = uuid.uuid4().hex
+        self.source = source
+        self.status = "queued"
+        self.messages = [] # JSON bytes of each message
+        self.nbytes = 0
+        self.steps = 0
+        self.cancelled = threading.Event()
+        self.started = None
+        self.finished = None
+
+    def add(self, message):
+        line = json.dumps(message, separators=(",", ":")).encode()
+        self.messages.append(line)
+        self.nbytes += len(line)
+        if message["type"] == "steps":
+            self.steps += len(message["steps"])
+
+    def view(self, since=0, position=None):
+        # JSON bytes, the kept messages are spliced in without parsing them
+        end = self.finished or time.monotonic()
+        count = len(self.messages)
+        messages = self.messages[since:count]
+        view = {
+            "success": True,
+            "job_id": self.id,
+            "status": self.status,
+            "progress": {
+                "steps": self.steps,
+                "seconds": round(end - (self.started or end), 3)
+            },
+            # messages from index since on, the next poll passes "next"
+            "next": count
+        }
+        if position is not None:
+            view["position"] = position
+        head = json.dumps(view, separators=(",", ":")).encode()
+        return head[:-1] + b',"messages":[' + b",".join(messages) + b"]}"
+
+
+class JobQueue:
+    def __init__(self, slots=JOB_SLOTS, max_queued=JOB_QUEUE, ttl=JOB_TTL, max_bytes=JOB_MAX_MB * 1024 * 1024):
+        self.slots = slots
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.jobs = {} # job id -> Job, until ttl after it finished
+        self.waiting = deque()
+        self.running = 0
+        self.runners = []
+        self.cond = threading.Condition()
+
+    def submit(self, source):
+        with self.cond:
+            self.expire()
+            if self.running + len(self.waiting) >= self.slots + self.max_queued:
+                raise QueueFull(f"{self.running} jobs running and {len(self.waiting)} queued")
+            if not self.runners:
+                # started on first use, spawned workers re-import app.py
+                for _ in range(self.slots):
+                    runner = threading.Thread(target=self.run, daemon=True)
+                    runner.start()
+                    self.runners.append(runner)
+
+            job = Job(source)
+            self.jobs[job.id] = job
+            self.waiting.append(job)
+            self.cond.notify()
+            return job
+
+    def get(self, job_id):
+        with self.cond:
+            self.expire()
+            return self.jobs.get(job_id)
+
+    def position(self, job):
+        # jobs ahead of this one in the queue, None once it left the queue
+        with self.cond:
+            try:
+                return self.waiting.index(job)
+            except ValueError:
+                return None
+
+    def cancel(self, job):
+        with self.cond:
+            if job.status in FINISHED:
+                return
+            if job.status == "queued":
+                self.waiting.remove(job)
+                job.finished = time.monotonic()
+            # a running job stops at its next message, its worker is killed
+            job.status = "cancelled"
+            job.cancelled.set()
+
+    def expire(self):
+        now = time.monotonic()
+        expired = [
+            job_id for job_id, job in self.jobs.items()
+            if job.finished is not None and now - job.finished > self.ttl
+        ]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+        # jobs are kept in submission order, close enough to the finishing one
+        nbytes = sum(job.nbytes for job in self.jobs.values())
+        for job_id, job in list(self.jobs.items()):
+            if nbytes <= self.max_bytes:
+                break
+            if job.finished is not None:
+                nbytes -= job.nbytes
+                del self.jobs[job_id]
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.waiting:
+                    self.cond.wait()
+                job = self.waiting.popleft()
+                job.status = "running"
+                job.started = time.monotonic()
+                self.running += 1
+
+            status = "failed"
+            messages = None
+            try:
+                messages = job.source(job.cancelled)
+                for message in messages:
+                    if job.cancelled.is_set():
+                        break
+                    job.add(message)
+                    if message["type"] == "done":
+                        status = "done"
+            except Exception as e:
+                job.add({"type": "error", "error": str(e), "traceback": ""})
+            finally:
+                close = getattr(messages, "close", None)
+                if close is not None:
+                    # an in-process run stops at its next traced line
+                    close()
+
+            with self.cond:
+                if job.status != "cancelled":
+                    job.status = status
+                job.finished = time.monotonic()
+                self.running -= 1
+                # its messages may take the retained bytes past max_bytes
+                self.expire()
+
+
+job_queue = JobQueue()
@@ -0,0 +1,239 @@
+import os
+import ast
+import time
+import types
+import builtins
+import threading
+from collections import OrderedDict, deque
+
+# LaTeX of formula sources, shared by every run in the process. Rendering
+# happens on LATEX_THREADS threads while the program runs, a formula that
+# isn't done LATEX_SECONDS after it started is sent without LaTeX and its
+# result only lands in the cache for later runs.
+LATEX_CACHE_SIZE = int(os.environ.get("DHRISTI_LATEX_CACHE", 4096))
+LATEX_SECONDS = float(os.environ.get("DHRISTI_LATEX_SECONDS", 0.5))
+LATEX_THREADS = int(os.environ.get("DHRISTI_LATEX_THREADS", 2))
+# a thread can't be stopped inside sympy, one past LATEX_SECONDS is left to
+# finish and another takes its place. Up to LATEX_STUCK of them, past that
+# new formulas go without LaTeX until some finish.
+LATEX_STUCK = int(os.environ.get("DHRISTI_LATEX_STUCK", 4))
+
+# formulas larger than this are sent as source only
+MAX_FORMULA_NODES = 64
+# sympify evaluates numeric powers exactly, 2 ** 10 ** 10 would never finish
+MAX_EXPONENT = 1000
+
+# sympify calls builtin functions instead of making them symbolic, print()
+# would print and len() fails on a symbol. Builtin classes like list or int
+# become plain function symbols, abs / min / max / pow / round work.
+SKIPPED_CALLS = {
+    name for name, value in vars(builtins).items()
+    if isinstance(value, types.BuiltinFunctionType)
+} - {"abs", "min", "max", "pow", "round"}
+FORMULA_OPS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow)
+# operator and context nodes ast.walk yields below the expressions
+LEAF_TYPES = (ast.Name, ast.operator, ast.unaryop, ast.cmpop, ast.expr_context)
+
+rendered = OrderedDict() # source -> LaTeX or None, least recently used first
+running = {} # source -> Job waiting or being rendered
+waiting = deque() # jobs no thread has taken yet
+rendering = set() # jobs a render thread is on
+lock = threading.Lock()
+sympy_loaded = threading.Event()
+
+
+def has_name(node):
+    return any(isinstance(n, ast.Name) for n in ast.walk(node))
+
+
+def small_number(node):
+    # a numeric exponent sympify can evaluate right away: no powers of its
+    # own and no constant past MAX_EXPONENT
+    for n in ast.walk(node):
+        if isinstance(n, ast.BinOp) and isinstance(n.op, ast.Pow):
+            return False
+        if isinstance(n, ast.Constant) and isinstance(n.value, (int, float)) and abs(n.value) > MAX_EXPONENT:
+            return False
+    return True
+
+
+def renderable(node):
+    """
+    Cheap check that sympify can turn an expression into something worth
+    showing: arithmetic and single comparisons of names and numbers, and
+    calls of functions by name (sqrt(x), or the user's own f(n - 1)).
+    Attribute and subscript access (np.zeros(n), x[i]), strings, keyword
+    arguments and builtins like print() are left out.
+    """
+    count = 0
+    for n in ast.walk(node):
+        count += 1
+        if count > MAX_FORMULA_NODES:
+            return False
+        if isinstance(n, ast.BinOp):
+            if not isinstance(n.op, FORMULA_OPS):
+                return False
+            if isinstance(n.op, ast.Pow) and not has_name(n.right) and not small_number(n.right):
+                return False
+        elif isinstance(n, ast.UnaryOp):
+            if not isinstance(n.op, (ast.USub, ast.UAdd)):
+                return False
+        elif isinstance(n, ast.Compare):
+            if len(n.ops) != 1:
+                return False
+        elif isinstance(n, ast.Call):
+            if not isinstance(n.func, ast.Name) or n.func.id in SKIPPED_CALLS or n.keywords:
+                return False
+            if any(isinstance(arg, ast.Starred) for arg in n.args):
+                return False
+        elif isinstance(n, ast.Constant):
+            if type(n.value) not in (int, float):
+                return False
+        elif not isinstance(n, LEAF_TYPES):
+            return False
+    return True
+
+
+def load_sympy():
+    # sympy is only imported once a program has a formula to render. Like the
+    # formulas themselves the import is paid once per process, it isn't timed.
+    try:
+        import sympy
+    finally:
+        sympy_loaded.set()
+
+
+def to_latex(src):
+    import sympy as sp
+
+    try:
+        return sp.latex(sp.sympify(src))
+    except Exception:
+        return None
+
+
+def remember(src, latex):
+    with lock:
+        rendered[src] = latex
+        rendered.move_to_end(src)
+        while len(rendered) > LATEX_CACHE_SIZE:
+            rendered.popitem(last=False)
+        running.pop(src, None)
+
+
+class Job:
+    # one source being rendered, shared by every run waiting for it
+    def __init__(self, src):
+        self.src = src
+        self.started = None
+        self.latex = None
+        self.done = threading.Event()
+
+    def run(self):
+        try:
+            load_sympy()
+            self.started = time.monotonic()
+            self.latex = to_latex(self.src)
+        finally:
+            remember(self.src, self.latex)
+            self.done.set()
+
+    def overran(self, now):
+        return self.started is not None and now - self.started > LATEX_SECONDS
+
+    def wait(self, deadline):
+        # False once the job ran LATEX_SECONDS, or deadline passed before that
+        while not self.done.is_set():
+            if self.started is None:
+                # still waiting, a thread may have overrun since
+                with lock:
+                    schedule()
+            limit = deadline
+            if self.started is not None:
+                limit = min(limit, self.started + LATEX_SECONDS)
+            remaining = limit - time.monotonic()
+            if remaining <= 0:
+                return False
+            self.done.wait(min(remaining, LATEX_SECONDS))
+        return True
+
+
+def render(job):
+    # a render thread, it goes on with the next waiting job while there is one
+    while job is not None:
+        job.run()
+        with lock:
+            rendering.discard(job)
+            job = waiting.popleft() if waiting else None
+            if job is not None:
+                rendering.add(job)
+
+
+def schedule():
+    # a thread for each waiting job while fewer than LATEX_THREADS render
+    # within their time and at most LATEX_STUCK overran. Under lock.
+    now = time.monotonic()
+    stuck = sum(1 for job in rendering if job.overran(now))
+    while waiting and len(rendering) - stuck < LATEX_THREADS and len(rendering) < LATEX_THREADS + LATEX_STUCK:
+        job = waiting.popleft()
+        rendering.add(job)
+        threading.Thread(target=render, args=(job,), name="latex", daemon=True).start()
+
+
+def finished(src, latex):
+    job = Job(src)
+    job.latex = latex
+    job.done.set()
+    return job
+
+
+def submit(src):
+    # cached LaTeX (None included) as a finished job, or the running one
+    with lock:
+        if src in rendered:
+            rendered.move_to_end(src)
+            return finished(src, rendered[src])
+
+        job = running.get(src)
+        if job is None:
+            now = time.monotonic()
+            if sum(1 for other in rendering if other.overran(now)) >= LATEX_THREADS + LATEX_STUCK:
+                # every thread is stuck, not cached so a later run tries again
+                return finished(src, None)
+            job = running[src] = Job(src)
+            waiting.append(job)
+            schedule()
+        return job
+
+
+def render_formulas(formulas):
+    """
+    Starts rendering the formulas of FormulaDetector's result and returns
+    the pending (formula, job) pairs for fill_formulas. Formulas the
+    prefilter rejects keep "latex" None and are never handed to sympy.
+    """
+    pending = []
+    for formula in formulas.values():
+        try:
+            node = ast.parse(formula["expr"], mode="eval").body
+        except SyntaxError:
+            continue
+        if renderable(node):
+            pending.append((formula, submit(formula["expr"])))
+    return pending
+
+
+def fill_formulas(pending):
+    # sets "latex" of each pending formula and empties pending, returns how
+    # many were still rendering at their time limit
+    if any(not job.done.is_set() for _, job in pending):
+        sympy_loaded.wait()
+    deadline = time.monotonic() + LATEX_SECONDS
+    timed_out = 0
+    while pending:
+        formula, job = pending.pop()
+        if job.wait(deadline):
+            formula["latex"] = job.latex
+        else:
+            timed_out += 1
+    return timed_out
@@ -0,0 +1,45 @@
+import types
+import importlib
+import threading
+
+_lock = threading.Lock()
+
+
+class LazyModule(types.ModuleType):
+    """
+    Stands in for a module that is only imported on first attribute access.
+    After that the real module's attributes are copied onto the proxy, so
+    later lookups are plain dict hits and never reach __getattr__ again.
+    Being a ModuleType, it is filtered out of snapshots like real modules.
+    """
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.__dict__["_lazy_module"] = None
+
+    def _load(self):
+        module = self.__dict__["_lazy_module"]
+        if module is None:
+            with _lock:
+                module = self.__dict__["_lazy_module"]
+                if module is None:
+                    module = importlib.import_module(self.__name__)
+                    self.__dict__.update(module.__dict__)
+                    self.__dict__["_lazy_module"] = module
+        return module
+
+    def __getattr__(self, name):
+        # only called for names missing from the proxy's own __dict__
+        return getattr(self._load(), name)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        module = self.__dict__["_lazy_module"]
+        state = "loaded" if module is not None else "not loaded"
+        return f"<lazy module '{self.__name__}' ({state})>"
+
+
+def lazy_module(name):
+    return LazyModule(name)
@@ -0,0 +1,169 @@
+import sys
+import types
+import threading
+
+import tracer
+
+USER_FILENAME = "<user_code>"
+
+# One tool id and one set of callbacks serve every session in the process.
+# Events are enabled per code object, and each callback dispatches to the
+# session bound to the thread running that code.
+tool_id = None
+active_sessions = set()
+allow_list_sessions = set() # sessions that also trace allow-listed modules
+# reentrant, Python called while holding it fires PY_START in the same thread
+lock = threading.RLock()
+
+def user_code_objects(compiled):
+    # every function, class body and comprehension nested in the user's module
+    stack = [compiled]
+    while stack:
+        code = stack.pop()
+        if code.co_filename != USER_FILENAME:
+            continue
+        yield code
+        for const in code.co_consts:
+            if isinstance(const, types.CodeType):
+                stack.append(const)
+
+def on_py_start(code, offset):
+    session = tracer.current_session()
+    if session is None:
+        return
+    frame = sys._getframe(1)
+    if code in session.user_codes:
+        session.on_call(frame)
+        return
+
+    # only reached through the global PY_START enabled for allow-lists
+    if session.is_traced(frame):
+        with lock:
+            session.user_codes.add(code)
+            sys.monitoring.set_local_events(tool_id, code, code_events(code))
+        session.on_call(frame)
+        return
+    # DISABLE turns PY_START off at this location for every thread, so only
+    # once no other session's allow-list takes it either
+    with lock:
+        if any(other.is_traced(frame) for other in allow_list_sessions):
+            return
+    return sys.monitoring.DISABLE
+
+def on_py_resume(code, offset):
+    session = tracer.current_session()
+    if session is not None and code in session.user_codes:
+        session.on_call(sys._getframe(1))
+
+def on_py_return(code, offset, retval):
+    # events are enabled per code object for all threads, another session's
+    # code also reaches this thread's session
+    session = tracer.current_session()
+    if session is not None and code in session.user_codes:
+        session.on_return(sys._getframe(1), retval)
+
+def on_py_unwind(code, offset, exc):
+    # PY_UNWIND can only be enabled globally, filter to user frames here
+    session = tracer.current_session()
+    if session is not None and code in session.user_codes:
+        session.on_return(sys._getframe(1), None)
+
+def on_line(code, line_number):
+    session = tracer.current_session()
+    if session is not None and code in session.user_codes:
+        session.on_line(sys._getframe(1))
+
+def on_instruction(code, offset):
+    session = tracer.current_session()
+    if session is not None and session.trace_opcodes and code in session.user_codes:
+        session.on_opcode(sys._getframe(1))
+
+def code_events(code):
+    # a module's code objects are shared by the sessions tracing it, each
+    # gets the events of all of them and its callbacks filter. Under lock.
+    events = 0
+    for session in active_sessions:
+        if code in session.user_codes:
+            events |= session.local_events
+    return events
+
+CALLBACKS = {
+    "PY_START": on_py_start,
+    # generators resume and suspend like calls and returns under settrace
+    "PY_RESUME": on_py_resume,
+    "PY_RETURN": on_py_return,
+    "PY_YIELD": on_py_return,
+    "PY_UNWIND": on_py_unwind,
+    "LINE": on_line,
+    "INSTRUCTION": on_instruction,
+}
+
+def acquire_tool_id():
+    mon = sys.monitoring
+    for candidate in (mon.DEBUGGER_ID, mon.PROFILER_ID, 3, 4):
+        try:
+            mon.use_tool_id(candidate, "dhristi")
+            return candidate
+        except ValueError:
+            continue
+    raise RuntimeError("No free sys.monitoring tool id")
+
+def start(session, compiled):
+    global tool_id
+    mon = sys.monitoring
+    E = mon.events
+
+    with lock:
+        if tool_id is None:
+            tool_id = acquire_tool_id()
+            for name, callback in CALLBACKS.items():
+                mon.register_callback(tool_id, getattr(E, name), callback)
+            mon.set_events(tool_id, E.PY_UNWIND)
+        active_sessions.add(session)
+
+        local_events = E.PY_START | E.PY_RESUME | E.PY_RETURN | E.PY_YIELD | E.LINE
+        if session.trace_opcodes:
+            local_events |= E.INSTRUCTION
+        session.local_events = local_events
+
+        for code in user_code_objects(compiled):
+            if code in session.untraced_codes:
+                continue
+            session.user_codes.add(code)
+            mon.set_local_events(tool_id, code, local_events)
+
+        if len(session.traced_modules) > 1:
+            # allow-listed modules have no code objects to enable up front, so
+            # watch PY_START everywhere and disable it per foreign code location
+            allow_list_sessions.add(session)
+            mon.set_events(tool_id, E.PY_UNWIND | E.PY_START)
+            mon.restart_events()
+
+def stop(session):
+    global tool_id
+    mon = sys.monitoring
+
+    with lock:
+        if tool_id is None:
+            return
+
+        codes = list(session.user_codes)
+        session.user_codes.clear()
+        active_sessions.discard(session)
+        for code in codes:
+            # what the sessions still tracing it need, 0 once none does
+            mon.set_local_events(tool_id, code, code_events(code))
+
+        if session in allow_list_sessions:
+            allow_list_sessions.discard(session)
+            if not allow_list_sessions:
+                mon.set_events(tool_id, mon.events.PY_UNWIND)
+
+        if active_sessions:
+            return
+
+        mon.set_events(tool_id, 0)
+        for name in CALLBACKS:
+            mon.register_callback(tool_id, getattr(mon.events, name), None)
+        mon.free_tool_id(tool_id)
+        tool_id = None
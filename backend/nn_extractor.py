@@ -1,33 +1,13 @@
 import ast
 
-def extract_sequential_models(code: str):
-    tree = ast.parse(code)
-    models = []
+from ast_utils import Detector
 
-    for node in ast.walk(tree):
-        #model = nn.Sequential(...)
-        if isinstance(node, ast.Assign):
-            if isinstance(node.value, ast.Call):
-                call = node.value
-
-                # nn.Sequential(...)
-                if isinstance(call.func, ast.Attribute):
-                    if call.func.attr == "Sequential":
-                        model_name = node.targets[0].id
-                        layers = []
-
-                        for arg in call.args:
-                            if isinstance(arg, ast.Call):
-                                layer = extract_layer(arg)
-                                if layer:
-                                    layers.append(layer)
-                    
-                        models.append({
-                            "model_name" : model_name,
-                            "type" : "Sequential",
-                            "layers" : layers
-                        })
-    return models
+def literal_or_none(node):
+    # nn.Linear(hidden, 10): sizes held in variables are only known at runtime
+    try:
+        return ast.literal_eval(node)
+    except (ValueError, TypeError, SyntaxError, MemoryError, RecursionError):
+        return None
 
 def extract_layer(call_node: ast.Call):
     if isinstance(call_node.func, ast.Attribute):
@@ -37,8 +17,8 @@ def extract_layer(call_node: ast.Call):
         if layer_type == "Linear" and len(call_node.args) >= 2:
             return {
                 "layer" : "Linear",
-                "in" : ast.literal_eval(call_node.args[0]),
-                "out" : ast.literal_eval(call_node.args[1])
+                "in" : literal_or_none(call_node.args[0]),
+                "out" : literal_or_none(call_node.args[1])
             }
         
         # nn.ReLU(), nn.Sigmoid(), etc:
@@ -48,188 +28,11 @@ def extract_layer(call_node: ast.Call):
     
     return None
 
-def extract_manual_dense_layers(code: str):
-    tree = ast.parse(code)
-
-    tree = ast.parse(code)
-    dense_assignments = extract_dense_assignments(tree)
-
-    if len(dense_assignments) >= 2:
-        return [{
-            "model_name": "ManualDense",
-            "type": "Dense",
-            "layers": chain_dense_layers(dense_assignments)
-        }]
-
-    unrolled = detect_unrolled_dense(tree)
-    if unrolled:
-        return [{
-            "model_name": "ManualDense",
-            "type": "Dense",
-            "layers": [{
-                "layer": "Linear",
-                "in": unrolled["inputs"],
-                "out": unrolled["neurons"]
-            }]
-        }]
-
-    input_size = None
-    neuron_count = None
-    has_bias = False
-    has_dot = False
-    has_loop = False
-
-    for node in ast.walk(tree):
-
-        # Detect input vector
-        if isinstance(node, ast.Assign):
-            if isinstance(node.value, ast.List):
-                name = node.targets[0].id if isinstance(node.targets[0], ast.Name) else ""
-
-                # Heuristic: 1D list used later in dot or loop
-                if input_size is None and len(node.value.elts) >= 2:
-                    input_size = len(node.value.elts)
-
-                # Detect 2D weight matrix
-                if node.value.elts and isinstance(node.value.elts[0], ast.List):
-                    neuron_count = len(node.value.elts)
-
-                # Detect bias vector
-                if name.lower().startswith("bias"):
-                    has_bias = True
-
-        # Detect np.dot(weights, inputs)
-        if isinstance(node, ast.Call):
-            if isinstance(node.func, ast.Attribute) and node.func.attr == "dot":
-                has_dot = True
-
-        # Detect zip(weights, biases) loop
-        if isinstance(node, ast.For):
-            if isinstance(node.iter, ast.Call):
-                if isinstance(node.iter.func, ast.Name) and node.iter.func.id == "zip":
-                    has_loop = True
-
-    confidence = 0
-    confidence += 3 if has_dot else 0
-    confidence += 2 if has_loop else 0
-    confidence += 2 if neuron_count else 0
-    confidence += 1 if has_bias else 0
-
-    if confidence < 4 or not input_size or not neuron_count:
-        return []
-
-    return [{
-        "model_name": "ManualDense",
-        "type": "Dense",
-        "layers": [{
-            "layer": "Linear",
-            "in": input_size,
-            "out": neuron_count
-        }]
-    }]
-
-def extract_weight_stack_dense(code: str):
-    tree = ast.parse(code)
-    layers = []
-
-    for node in ast.walk(tree):
-        if isinstance(node, ast.Assign):
-            if isinstance(node.value, ast.List):
-                # weights = [...]
-                if isinstance(node.targets[0], ast.Name) and node.targets[0].id == "weights":
-                    top = node.value.elts  # layers
-
-                    prev_out = None
-
-                    for layer in top:
-                        if not isinstance(layer, ast.List):
-                            continue
-
-                        neurons = len(layer.elts)
-                        if neurons == 0:
-                            continue
-
-                        first = layer.elts[0]
-                        if not isinstance(first, ast.List):
-                            continue
-
-                        in_features = len(first.elts)
-
-                        layers.append({
-                            "layer": "Linear",
-                            "in": in_features if prev_out is None else prev_out,
-                            "out": neurons
-                        })
-
-                        prev_out = neurons
-
-    if not layers:
-        return []
-
-    return [{
-        "model_name": "ManualDense",
-        "type": "Dense",
-        "layers": layers
-    }]
-
-
-def detect_unrolled_dense(tree):
-    """
-    Detects:
-    inputs[0]*w[0] + inputs[1]*w[1] + ... + bias
-    repeated N times → Dense layer
-    """
-    neuron_count = 0
-    input_indices = set()
-
-    for node in ast.walk(tree):
-        if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Add):
-            terms = flatten_add(node)
-
-            mul_terms = [
-                t for t in terms
-                if isinstance(t, ast.BinOp) and isinstance(t.op, ast.Mult)
-            ]
-
-            if len(mul_terms) >= 2:
-                for m in mul_terms:
-                    if isinstance(m.left, ast.Subscript):
-                        input_indices.add(ast.unparse(m.left))
-                neuron_count += 1
-
-    if neuron_count >= 1 and len(input_indices) >= 2:
-        return {
-            "inputs": len(input_indices),
-            "neurons": neuron_count
-        }
-
-    return None
-
-
 def flatten_add(node):
     if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Add):
         return flatten_add(node.left) + flatten_add(node.right)
     return [node]
 
-def extract_dense_assignments(tree):
-    """
-    Finds:
-    layerX_out = <dense expression>
-    """
-    layers = []
-
-    for node in ast.walk(tree):
-        if isinstance(node, ast.Assign) and isinstance(node.value, ast.List):
-            name = node.targets[0].id if isinstance(node.targets[0], ast.Name) else None
-            dense = detect_unrolled_dense_expr(node.value)
-
-            if name and dense:
-                layers.append({
-                    "var": name,
-                    "out": dense["neurons"]
-                })
-    return layers
-
 def chain_dense_layers(dense_layers):
     chained = []
     prev_out = None
@@ -283,3 +86,207 @@ def detect_unrolled_dense_expr(expr):
 
     return None
 
+
+
+class NNModelDetector(Detector):
+    """
+    Neural networks described by the source, most explicit form first:
+    nn.Sequential models, then a stacked `weights = [[[...]]]` list, then
+    hand-written dense layers (unrolled sums of products, or the
+    weights/bias/np.dot heuristic).
+    """
+
+    name = "nn_models"
+    node_types = (ast.Assign, ast.BinOp, ast.Call, ast.For)
+
+    def begin(self, tree):
+        self.sequential = []
+        self.stack_layers = []
+        self.weights_stack = False
+        self.dense_assignments = []
+
+        # unrolled: inputs[0]*w[0] + inputs[1]*w[1] + ... + bias, repeated per neuron
+        self.unrolled_neurons = 0
+        self.unrolled_inputs = set()
+
+        self.input_size = None
+        self.neuron_count = None
+        self.has_bias = False
+        self.has_dot = False
+        self.has_loop = False
+
+        # globals holding the weights and biases, read after the run
+        self.weights_name = None
+        self.bias_name = None
+
+    def visit(self, node):
+        if isinstance(node, ast.Assign):
+            self.visit_assign(node)
+
+        elif isinstance(node, ast.BinOp):
+            if isinstance(node.op, ast.Add):
+                terms = flatten_add(node)
+
+                mul_terms = [
+                    t for t in terms
+                    if isinstance(t, ast.BinOp) and isinstance(t.op, ast.Mult)
+                ]
+
+                if len(mul_terms) >= 2:
+                    for m in mul_terms:
+                        if isinstance(m.left, ast.Subscript):
+                            self.unrolled_inputs.add(ast.unparse(m.left))
+                    self.unrolled_neurons += 1
+
+        # Detect np.dot(weights, inputs)
+        elif isinstance(node, ast.Call):
+            if isinstance(node.func, ast.Attribute) and node.func.attr == "dot":
+                self.has_dot = True
+
+        # Detect zip(weights, biases) loop
+        elif isinstance(node, ast.For):
+            if isinstance(node.iter, ast.Call):
+                if isinstance(node.iter.func, ast.Name) and node.iter.func.id == "zip":
+                    self.has_loop = True
+
+    def visit_assign(self, node):
+        #model = nn.Sequential(...)
+        if isinstance(node.value, ast.Call):
+            call = node.value
+
+            # nn.Sequential(...)
+            if isinstance(call.func, ast.Attribute):
+                if call.func.attr == "Sequential":
+                    # self.head = nn.Sequential(...) inside a Module is named by its path
+                    model_name = ast.unparse(node.targets[0])
+                    layers = []
+
+                    for arg in call.args:
+                        if isinstance(arg, ast.Call):
+                            layer = extract_layer(arg)
+                            if layer:
+                                layers.append(layer)
+
+                    self.sequential.append({
+                        "model_name" : model_name,
+                        "type" : "Sequential",
+                        "layers" : layers
+                    })
+            return
+
+        if not isinstance(node.value, ast.List):
+            return
+
+        # weights = [...]
+        if isinstance(node.targets[0], ast.Name) and node.targets[0].id == "weights":
+            top = node.value.elts  # layers
+            # [np.random.randn(128, 784), ...] has its sizes filled in at runtime
+            self.weights_stack = any(isinstance(e, (ast.Call, ast.Name, ast.Attribute)) for e in top)
+
+            prev_out = None
+
+            for layer in top:
+                if not isinstance(layer, ast.List):
+                    continue
+
+                neurons = len(layer.elts)
+                if neurons == 0:
+                    continue
+
+                first = layer.elts[0]
+                if not isinstance(first, ast.List):
+                    continue
+
+                in_features = len(first.elts)
+
+                self.stack_layers.append({
+                    "layer": "Linear",
+                    "in": in_features if prev_out is None else prev_out,
+                    "out": neurons
+                })
+
+                prev_out = neurons
+
+        # layerX_out = <dense expression>
+        name = node.targets[0].id if isinstance(node.targets[0], ast.Name) else None
+        dense = detect_unrolled_dense_expr(node.value)
+        if name and dense:
+            self.dense_assignments.append({
+                "var": name,
+                "out": dense["neurons"]
+            })
+
+        # Detect input vector
+        name = name or ""
+
+        # Heuristic: 1D list used later in dot or loop
+        if self.input_size is None and len(node.value.elts) >= 2:
+            self.input_size = len(node.value.elts)
+
+        # Detect 2D weight matrix
+        if node.value.elts and isinstance(node.value.elts[0], ast.List):
+            self.neuron_count = len(node.value.elts)
+            self.weights_name = name
+
+        # Detect bias vector
+        if name.lower().startswith("bias"):
+            self.has_bias = True
+            self.bias_name = name
+
+    def result(self):
+        # Highest confidence: explicit framework models
+        if self.sequential:
+            return self.sequential
+
+        # Static weight-stack inference (MULTI-LAYER)
+        if self.stack_layers or self.weights_stack:
+            return [{
+                "model_name": "ManualDense",
+                "type": "Dense",
+                "layers": self.stack_layers,
+                "weights_var": "weights",
+                "biases_var": self.bias_name
+            }]
+
+        # Heuristic fallback (SINGLE-LAYER)
+        return self.manual_dense_models()
+
+    def manual_dense_models(self):
+        if len(self.dense_assignments) >= 2:
+            return [{
+                "model_name": "ManualDense",
+                "type": "Dense",
+                "layers": chain_dense_layers(self.dense_assignments)
+            }]
+
+        if self.unrolled_neurons >= 1 and len(self.unrolled_inputs) >= 2:
+            return [{
+                "model_name": "ManualDense",
+                "type": "Dense",
+                "layers": [{
+                    "layer": "Linear",
+                    "in": len(self.unrolled_inputs),
+                    "out": self.unrolled_neurons
+                }]
+            }]
+
+        confidence = 0
+        confidence += 3 if self.has_dot else 0
+        confidence += 2 if self.has_loop else 0
+        confidence += 2 if self.neuron_count else 0
+        confidence += 1 if self.has_bias else 0
+
+        if confidence < 4 or not self.input_size or not self.neuron_count:
+            return []
+
+        return [{
+            "model_name": "ManualDense",
+            "type": "Dense",
+            "layers": [{
+                "layer": "Linear",
+                "in": self.input_size,
+                "out": self.neuron_count
+            }],
+            "weights_var": self.weights_name,
+            "biases_var": self.bias_name
+        }]
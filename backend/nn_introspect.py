@@ -0,0 +1,305 @@
+import os
+import sys
+import importlib
+
+import tracer
+from array_summary import NUMERIC_KINDS, distribution, pool_grid, to_array
+
+# memory for one run's activation summaries, modules seen after it is used up
+# are not captured
+ACTIVATION_KB = int(os.environ.get("DHRISTI_ACTIVATION_KB", 256))
+ACTIVATION_BINS = 16
+
+# neurons per side of a layer's weight summary, wider layers are pooled into
+# this many buckets of neighbouring neurons (the frontend draws as many)
+NN_BUCKETS = int(os.environ.get("DHRISTI_NN_BUCKETS", 12))
+# strongest incoming edges sent per output bucket
+EDGES_PER_NEURON = int(os.environ.get("DHRISTI_NN_EDGES", 4))
+
+# constructor sizes reported as a layer's "in" / "out", first attribute found wins
+LAYER_SIZES = {
+    "in": ("in_features", "in_channels", "num_embeddings", "input_size", "num_features"),
+    "out": ("out_features", "out_channels", "embedding_dim", "hidden_size", "num_features"),
+}
+
+
+def count(params):
+    # lazy modules have parameters without a shape until their first forward
+    try:
+        return sum(p.numel() for p in params)
+    except (RuntimeError, ValueError):
+        return None
+
+
+def activation_summary(torch, output):
+    # shape and distribution of a forward output, the first tensor of a tuple / list
+    if isinstance(output, (tuple, list)):
+        output = next((o for o in output if isinstance(o, torch.Tensor)), None)
+    if not isinstance(output, torch.Tensor):
+        return None
+
+    summary = {"shape": list(output.shape), "dtype": str(output.dtype)}
+    if not (output.is_floating_point() and output.numel()):
+        return summary
+
+    with torch.no_grad():
+        values = output.detach().float().reshape(-1)
+        finite = values[torch.isfinite(values)]
+        summary["nonfinite"] = int(values.numel() - finite.numel())
+        if finite.numel():
+            low, high = finite.min().item(), finite.max().item()
+            summary.update({
+                "mean": finite.mean().item(),
+                "std": finite.std().item() if finite.numel() > 1 else 0.0,
+                "min": low,
+                "max": high,
+                "histogram": torch.histc(finite, bins=ACTIVATION_BINS, min=low, max=high).int().tolist()
+            })
+    return summary
+
+
+def stats(np, values):
+    finite = values[np.isfinite(values)]
+    if not finite.size:
+        return {}
+    return {
+        "mean": float(finite.mean()),
+        "std": float(finite.std()),
+        "min": float(finite.min()),
+        "max": float(finite.max())
+    }
+
+
+def weight_summary(np, matrix):
+    """
+    Compact view of an out x in weight matrix: its distribution, and the
+    EDGES_PER_NEURON strongest inputs of every output neuron as
+    [in, out, mean, mean |w|] edges. Both sides are pooled into at most
+    NN_BUCKETS buckets first, so the size doesn't depend on the layer's width.
+    """
+    summary = {"shape": list(matrix.shape), **stats(np, matrix), **distribution(matrix)}
+    if not matrix.size:
+        return summary
+
+    signed = pool_grid(matrix, NN_BUCKETS)
+    means = np.array(signed["mean"], dtype=np.float64)
+    strengths = np.array(pool_grid(np.abs(matrix), NN_BUCKETS)["mean"], dtype=np.float64)
+    ranked = np.argsort(-np.nan_to_num(strengths, nan=-1.0), axis=1)[:, :EDGES_PER_NEURON]
+
+    summary["buckets"] = {"block": signed["block"], "out": means.shape[0], "in": means.shape[1]}
+    summary["edges"] = [
+        [int(j), i, float(means[i, j]), float(strengths[i, j])]
+        for i, row in enumerate(ranked)
+        for j in row
+        if strengths[i, j] > 0
+    ]
+    return summary
+
+
+def as_matrix(np, value):
+    # out x in float matrix of a list, ndarray or tensor, a single neuron's
+    # weight vector is one row
+    array = to_array(value)
+    if array is None:
+        try:
+            array = np.asarray(value, dtype=np.float64)
+        except (ValueError, TypeError):
+            return None
+    if array.dtype.kind not in NUMERIC_KINDS:
+        return None
+    array = array.astype(np.float64, copy=False)
+    if array.ndim == 1:
+        return array.reshape(1, -1)
+    return array if array.ndim == 2 else None
+
+
+def as_bias(np, value, size):
+    if value is None:
+        return None
+    array = to_array(value)
+    try:
+        bias = np.asarray(value if array is None else array, dtype=np.float64).reshape(-1)
+    except (ValueError, TypeError):
+        return None
+    return bias if bias.size == size else None
+
+
+def dense_layers(np, weights, biases):
+    # one matrix, or a stack of them with a bias per layer
+    matrix = as_matrix(np, weights)
+    if matrix is not None:
+        matrices, biases = [matrix], [biases]
+    else:
+        matrices = [as_matrix(np, w) for w in weights]
+        if any(m is None for m in matrices):
+            return None
+        if not hasattr(biases, "__len__") or len(biases) != len(matrices):
+            biases = [None] * len(matrices)
+
+    layers = []
+    for matrix, bias in zip(matrices, biases):
+        out_features, in_features = matrix.shape
+        layer = {
+            "layer": "Linear",
+            "in": in_features,
+            "out": out_features,
+            "parameters": int(matrix.size),
+            "weights": weight_summary(np, matrix)
+        }
+        bias = as_bias(np, bias, out_features)
+        if bias is not None:
+            layer["parameters"] += int(bias.size)
+            layer["bias"] = stats(np, bias)
+        layers.append(layer)
+    return layers
+
+
+def fill_dense_models(nn_models, sandbox_globals):
+    """
+    Hand-written dense networks found by the source analysis get their layers
+    from the weights the program left in its globals: real sizes, parameter
+    counts and a weight_summary() each, never the matrices themselves.
+    """
+    for m in nn_models:
+        weights = sandbox_globals.get(m.pop("weights_var", None))
+        biases = sandbox_globals.get(m.pop("biases_var", None))
+        if weights is None:
+            continue
+        try:
+            layers = dense_layers(importlib.import_module("numpy"), weights, biases)
+        except Exception:
+            continue
+        if layers:
+            m["layers"] = layers
+            m["parameters"] = sum(layer["parameters"] for layer in layers)
+
+
+class ActivationRecorder:
+    """
+    Summaries of module outputs seen during the user's own forward calls,
+    the latest call per module. A global forward hook is registered for the
+    run only and ignores calls made outside this run's trace session (other
+    requests served by the same process). Once max_bytes worth of summaries
+    are kept, modules that weren't seen yet are skipped.
+    """
+
+    def __init__(self, session, max_bytes=ACTIVATION_KB * 1024):
+        self.session = session
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.layers = {} # id(module) -> (module, summary, calls)
+        self.torch = None
+        self.handle = None
+
+    def start(self):
+        try:
+            self.torch = importlib.import_module("torch")
+        except ImportError:
+            return
+        self.handle = self.torch.nn.modules.module.register_module_forward_hook(self.on_forward)
+
+    def stop(self):
+        if self.handle is not None:
+            self.handle.remove()
+            self.handle = None
+
+    def on_forward(self, module, inputs, output):
+        if tracer.current_session() is not self.session:
+            return
+        key = id(module)
+        seen = self.layers.get(key)
+        if seen is None and self.nbytes >= self.max_bytes:
+            return
+
+        summary = activation_summary(self.torch, output)
+        if summary is None:
+            return
+        if seen is None:
+            # rough JSON size of one summary
+            self.nbytes += 160 + 8 * ACTIVATION_BINS + 8 * len(summary["shape"])
+            self.layers[key] = (module, summary, 1)
+        else:
+            self.layers[key] = (module, summary, seen[2] + 1)
+
+    def summary(self, module):
+        seen = self.layers.get(id(module))
+        if seen is None or seen[0] is not module:
+            return None
+        return {**seen[1], "calls": seen[2]}
+
+
+def describe_layer(path, module, recorder):
+    layer = {"name": path, "layer": type(module).__name__}
+    for key, attrs in LAYER_SIZES.items():
+        for attr in attrs:
+            size = getattr(module, attr, None)
+            if isinstance(size, int):
+                layer[key] = size
+                break
+
+    params = list(module.named_parameters(recurse=False))
+    layer["parameters"] = count(p for _, p in params)
+    # a lazy module's shapes are unknown until its first forward
+    layer["params"] = {name: list(p.shape) if layer["parameters"] is not None else None for name, p in params}
+
+    # Linear-style weights get the same compact summary as dense networks
+    params = dict(params)
+    weight = params.get("weight")
+    if layer["parameters"] is not None and weight is not None and weight.dim() == 2:
+        np = importlib.import_module("numpy")
+        matrix = as_matrix(np, weight)
+        if matrix is not None:
+            layer["weights"] = weight_summary(np, matrix)
+            bias = as_bias(np, params.get("bias"), matrix.shape[0])
+            if bias is not None:
+                layer["bias"] = stats(np, bias)
+
+    activation = recorder.summary(module) if recorder is not None else None
+    if activation is not None:
+        layer["activation"] = activation
+    return layer
+
+
+def describe_model(name, model, recorder=None):
+    # leaf modules in registration order, containers only group them
+    layers = [
+        describe_layer(path or name, module, recorder)
+        for path, module in model.named_modules()
+        if next(module.children(), None) is None
+    ]
+    params = list(model.parameters())
+    described = {
+        "model_name": name,
+        "type": type(model).__name__,
+        "source": "runtime",
+        "parameters": count(params),
+        "trainable": count(p for p in params if p.requires_grad),
+        "layers": layers
+    }
+    activation = recorder.summary(model) if recorder is not None else None
+    if activation is not None:
+        described["activation"] = activation
+    return described
+
+
+def runtime_models(sandbox_globals, recorder=None):
+    """
+    Every torch.nn.Module the program left in its globals, except those that
+    are part of another one (a layer assigned to its own name before going
+    into a Sequential is described as part of the model).
+    """
+    torch = sys.modules.get("torch")
+    if torch is None:
+        return []
+
+    found = {}
+    for name, value in list(sandbox_globals.items()):
+        if isinstance(value, torch.nn.Module) and id(value) not in found:
+            found[id(value)] = (name, value)
+
+    nested = {id(sub) for _, model in found.values() for sub in list(model.modules())[1:]}
+    return [
+        describe_model(name, model, recorder)
+        for key, (name, model) in found.items()
+        if key not in nested
+    ]
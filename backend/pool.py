@@ -0,0 +1,272 @@
+import os
+import time
+import queue
+import importlib
+import threading
+import multiprocessing
+
+from budgets import rss_bytes
+
+# Worker processes running user programs, so a runaway or crashing program
+# can't take the Flask process down with it. Every worker imports executor
+# (numpy, torch, sympy) once and then serves many runs.
+POOL_SIZE = int(os.environ.get("DHRISTI_WORKERS", os.cpu_count() or 1)) # 0 runs code in-process
+MAX_RUNS = int(os.environ.get("DHRISTI_WORKER_MAX_RUNS", 100)) # runs before a worker is replaced
+MAX_RSS_MB = int(os.environ.get("DHRISTI_WORKER_MAX_RSS_MB", 1024)) # resident memory before a worker is replaced
+# seconds before a run is killed, a backstop behind the budgets enforced by the tracer
+RUN_TIMEOUT = float(os.environ.get("DHRISTI_WORKER_TIMEOUT", 60))
+# seconds between checks of a run's cancel event while waiting on its worker
+CANCEL_POLL = 0.1
+# str and bytes hashes, and with them the iteration order of sets of
+# strings, are salted per process. Every worker gets this seed so a program
+# traces the same in any of them, and after a restart.
+HASH_SEED = os.environ.get("DHRISTI_HASH_SEED", "0")
+# the seed of this process: fixed by PYTHONHASHSEED or random
+PROCESS_SEED = os.environ.get("PYTHONHASHSEED", "random")
+
+# executor imports the scientific stack lazily, workers load it up front so
+# no run pays for it
+PRELOAD_MODULES = [m for m in os.environ.get("DHRISTI_PRELOAD", "numpy,torch,sympy").split(",") if m]
+
+WARM_UP_CODE = "warm_up = [1, 2, 3]\n"
+
+def worker_main(conn):
+    import executor
+    for name in PRELOAD_MODULES:
+        importlib.import_module(name)
+
+    # first run pays for the lazy imports inside numpy / torch / sympy
+    executor.run_code(WARM_UP_CODE)
+    conn.send(rss_bytes())
+
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+
+        # streamed runs send their messages one by one, both end with "end"
+        mode, kwargs = job
+        if mode == "stream":
+            for message in executor.run_code_stream(**kwargs):
+                conn.send(("message", message))
+            conn.send(("end", None, rss_bytes()))
+        elif mode == "tile":
+            conn.send(("end", executor.run_code_tile(**kwargs), rss_bytes()))
+        elif mode == "calls":
+            conn.send(("end", executor.run_code_calls(**kwargs), rss_bytes()))
+        else:
+            conn.send(("end", executor.run_code(**kwargs), rss_bytes()))
+
+def process_context():
+    # forkserver forks every worker from one clean process that already
+    # imported executor and the preloaded modules, spawn is the only option
+    # on Windows
+    methods = multiprocessing.get_all_start_methods()
+    if "forkserver" in methods:
+        ctx = multiprocessing.get_context("forkserver")
+        ctx.set_forkserver_preload(["executor", *PRELOAD_MODULES])
+        return ctx
+    return multiprocessing.get_context("spawn")
+
+
+class Cancelled(Exception):
+    pass
+
+
+class Worker:
+    def __init__(self, ctx):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+        self.ready = False
+        self.runs = 0
+        self.rss = 0
+
+    def request(self, mode, kwargs, timeout, cancelled=None):
+        # yields ("message", message) for streamed runs, then ("end", result).
+        # Raises Cancelled soon after the cancelled event is set.
+        if not self.ready:
+            # warm-up happens in the background, only wait if it isn't done yet
+            self.rss = self.conn.recv()
+            self.ready = True
+
+        self.conn.send((mode, kwargs))
+        deadline = time.monotonic() + timeout
+        while True:
+            if cancelled is not None and cancelled.is_set():
+                raise Cancelled()
+            remaining = max(0, deadline - time.monotonic())
+            wait = remaining if cancelled is None else min(remaining, CANCEL_POLL)
+            if not self.conn.poll(wait):
+                if wait < remaining:
+                    continue
+                raise TimeoutError(f"Execution exceeded {timeout:g} seconds")
+
+            reply = self.conn.recv()
+            if reply[0] == "end":
+                _, result, self.rss = reply
+                self.runs += 1
+                yield "end", result
+                return
+            yield reply
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.conn.close()
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.kill()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class WorkerPool:
+    """
+    Fixed number of pre-started workers. execute() hands a run to an idle
+    worker and blocks until it finishes. Workers that served MAX_RUNS runs or
+    grew past MAX_RSS_MB are replaced after the run, workers that crash or
+    time out are killed and replaced right away.
+    """
+
+    def __init__(self, size=POOL_SIZE, max_runs=MAX_RUNS, max_rss_mb=MAX_RSS_MB, timeout=RUN_TIMEOUT):
+        # inherited by the forkserver or each spawned worker
+        os.environ["PYTHONHASHSEED"] = HASH_SEED
+        self.ctx = process_context()
+        self.max_runs = max_runs
+        self.max_rss = max_rss_mb * 1024 * 1024
+        self.timeout = timeout
+        self.idle = queue.Queue()
+        self.workers = []
+        self.lock = threading.Lock()
+
+        for _ in range(size):
+            self.idle.put(self.spawn())
+
+    def spawn(self):
+        worker = Worker(self.ctx)
+        with self.lock:
+            self.workers.append(worker)
+        return worker
+
+    def retire(self, worker, kill=False):
+        with self.lock:
+            self.workers.remove(worker)
+        if kill:
+            worker.kill()
+        else:
+            worker.stop()
+        self.idle.put(self.spawn())
+
+    def release(self, worker):
+        if worker.runs >= self.max_runs or worker.rss > self.max_rss:
+            self.retire(worker)
+        else:
+            self.idle.put(worker)
+
+    def execute(self, mode="run", **kwargs):
+        worker = self.idle.get()
+        try:
+            for kind, result in worker.request(mode, kwargs, self.timeout):
+                pass
+        except TimeoutError as e:
+            self.retire(worker, kill=True)
+            return {"success": False, "error": str(e), "traceback": ""}
+        except (EOFError, OSError):
+            self.retire(worker, kill=True)
+            return {"success": False, "error": "Execution process crashed", "traceback": ""}
+
+        self.release(worker)
+        return result
+
+    def stream(self, cancelled=None, **kwargs):
+        worker = self.idle.get()
+        finished = False
+        try:
+            for kind, message in worker.request("stream", kwargs, self.timeout, cancelled):
+                if kind == "message":
+                    yield message
+            finished = True
+        except Cancelled:
+            return
+        except TimeoutError as e:
+            yield {"type": "error", "error": str(e), "traceback": ""}
+        except (EOFError, OSError):
+            yield {"type": "error", "error": "Execution process crashed", "traceback": ""}
+        finally:
+            # a worker left mid-run (timeout, crash, client gone) can't be reused
+            if finished:
+                self.release(worker)
+            else:
+                self.retire(worker, kill=True)
+
+    def shutdown(self):
+        with self.lock:
+            workers = list(self.workers)
+            self.workers.clear()
+        for worker in workers:
+            worker.stop()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    # created on first use, never at import: spawned workers re-import app.py
+    global _pool
+    with _pool_lock:
+        if _pool is None and POOL_SIZE > 0:
+            _pool = WorkerPool()
+        return _pool
+
+def hash_seed():
+    # the hash seed runs execute with, None when it differs per process
+    if POOL_SIZE > 0:
+        return HASH_SEED
+    return None if PROCESS_SEED == "random" else PROCESS_SEED
+
+def warm_start():
+    # start workers in the background, called from app.py's __main__ block
+    # and never at import: spawn and forkserver re-import the main module
+    if POOL_SIZE > 0:
+        threading.Thread(target=get_pool, daemon=True).start()
+
+def execute(**kwargs):
+    pool = get_pool()
+    if pool is None:
+        import executor
+        return executor.run_code(**kwargs)
+    return pool.execute(**kwargs)
+
+def tile(**kwargs):
+    pool = get_pool()
+    if pool is None:
+        import executor
+        return executor.run_code_tile(**kwargs)
+    return pool.execute("tile", **kwargs)
+
+def calls(**kwargs):
+    pool = get_pool()
+    if pool is None:
+        import executor
+        return executor.run_code_calls(**kwargs)
+    return pool.execute("calls", **kwargs)
+
+def stream(cancelled=None, **kwargs):
+    # cancelled: threading.Event that stops a pooled run and kills its worker,
+    # an in-process run stops once its generator is closed
+    pool = get_pool()
+    if pool is None:
+        import executor
+        return executor.run_code_stream(**kwargs)
+    return pool.stream(cancelled, **kwargs)
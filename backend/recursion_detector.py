@@ -1,36 +1,39 @@
 import ast
 from collections import defaultdict
 
-def is_recursive_function(func_node):
-    if not isinstance(func_node, ast.FunctionDef):
-        return False
-    
-    func_name = func_node.name
-
-    for node in ast.walk(func_node):
-        if isinstance(node, ast.Call):
-            if isinstance(node.func, ast.Name) and node.func.id == func_name:
-                return True
-            
-    return False
-
-
-def extract_recursive_function(code):
-    try:
-        tree = ast.parse(code)
-    except:
-        return []
-    
-    recursive_funcs = []
-
-    for node in ast.walk(tree):
+from ast_utils import Detector
+
+
+def contains(func_node, node):
+    # source position of node lies inside the function definition
+    start = (func_node.lineno, func_node.col_offset)
+    end = (func_node.end_lineno, func_node.end_col_offset)
+    return start <= (node.lineno, node.col_offset) < end
+
+
+class RecursionDetector(Detector):
+    # functions that call themselves by name somewhere in their body
+    name = "recursive_funcs"
+    node_types = (ast.FunctionDef, ast.Call)
+
+    def begin(self, tree):
+        self.functions = []
+        self.calls = defaultdict(list) # called name -> call nodes
+
+    def visit(self, node):
         if isinstance(node, ast.FunctionDef):
-            if is_recursive_function(node):
+            self.functions.append(node)
+        elif isinstance(node.func, ast.Name):
+            self.calls[node.func.id].append(node)
+
+    def result(self):
+        recursive_funcs = []
+
+        for func_node in self.functions:
+            if any(contains(func_node, call) for call in self.calls.get(func_node.name, ())):
                 recursive_funcs.append({
-                    "name" : node.name,
-                    "lineno" : node.lineno
+                    "name" : func_node.name,
+                    "lineno" : func_node.lineno
                 })
 
-    return recursive_funcs
-
-    
\ No newline at end of file
+        return recursive_funcs
@@ -1,89 +1,272 @@
-import json
-import numpy as np
-import torch
-import io
+import os
+import sys
+import base64
+import datetime
+from decimal import Decimal
+from fractions import Fraction
+from functools import singledispatch
+from itertools import chain
 
-def safe_json(value, max_elements=30):
-    if hasattr(value, '__class__') and 'torch.nn' in str(type(value)):
+from array_summary import lod_summary, to_array
+
+# values json can write as they are, returned without any further look
+PLAIN_SCALARS = frozenset({str, int, float, bool, type(None)})
+ROW_TYPES = frozenset({list, tuple})
+
+# nesting depth up to which containers are checked item by item
+MAX_DEPTH = 100
+
+# array types get their dispatch entry once numpy / torch show up in sys.modules
+_registered_modules = set()
+
+_MISSING = object()
+
+# element cutoff for arrays sent as raw buffers, above it only a summary is sent
+BINARY_MAX_ELEMENTS = int(os.environ.get("DHRISTI_BINARY_MAX_ELEMENTS", 4096))
+
+# numpy dtype kinds the browser can view as a typed array (float16 excluded below)
+BINARY_KINDS = "biuf"
+
+
+def safe_json(value, max_elements=30, memo=None, binary=False):
+    """
+    JSON-safe form of a traced value. Arrays and tensors become a dict of
+    their values (or a summary when larger than max_elements), containers of
+    plain values are returned as they are, anything else becomes its repr.
+
+    With binary, numeric arrays and tensors carry "binary": {"dtype", "shape",
+    "data"} instead of "values", data being the base64 of their little-endian
+    buffer. Nothing is converted element by element.
+
+    memo maps id(value) -> result. Stored snapshot copies are shared by every
+    step where they didn't change, so with one memo per request each of them
+    is only serialized once. Only pass it for values that stay alive and are
+    never mutated while the memo is in use.
+    """
+    if type(value) in PLAIN_SCALARS:
+        return value
+    if memo is None:
+        return encode(value, max_elements, binary)
+
+    key = id(value)
+    result = memo.get(key, _MISSING)
+    if result is _MISSING:
+        result = memo[key] = encode(value, max_elements, binary)
+    return result
+
+
+def binary_buffer(array):
+    # None for dtypes without a typed array in the browser (object, complex, float16, ...)
+    dtype = array.dtype
+    if dtype.kind not in BINARY_KINDS or (dtype.kind == "f" and dtype.itemsize < 4):
+        return None
+    np = sys.modules["numpy"]
+    # copies only when the array is strided or big-endian
+    data = np.ascontiguousarray(array, dtype=dtype.newbyteorder("<"))
+    return {
+        "dtype": dtype.name,
+        "shape": list(array.shape),
+        "data": base64.b64encode(data.data).decode("ascii")
+    }
+
+
+def is_plain(value, ancestors=None):
+    # would json.dumps take it as it is (without a default= hook)?
+    # set(map(type, ...)) runs in C, lists of numbers and matrices of them
+    # never reach the Python loop
+    if type(value) in PLAIN_SCALARS:
+        return True
+    if isinstance(value, (list, tuple)):
+        items = value
+    elif isinstance(value, dict):
+        if not (set(map(type, value)) <= PLAIN_SCALARS
+                or all(isinstance(k, (str, int, float)) or k is None for k in value)):
+            return False
+        items = value.values()
+    else:
+        return isinstance(value, (str, int, float))
+
+    types = set(map(type, items))
+    if types <= PLAIN_SCALARS:
+        return True
+    if types <= ROW_TYPES and set(map(type, chain.from_iterable(items))) <= PLAIN_SCALARS:
+        return True
+
+    # circular and overly deep nesting fall back to repr, as json.dumps' errors did
+    if ancestors is None:
+        ancestors = set()
+    key = id(value)
+    if key in ancestors or len(ancestors) >= MAX_DEPTH:
+        return False
+    ancestors.add(key)
+    try:
+        return all(is_plain(v, ancestors) for v in items)
+    finally:
+        ancestors.discard(key)
+
+
+@singledispatch
+def encode(value, max_elements, binary):
+    # first time a numpy / torch type shows up, give it its own entry
+    if register_array_types():
+        handler = encode.dispatch(type(value))
+        if handler is not encode.dispatch(object):
+            return handler(value, max_elements, binary)
+
+    if 'torch.nn' in str(type(value)):
+        return encode_nn_model(value, max_elements, binary)
+    # str(value) for anything datetime-like
+    if hasattr(value, 'isoformat'):
+        return str(value)
+    return encode_plain(value)
+
+
+def encode_plain(value):
+    if is_plain(value):
+        return value
+    try:
+        return repr(value)
+    except Exception:
+        return object.__repr__(value)
+
+
+@encode.register(list)
+@encode.register(tuple)
+@encode.register(dict)
+def encode_container(value, max_elements, binary):
+    # one walk over the items, nothing is encoded just to see if it would work
+    if type(value) in (list, tuple, dict):
+        return encode_plain(value)
+    # subclasses may carry their own isoformat
+    return encode.dispatch(object)(value, max_elements, binary)
+
+
+@encode.register(datetime.date)
+@encode.register(datetime.time)
+@encode.register(Decimal)
+@encode.register(Fraction)
+def encode_str(value, max_elements, binary):
+    return str(value)
+
+
+def register_array_types():
+    # True when a newly imported module added entries to the dispatch table.
+    # Registering twice from two threads is harmless, so no lock.
+    added = False
+
+    np = sys.modules.get("numpy")
+    if np is not None and "numpy" not in _registered_modules:
+        encode.register(np.ndarray, encode_ndarray)
+        _registered_modules.add("numpy")
+        added = True
+
+    torch = sys.modules.get("torch")
+    if torch is not None and "torch" not in _registered_modules and hasattr(torch, "nn"):
+        encode.register(torch.Tensor, encode_tensor)
+        # Parameter is a Tensor, but has always been shown like a module
+        encode.register(torch.nn.Module, encode_nn_model)
+        encode.register(torch.nn.Parameter, encode_nn_model)
+        _registered_modules.add("torch")
+        added = True
+
+    return added
+
+
+def encode_nn_model(value, max_elements, binary):
+    # self inside a Module's __init__, before super().__init__() ran, has no
+    # submodules to print yet
+    model_repr = encode_plain(value)
+    try:
+        model_str = str(value)
+    except Exception:
+        model_str = model_repr
+    return {
+        "type" : "nn_model",
+        "model_repr" : model_repr,
+        "model_str" : model_str
+    }
+
+
+def encode_ndarray(value, max_elements, binary):
+    size = value.size
+
+    if binary and size <= max_elements:
+        buffer = binary_buffer(value)
+        if buffer is not None:
+            return {
+                "type": "ndarray",
+                "binary": buffer
+            }
+
+    if size <= max_elements:
         return {
-            "type" : "nn_model",
-            "model_repr" : repr(value),
-            "model_str" : str(value)
+            "type": "ndarray",
+            "values": value.tolist()
         }
-    # Handle datetime objects
-    if hasattr(value, 'isoformat'):  # datetime, date, time
-        return str(value)
-    
-    # Handle Decimal
-    if value.__class__.__name__ == 'Decimal':
-        return str(value)
-    
-    # Handle Fraction
-    if value.__class__.__name__ == 'Fraction':
-        return str(value)
-    
-    # Handle numpy arrays
-    if isinstance(value, np.ndarray):
-        size = value.size
-        
-        if size <= max_elements:
+    else:
+        try:
+            flat = value.ravel()
+            summary = {
+                "size": int(size),
+                "min": float(flat.min()),
+                "max": float(flat.max()),
+                "mean": float(flat.mean()),
+                "sample": flat[:min(6, size)].tolist()
+            }
+            # pooled thumbnail, histogram, quantiles, NaN / inf counts
+            summary.update(lod_summary(value))
             return {
                 "type": "ndarray",
-                "values": value.tolist()
+                "summary": summary
+            }
+        except:
+            return repr(value)
+
+
+def encode_tensor(value, max_elements, binary):
+    t = value
+    numel = t.numel()
+
+    # None for bfloat16 and the like, or when numpy isn't installed
+    array = to_array(t)
+
+    if binary and numel <= max_elements and array is not None:
+        buffer = binary_buffer(array)
+        if buffer is not None:
+            return {
+                "type": "torchtensor",
+                "shape": list(t.size()),
+                "dtype": str(t.dtype),
+                "binary": buffer
+            }
+
+    if numel <= max_elements:
+        tensor_value = t.cpu().detach().tolist()
+        return {
+            "type": "torchtensor",
+            # "__torch_tensor__": True,
+            "shape": list(t.size()),
+            "dtype": str(t.dtype),
+            "values": tensor_value
+        }
+    else:
+        try:
+            flat = t.cpu().detach().view(-1)
+            summary = {
+                "size": int(numel),
+                "min": float(flat.min().item()),
+                "max": float(flat.max().item()),
+                "mean": float(flat.float().mean().item()),
+                "sample": flat[:min(6, numel)].tolist()
             }
-        else:
-            try:
-                flat = value.ravel()
-                return {
-                    "type": "ndarray",
-                    "summary": {
-                        "size": int(size),
-                        "min": float(flat.min()),
-                        "max": float(flat.max()),
-                        "mean": float(flat.mean()),
-                        "sample": flat[:min(6, size)].tolist()
-                    }
-                }
-            except:
-                return repr(value)
-
-    # Handle torch tensors
-    if torch is not None and isinstance(value, torch.Tensor):
-        t = value
-        numel = t.numel()
-        
-        if numel <= max_elements:
-            tensor_value = t.cpu().detach().tolist()
+            if array is not None:
+                summary.update(lod_summary(array))
             return {
                 "type": "torchtensor",
                 # "__torch_tensor__": True,
                 "shape": list(t.size()),
                 "dtype": str(t.dtype),
-                "values": tensor_value
+                "summary": summary
             }
-        else:
-            try:
-                flat = t.cpu().detach().view(-1)
-                return {
-                    "type": "torchtensor",
-                    # "__torch_tensor__": True,
-                    "shape": list(t.size()),
-                    "dtype": str(t.dtype),
-                    "summary": {
-                        "size": int(numel),
-                        "min": float(flat.min().item()),
-                        "max": float(flat.max().item()),
-                        "mean": float(flat.float().mean().item()),
-                        "sample": flat[:min(6, numel)].tolist()
-                    }
-                }
-            except:
-                return repr(value)
-    
-    # Handle regular Python objects
-    try:
-        # Test if it's JSON serializable
-        json.dumps(value)
-        return value
-    except (TypeError, ValueError):
-        return repr(value)
\ No newline at end of file
+        except:
+            return repr(value)
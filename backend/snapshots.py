@@ -0,0 +1,307 @@
+import copy
+import sys
+import types
+from collections import deque
+from itertools import islice
+
+# Number of deltas that may chain onto a keyframe before a new full state is
+# written. Bounds how far resolve() has to walk back to rebuild a state.
+KEYFRAME_INTERVAL = 32
+
+# Nesting depth up to which containers are compared structurally, deeper
+# values (long linked lists) are treated as changed and copied again
+MAX_COMPARE_DEPTH = 100
+
+ATOMIC_TYPES = frozenset({int, float, complex, bool, str, bytes, type(None), range, type(Ellipsis)})
+
+# builtin containers that a shallow .copy() fully copies when every item is atomic
+SHALLOW_COPY_TYPES = (list, dict, set, bytearray, deque)
+
+# marks a stored value that is immutable, so the same object can never change
+IMMUTABLE = object()
+
+
+def all_atomic(items):
+    # set(map(type, ...)) runs in C, much cheaper than a Python-level loop
+    return set(map(type, items)) <= ATOMIC_TYPES
+
+
+def is_immutable(value, depth=0):
+    t = type(value)
+    if t in ATOMIC_TYPES:
+        return True
+    if (t is tuple or t is frozenset) and depth < MAX_COMPARE_DEPTH:
+        return all_atomic(value) or all(is_immutable(v, depth + 1) for v in value)
+    return False
+
+
+def copy_value(value, memo=None):
+    if type(value) in SHALLOW_COPY_TYPES:
+        if all_atomic(value.values() if type(value) is dict else value):
+            return value.copy()
+    try:
+        return copy.deepcopy(value, memo)
+    except Exception:
+        return value
+
+
+def approx_size(value):
+    # rough size of a stored copy: exact for arrays and tensors, containers
+    # count their own table plus a flat estimate per item
+    Tensor = tensor_type()
+    if Tensor is not None and isinstance(value, Tensor):
+        try:
+            return value.element_size() * value.nelement()
+        except ValueError:
+            # a lazy module's parameter before its first forward
+            return sys.getsizeof(value, 0)
+    nbytes = getattr(value, "nbytes", None)
+    if isinstance(nbytes, int):
+        return nbytes
+    size = sys.getsizeof(value, 0)
+    if isinstance(value, (list, tuple, dict, set, frozenset, deque)):
+        size += 32 * len(value)
+    return size
+
+
+def tensor_type():
+    # only look for torch if the user program (or the sandbox) imported it
+    torch = sys.modules.get("torch")
+    return torch.Tensor if torch is not None else None
+
+
+def version_token(value):
+    # torch bumps _version on every in-place op, comparing it is O(1)
+    Tensor = tensor_type()
+    if Tensor is not None and isinstance(value, Tensor):
+        try:
+            return (value._version, value.data_ptr(), tuple(value.shape), value.dtype)
+        except Exception:
+            return None
+    return None
+
+
+def plain_equal(a, b):
+    # C-level == on nested builtin containers; False when it raises (arrays inside)
+    try:
+        return (a == b) is True
+    except Exception:
+        return False
+
+
+def same_value(live, stored, depth=0, shared=None):
+    # Compares a live value against its last stored copy. Anything that can't
+    # be compared cleanly counts as changed. Mutable parts found equal are
+    # noted in shared (a deepcopy memo), so copies made in the same snapshot
+    # reuse the stored objects instead of copying them again.
+    if live is stored:
+        return True
+    t = type(live)
+    if t is not type(stored) or depth > MAX_COMPARE_DEPTH:
+        return False
+    if t in ATOMIC_TYPES:
+        return live == stored
+
+    equal = compare_structure(live, stored, t, depth, shared)
+    if equal and shared is not None:
+        shared[id(live)] = stored
+    return equal
+
+
+def compare_structure(live, stored, t, depth, shared):
+    try:
+        if isinstance(live, (list, tuple, deque)):
+            if len(live) != len(stored):
+                return False
+            if plain_equal(live, stored):
+                return True
+            if all_atomic(live):
+                return False
+            # user objects or arrays inside, compare item by item
+            return all(same_value(a, b, depth + 1, shared) for a, b in zip(live, stored))
+
+        if isinstance(live, (set, frozenset)):
+            return live == stored
+
+        if isinstance(live, dict):
+            if live.keys() != stored.keys():
+                return False
+            if plain_equal(live, stored):
+                return True
+            if all_atomic(live.values()):
+                return False
+            return all(same_value(v, stored[k], depth + 1, shared) for k, v in live.items())
+
+        Tensor = tensor_type()
+        if Tensor is not None and isinstance(live, Tensor):
+            import torch
+            return live.shape == stored.shape and live.dtype == stored.dtype and torch.equal(live, stored)
+
+        if hasattr(live, "shape") and hasattr(live, "dtype"):
+            # numpy arrays
+            import numpy as np
+            return live.shape == stored.shape and live.dtype == stored.dtype and np.array_equal(live, stored)
+
+        if hasattr(live, "__dict__"):
+            # user objects are compared by their attributes, whatever their
+            # __eq__ says: it may ignore some of them, and it would run user
+            # code inside the trace callback
+            return same_value(vars(live), vars(stored), depth + 1, shared)
+
+        if isinstance(t.__eq__, types.FunctionType):
+            # an __eq__ written in Python, nothing to rely on, copied again
+            return False
+
+        result = live == stored
+        return result if isinstance(result, bool) else False
+    except Exception:
+        return False
+
+
+class SnapshotStore:
+    """
+    Variable snapshots stored as deltas between consecutive events.
+
+    Each chain key (one per traced frame) keeps the live values and copies of
+    its last snapshot. record() only copies names that were added, rebound or
+    mutated since then and returns the previous id when nothing changed, so
+    memory grows with the changes rather than with steps x state size.
+    Immutable values are stored by reference and unchanged containers keep
+    sharing the copy made when they last changed. Full states are rebuilt on
+    demand by resolve().
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._parents = []   # snapshot id this delta applies to, None for keyframes
+        self._changes = []   # name -> copied value, added or changed since the parent
+        self._removed = []   # names dropped since the parent
+        self._depth = []     # deltas since the last keyframe
+        self._heads = {}     # chain key -> (snapshot id, live values, copies, tokens)
+        self._resolved = (None, None)
+        self.nbytes = 0      # approximate size of every copy made so far
+
+    def __len__(self):
+        return len(self._parents)
+
+    def _append(self, parent, changes, removed, depth):
+        self._parents.append(parent)
+        self._changes.append(changes)
+        self._removed.append(removed)
+        self._depth.append(depth)
+        return len(self._parents) - 1
+
+    def store_value(self, value, memo):
+        # returns the value to keep and the token used to spot later changes
+        if is_immutable(value):
+            return value, IMMUTABLE
+        before = len(memo)
+        stored = copy_value(value, memo)
+
+        # deepcopy memoizes every object it creates, in order, so the tail of
+        # the memo is exactly what this copy added (shared parts excluded)
+        added = len(memo) - before
+        if added:
+            self.nbytes += sum(map(approx_size, islice(reversed(memo.values()), added)))
+        else:
+            self.nbytes += approx_size(stored)
+        return stored, version_token(value)
+
+    def unchanged(self, value, prev_value, stored, token, memo):
+        if value is not prev_value:
+            return False
+        if token is IMMUTABLE:
+            return True
+        if token is not None:
+            if token == version_token(value):
+                memo[id(value)] = stored
+                return True
+            return False
+        return same_value(value, stored, 0, memo)
+
+    def record(self, key, variables):
+        head = self._heads.get(key)
+        memo = {} # live object id -> stored copy, shared by every value in this snapshot
+
+        if head is None:
+            copies = {}
+            tokens = {}
+            for name, value in variables.items():
+                copies[name], tokens[name] = self.store_value(value, memo)
+            snap_id = self._append(None, copies, (), 0)
+            self._heads[key] = (snap_id, dict(variables), copies, tokens)
+            return snap_id
+
+        head_id, live, prev_copies, prev_tokens = head
+        tokens = {}
+        changed = []
+        for name, value in variables.items():
+            if name in live and self.unchanged(value, live[name], prev_copies[name], prev_tokens[name], memo):
+                tokens[name] = prev_tokens[name]
+            else:
+                changed.append(name)
+
+        # copied after every unchanged value was seen, so they can share its parts
+        changes = {}
+        for name in changed:
+            changes[name], tokens[name] = self.store_value(variables[name], memo)
+
+        removed = tuple(name for name in prev_copies if name not in variables)
+        if not changes and not removed:
+            return head_id
+
+        copies = {
+            name: changes[name] if name in changes else prev_copies[name]
+            for name in variables
+        }
+
+        depth = self._depth[head_id] + 1
+        if depth >= KEYFRAME_INTERVAL:
+            # keyframe shares the existing copies, nothing is copied again
+            snap_id = self._append(None, copies, (), 0)
+        else:
+            snap_id = self._append(head_id, changes, removed, depth)
+
+        self._heads[key] = (snap_id, dict(variables), copies, tokens)
+        return snap_id
+
+    def release(self, key):
+        # frame is gone, drop the live references held for diffing
+        self._heads.pop(key, None)
+
+    def delta(self, snap_id):
+        # (parent id, changed name -> stored copy, removed names) as recorded
+        return self._parents[snap_id], self._changes[snap_id], self._removed[snap_id]
+
+    def resolve(self, snap_id):
+        if snap_id is None:
+            return None
+
+        cached_id, cached_state = self._resolved
+        if cached_id == snap_id:
+            return dict(cached_state)
+
+        # walk back to a keyframe, or to the last resolved state if it is an ancestor
+        chain = []
+        cur = snap_id
+        while cur is not None and cur != cached_id:
+            chain.append(cur)
+            cur = self._parents[cur]
+
+        if cur is None:
+            state = {}
+        else:
+            state = dict(cached_state)
+
+        for sid in reversed(chain):
+            if self._parents[sid] is None:
+                state = dict(self._changes[sid])
+                continue
+            for name in self._removed[sid]:
+                state.pop(name, None)
+            state.update(self._changes[sid])
+
+        self._resolved = (snap_id, state)
+        return dict(state)
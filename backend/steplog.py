@@ -0,0 +1,76 @@
+from array import array
+
+# event kinds stored in StepLog.kind
+CALL, LINE, RETURN, FOLD = range(4)
+EVENTS = ("call", "line", "return", "fold")
+
+# kind of a slot whose step was folded into a loop summary
+FOLDED = -1
+
+# stands in for None in the integer columns
+MISSING = -1
+
+
+class StepLog:
+    """
+    Execution log stored column-wise instead of one dict per step.
+
+    Every step is a row across parallel typed arrays: event kind, line number,
+    call id, function name index and the ids of its before/after snapshots in
+    the session's SnapshotStore. Function names are interned once, return
+    values and fold summaries are only kept for the few steps that have them.
+    Source lines and formulas are looked up by line number when the response
+    is built, so they are never copied per step.
+    """
+
+    def __init__(self):
+        self.kind = array("b")
+        self.lineno = array("i")
+        self.call_id = array("q")
+        self.func = array("i")
+        self.before = array("q")
+        self.after = array("q")
+
+        self.func_names = [] # interned function names, indexed by self.func
+        self._func_index = {}
+        self.return_values = {} # step index -> value returned by a "return" step
+        self.folds = {} # step index -> summary of a "fold" step
+
+    def __len__(self):
+        return len(self.kind)
+
+    def intern_func(self, name):
+        index = self._func_index.get(name)
+        if index is None:
+            index = len(self.func_names)
+            self.func_names.append(name)
+            self._func_index[name] = index
+        return index
+
+    def append(self, kind, func, lineno, call_id, before=None):
+        self.kind.append(kind)
+        self.lineno.append(MISSING if lineno is None else lineno)
+        self.call_id.append(MISSING if call_id is None else call_id)
+        self.func.append(self.intern_func(func))
+        self.before.append(MISSING if before is None else before)
+        self.after.append(MISSING)
+        return len(self.kind) - 1
+
+    def drop(self, index):
+        # slot of a folded loop iteration, skipped when the response is built
+        self.kind[index] = FOLDED
+        self.return_values.pop(index, None)
+
+    def get(self, column, index):
+        value = column[index]
+        return None if value == MISSING else value
+
+    def event(self, index):
+        return EVENTS[self.kind[index]]
+
+    def func_name(self, index):
+        return self.func_names[self.func[index]]
+
+    def live_indices(self):
+        kind = self.kind
+        return (i for i in range(len(kind)) if kind[i] != FOLDED)
@@ -0,0 +1,77 @@
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import executor
+
+SWALLOWED = """
+x = 0
+while True:
+    try:
+        x += 1
+    except BaseException:
+        pass
+"""
+
+SWALLOWED_IN_CALL = """
+def step(n):
+    return n + 1
+
+x = 0
+while True:
+    try:
+        x = step(x)
+    except:
+        pass
+"""
+
+
+# try / finally can't keep the program going, the budget stops it inside
+UNCAUGHT = """
+x = 0
+try:
+    while True:
+        x += 1
+finally:
+    done = True
+"""
+
+
+class SwallowedBudgetTest(unittest.TestCase):
+    # a program that catches BudgetExceeded still ends at its budget
+
+    def run_program(self, code, budget):
+        start = time.monotonic()
+        result = executor.run_code(code, budget=budget)
+        return result, time.monotonic() - start
+
+    def test_seconds(self):
+        for code in (SWALLOWED, SWALLOWED_IN_CALL, UNCAUGHT):
+            result, elapsed = self.run_program(code, {"seconds": 0.5})
+            self.assertTrue(result["success"])
+            self.assertEqual(result["truncated"], {"reason": "seconds", "limit": 0.5})
+            self.assertLess(elapsed, 5)
+
+    def test_steps_records_nothing_after_the_trip(self):
+        result, elapsed = self.run_program(SWALLOWED, {"steps": 1000})
+        self.assertEqual(result["truncated"], {"reason": "steps", "limit": 1000})
+        self.assertLessEqual(len(result["steps"]), 1000)
+        self.assertLess(elapsed, 5)
+
+    def test_stream(self):
+        messages = list(executor.run_code_stream(SWALLOWED, budget={"steps": 1000}))
+        self.assertEqual(messages[-1]["type"], "done")
+        self.assertEqual(messages[-1]["truncated"], {"reason": "steps", "limit": 1000})
+
+    def test_next_run_is_traced(self):
+        self.run_program(SWALLOWED, {"steps": 100})
+        result, _ = self.run_program("a = 1\nb = a + 1\n", None)
+        self.assertIsNone(result["truncated"])
+        self.assertEqual([step["lineno"] for step in result["steps"] if step["event"] == "line"], [1, 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,158 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cache
+from cache import ResultCache, cache_key, is_cacheable, is_deterministic
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+OPTIONS = {
+    "code": "x = 1\n",
+    "fold_loops": False,
+    "fold_head": 3,
+    "fold_tail": 3,
+    "trace_modules": [],
+    "budget": {"steps": 100.0},
+    "trace_scope": "all"
+}
+
+
+class CacheKeyTest(unittest.TestCase):
+
+    def test_same_options_same_key(self):
+        reordered = dict(reversed(list(OPTIONS.items())))
+        self.assertEqual(cache_key(OPTIONS), cache_key(reordered))
+
+    def test_every_option_is_keyed(self):
+        keys = {cache_key(OPTIONS)}
+        for name, value in [("code", "x = 2\n"), ("fold_loops", True), ("fold_head", 4), ("budget", {}), ("trace_scope", "visualized")]:
+            keys.add(cache_key({**OPTIONS, name: value}))
+        self.assertEqual(len(keys), 6)
+
+    def run_keys(self, seeds, workers):
+        # the key of the same request in a server process per hash seed
+        script = "import cache, sys, json; print(cache.cache_key(json.loads(sys.argv[1])))"
+        keys = []
+        for seed in seeds:
+            env = {**os.environ, "DHRISTI_WORKERS": workers}
+            env.pop("PYTHONHASHSEED", None)
+            if seed is not None:
+                env["PYTHONHASHSEED"] = seed
+            keys.append(subprocess.run(
+                [sys.executable, "-c", script, json.dumps(OPTIONS)], cwd=BACKEND,
+                env=env, capture_output=True, text=True, check=True
+            ).stdout.strip())
+        return keys
+
+    def test_stable_across_processes(self):
+        # workers run with pool.HASH_SEED whatever the server's own seed
+        self.assertEqual(len(set(self.run_keys(["1", "2", None], "2"))), 1)
+        # in-process runs with a fixed seed match across restarts
+        self.assertEqual(len(set(self.run_keys(["1", "1"], "0"))), 1)
+
+    def test_random_seed_in_process_is_not_shared(self):
+        # a set of strings iterates differently in another process
+        keys = self.run_keys([None, None, "1", "2"], "0")
+        self.assertEqual(len(set(keys)), 4)
+
+    def test_workers_share_one_seed(self):
+        script = (
+            "import pool\n"
+            "if __name__ == '__main__':\n"
+            "    code = 'names = list({\"alpha\", \"beta\", \"gamma\", \"delta\", \"epsilon\"})\\n'\n"
+            "    print({str(pool.execute(code=code)['steps'][-1]['after']['names']) for _ in range(4)})\n"
+        )
+        orders = set()
+        for seed in ("1", "2"):
+            env = {**os.environ, "DHRISTI_WORKERS": "2", "DHRISTI_PRELOAD": "", "PYTHONHASHSEED": seed}
+            orders.add(subprocess.run(
+                [sys.executable, "-c", script], cwd=BACKEND, env=env, capture_output=True, text=True, check=True, timeout=100
+            ).stdout.strip())
+        self.assertEqual(len(orders), 1)
+        self.assertEqual(orders.pop().count("["), 1)
+
+    def test_trace_modules_are_not_cached(self):
+        self.assertIsNone(cache_key({**OPTIONS, "trace_modules": ["mymod"]}))
+
+
+class DeterministicTest(unittest.TestCase):
+
+    def test_rejected(self):
+        for code in [
+            "import random\nx = random.random()\n",
+            "from time import time\nt = time()\n",
+            "import os.path\n",
+            "x = random.randint(0, 9)\n", # the sandbox pre-imports random
+            "x = id([])\n",
+            "x = hash('a')\n",
+            "import numpy as np\nx = np.random.rand(3)\n",
+            "import torch\nx = torch.randn(3)\n",
+            "x = rng.shuffle(a)\n",
+        ]:
+            self.assertFalse(is_deterministic(code), code)
+
+    def test_accepted(self):
+        for code in ["x = 1\n", "import numpy as np\nx = np.arange(3) * 2\n", "def f(n):\n    return n\n", "x = (\n"]:
+            self.assertTrue(is_deterministic(code), code)
+
+    def test_cacheable_results(self):
+        self.assertTrue(is_cacheable({"success": True, "truncated": None}))
+        self.assertTrue(is_cacheable({"success": True, "truncated": {"reason": "steps", "limit": 10}}))
+        self.assertFalse(is_cacheable({"success": False}))
+        self.assertFalse(is_cacheable({"success": True, "formulas_timed_out": 1}))
+        for reason in ("seconds", "rss_mb", "cancelled"):
+            self.assertFalse(is_cacheable({"success": True, "truncated": {"reason": reason, "limit": 1}}))
+
+
+class ResultCacheTest(unittest.TestCase):
+
+    def test_least_recently_used_is_evicted(self):
+        results = ResultCache(40)
+        results.max_entry = 40
+        for key in "abc":
+            results.put(key, b"x" * 10)
+        results.get("a")
+        results.put("d", b"x" * 15)
+        self.assertEqual(list(results.entries), ["c", "a", "d"])
+        self.assertEqual(results.nbytes, 35)
+        self.assertIsNone(results.get("b"))
+
+    def test_too_large_entry_is_not_kept(self):
+        results = ResultCache(100)
+        results.put("big", b"x" * 26)
+        self.assertIsNone(results.get("big"))
+        self.assertEqual(results.nbytes, 0)
+
+    def test_disk_tier_outlives_eviction(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        results = ResultCache(20, directory)
+        results.max_entry = 20
+        results.put("a" * 64, b"1" * 15)
+        results.put("b" * 64, b"2" * 15)
+        self.assertNotIn("a" * 64, results.entries)
+
+        # read back from disk into the memory tier, and by a new process' cache
+        self.assertEqual(results.get("a" * 64), b"1" * 15)
+        self.assertIn("a" * 64, results.entries)
+        self.assertEqual(ResultCache(20, directory).get("b" * 64), b"2" * 15)
+        self.assertEqual([name for _, _, files in os.walk(directory) for name in files if name.endswith(".tmp")], [])
+
+    def test_store_and_lookup(self):
+        key = cache_key({**OPTIONS, "code": "y = 'cache test'\n"})
+        self.assertIsNone(cache.lookup(key))
+        self.assertIsNone(cache.store(key, {"success": False}))
+        payload = cache.store(key, {"success": True, "steps": []})
+        self.assertEqual(cache.lookup(key), payload)
+        self.assertIsNone(cache.lookup(None))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+import os
+import sys
+import json
+import time
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from jobs import JobQueue, QueueFull, FINISHED
+
+
+def steps(count):
+    # a source of count one-step batches and a done message
+    def source(cancelled):
+        for i in range(count):
+            yield {"type": "steps", "steps": [i], "calls": []}
+        yield {"type": "done", "truncated": None}
+    return source
+
+
+def blocked(release, closed=None):
+    # a source that sends a batch every 10 ms until release is set
+    def source(cancelled):
+        try:
+            while not release.is_set():
+                yield {"type": "steps", "steps": [0], "calls": []}
+                time.sleep(0.01)
+            yield {"type": "done"}
+        finally:
+            if closed is not None:
+                closed.set()
+    return source
+
+
+def wait_for(job, statuses=FINISHED, seconds=5):
+    deadline = time.monotonic() + seconds
+    while job.status not in statuses:
+        if time.monotonic() > deadline:
+            raise AssertionError(f"job still {job.status}")
+        time.sleep(0.01)
+
+
+class JobQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+
+    def test_view(self):
+        jobs = JobQueue(slots=1, max_queued=1)
+        job = jobs.submit(steps(3))
+        wait_for(job)
+        view = json.loads(job.view())
+        self.assertEqual(view["status"], "done")
+        self.assertEqual(view["progress"]["steps"], 3)
+        self.assertEqual(view["next"], 4)
+        self.assertEqual([m["type"] for m in view["messages"]], ["steps"] * 3 + ["done"])
+
+        view = json.loads(job.view(since=2, position=0))
+        self.assertEqual(view["messages"], [{"type": "steps", "steps": [2], "calls": []}, {"type": "done", "truncated": None}])
+        self.assertEqual(view["position"], 0)
+        self.assertEqual(json.loads(job.view(since=9))["messages"], [])
+
+    def test_full_queue_is_refused(self):
+        jobs = JobQueue(slots=1, max_queued=1)
+        running = jobs.submit(blocked(self.release))
+        wait_for(running, ("running",))
+        queued = jobs.submit(blocked(self.release))
+        self.assertEqual(jobs.position(queued), 0)
+        with self.assertRaises(QueueFull):
+            jobs.submit(steps(1))
+
+        self.release.set()
+        wait_for(queued)
+        jobs.submit(steps(1))
+
+    def test_cancel_queued(self):
+        jobs = JobQueue(slots=1, max_queued=2)
+        running = jobs.submit(blocked(self.release))
+        wait_for(running, ("running",))
+        queued = jobs.submit(steps(1))
+        jobs.cancel(queued)
+        self.assertEqual(queued.status, "cancelled")
+        self.assertIsNotNone(queued.finished)
+        self.assertIsNone(jobs.position(queued))
+
+        self.release.set()
+        wait_for(running)
+        self.assertEqual(queued.messages, [])
+
+    def test_cancel_running(self):
+        jobs = JobQueue(slots=1, max_queued=1)
+        closed = threading.Event()
+        job = jobs.submit(blocked(self.release, closed))
+        wait_for(job, ("running",))
+        jobs.cancel(job)
+        self.assertTrue(closed.wait(5))
+        self.assertEqual(job.status, "cancelled")
+        count = len(job.messages)
+        time.sleep(0.05)
+        self.assertEqual(len(job.messages), count)
+
+        # the slot is free again
+        wait_for(jobs.submit(steps(1)))
+
+    def test_failing_source(self):
+        def source(cancelled):
+            yield {"type": "steps", "steps": [0], "calls": []}
+            raise RuntimeError("worker died")
+
+        jobs = JobQueue(slots=1, max_queued=1)
+        job = jobs.submit(source)
+        wait_for(job)
+        self.assertEqual(job.status, "failed")
+        self.assertEqual(json.loads(job.messages[-1])["error"], "worker died")
+
+    def test_ttl(self):
+        jobs = JobQueue(slots=1, max_queued=1, ttl=0.05)
+        job = jobs.submit(steps(1))
+        wait_for(job)
+        self.assertIs(jobs.get(job.id), job)
+        time.sleep(0.1)
+        self.assertIsNone(jobs.get(job.id))
+
+    def test_byte_cap_drops_oldest_finished(self):
+        jobs = JobQueue(slots=1, max_queued=1)
+        finished = []
+        for count in (5, 6, 7):
+            job = jobs.submit(steps(count))
+            wait_for(job)
+            finished.append(job)
+
+        jobs.max_bytes = finished[1].nbytes + finished[2].nbytes
+        jobs.expire()
+        self.assertEqual([jobs.get(job.id) is not None for job in finished], [False, True, True])
+        jobs.max_bytes -= 1
+        self.assertEqual([jobs.get(job.id) is not None for job in finished], [False, False, True])
+
+    def test_byte_cap_keeps_unfinished(self):
+        jobs = JobQueue(slots=1, max_queued=1, max_bytes=0)
+        job = jobs.submit(blocked(self.release))
+        wait_for(job, ("running",))
+        time.sleep(0.05)
+        self.assertIs(jobs.get(job.id), job)
+        self.release.set()
+        wait_for(job)
+        self.assertIsNone(jobs.get(job.id))
+
+
+if __name__ == "__main__":
+    unittest.main()
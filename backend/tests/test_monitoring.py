@@ -0,0 +1,85 @@
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import executor
+import tracer
+
+# both call textwrap, only the first traces into it
+WRAPPING = """
+import textwrap
+lines = []
+for i in range({iterations}):
+    lines.append(textwrap.shorten("a few words " * 3, width=20))
+"""
+
+COUNTING = """
+import textwrap
+total = 0
+for i in range({iterations}):
+    total += len(textwrap.dedent("  x"))
+"""
+
+
+@unittest.skipUnless(tracer.USE_MONITORING, "sys.monitoring needs Python 3.12")
+class ConcurrentSessionsTest(unittest.TestCase):
+    # sys.monitoring events are per code object and shared by every thread,
+    # a session must record the same steps with another one running next to it
+
+    def run_code(self, code, modules):
+        return executor.run_code(code, trace_modules=modules)
+
+    def steps(self, result):
+        self.assertTrue(result["success"], result.get("error"))
+        return [(step["event"], step["lineno"]) for step in result["steps"]]
+
+    def test_concurrent_allow_lists(self):
+        programs = [
+            (WRAPPING.format(iterations=30), ["textwrap"]),
+            (COUNTING.format(iterations=30), ["colorsys"]),
+            (COUNTING.format(iterations=30), None),
+        ]
+        alone = [self.steps(self.run_code(code, modules)) for code, modules in programs]
+
+        results = [None] * len(programs)
+        barrier = threading.Barrier(len(programs))
+        def run(index):
+            code, modules = programs[index]
+            barrier.wait()
+            results[index] = self.run_code(code, modules)
+
+        threads = [threading.Thread(target=run, args=(index,)) for index in range(len(programs))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for result, steps in zip(results, alone):
+            self.assertEqual(self.steps(result), steps)
+
+    def test_shared_module_outlives_the_first_session(self):
+        # both trace textwrap, the one stopping first leaves the other's events on
+        short = (WRAPPING.format(iterations=5), ["textwrap"])
+        long = (WRAPPING.format(iterations=30), ["textwrap"])
+        alone = self.steps(self.run_code(*long))
+
+        results = {}
+        barrier = threading.Barrier(2)
+        def run(name, program):
+            barrier.wait()
+            results[name] = self.run_code(*program)
+
+        threads = [threading.Thread(target=run, args=item) for item in (("short", short), ("long", long))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.steps(results["long"]), alone)
+
+
+if __name__ == "__main__":
+    unittest.main()
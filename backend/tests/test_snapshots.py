@@ -0,0 +1,150 @@
+import os
+import sys
+import copy
+import random
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import executor
+from snapshots import SnapshotStore, KEYFRAME_INTERVAL
+
+# __eq__ only looks at v, the list grows behind it
+LINKED_LIST = """
+class Node:
+    def __init__(self, v, next=None):
+        self.v = v
+        self.next = next
+
+    def __eq__(self, other):
+        return isinstance(other, Node) and self.v == other.v
+
+    def __repr__(self):
+        return f"Node({self.v}->{self.next!r})"
+
+a = Node(1)
+a.next = Node(2)
+a.next.next = Node(3)
+b = a
+"""
+
+
+class Slotted:
+    __slots__ = ("v", "items")
+
+    def __init__(self, v):
+        self.v = v
+        self.items = []
+
+    def __eq__(self, other):
+        return self.v == other.v
+
+
+class CustomEqualityTest(unittest.TestCase):
+    # a value counts as unchanged by its contents, not by its own __eq__
+
+    def test_linked_list(self):
+        result = executor.run_code(LINKED_LIST)
+        self.assertTrue(result["success"], result.get("error"))
+        states = [step["after"]["a"] for step in result["steps"] if "a" in step["after"]]
+        self.assertEqual(states[0], "Node(1->None)")
+        self.assertEqual(states[-1], "Node(1->Node(2->Node(3->None)))")
+
+    def test_attributes_changed_behind_eq(self):
+        store = SnapshotStore()
+        node = type("Node", (), {"__eq__": lambda self, other: True})()
+        node.items = [1]
+        first = store.record("frame", {"node": node})
+        node.items.append(2)
+        second = store.record("frame", {"node": node})
+        self.assertNotEqual(first, second)
+        self.assertEqual(store.resolve(first)["node"].items, [1])
+        self.assertEqual(store.resolve(second)["node"].items, [1, 2])
+
+    def test_slotted_custom_eq_is_copied_again(self):
+        store = SnapshotStore()
+        value = Slotted(1)
+        first = store.record("frame", {"value": value})
+        value.items.append(2)
+        second = store.record("frame", {"value": value})
+        self.assertEqual(store.resolve(first)["value"].items, [])
+        self.assertEqual(store.resolve(second)["value"].items, [2])
+
+
+class ResolveTest(unittest.TestCase):
+    # every recorded id resolves to the state as it was, whichever keyframe
+    # and deltas it is built from
+
+    def test_round_trip(self):
+        rng = random.Random(1)
+        store = SnapshotStore()
+        variables = {}
+        expected = {}
+        for step in range(3 * KEYFRAME_INTERVAL + 5):
+            action = rng.randrange(5)
+            name = f"v{rng.randrange(6)}"
+            if action == 0:
+                variables[name] = step
+            elif action == 1:
+                variables[name] = [step, [step]]
+            elif action == 2 and isinstance(variables.get(name), list):
+                variables[name][1].append(step) # mutated in place
+            elif action == 3:
+                variables.pop(name, None)
+            elif action == 4:
+                variables[name] = {"step": step, "items": (1, 2)}
+            snap_id = store.record("frame", dict(variables))
+            expected[snap_id] = copy.deepcopy(variables)
+
+        ids = list(expected)
+        self.assertGreater(len(ids), KEYFRAME_INTERVAL)
+        for snap_id in ids + ids[::-1] + rng.sample(ids, len(ids)):
+            self.assertEqual(store.resolve(snap_id), expected[snap_id], snap_id)
+
+    def test_keyframes(self):
+        store = SnapshotStore()
+        ids = [store.record("frame", {"i": i}) for i in range(2 * KEYFRAME_INTERVAL + 1)]
+        keyframes = [snap_id for snap_id in ids if store.delta(snap_id)[0] is None]
+        self.assertEqual(keyframes, [0, KEYFRAME_INTERVAL, 2 * KEYFRAME_INTERVAL])
+        self.assertEqual(store.delta(1), (0, {"i": 1}, ()))
+
+    def test_unchanged_state_keeps_its_id(self):
+        store = SnapshotStore()
+        items = [1, 2]
+        first = store.record("frame", {"items": items, "n": 1})
+        self.assertEqual(store.record("frame", {"items": items, "n": 1}), first)
+        items.append(3)
+        second = store.record("frame", {"items": items, "n": 1})
+        self.assertNotEqual(second, first)
+        self.assertEqual(store.resolve(first)["items"], [1, 2])
+        self.assertEqual(store.resolve(second)["items"], [1, 2, 3])
+
+    def test_removed_names(self):
+        store = SnapshotStore()
+        first = store.record("frame", {"a": 1, "b": 2})
+        second = store.record("frame", {"a": 1})
+        self.assertEqual(store.delta(second), (first, {}, ("b",)))
+        self.assertEqual(store.resolve(second), {"a": 1})
+        self.assertEqual(store.resolve(first), {"a": 1, "b": 2})
+
+    def test_chains_are_separate(self):
+        store = SnapshotStore()
+        outer = store.record("outer", {"x": 1})
+        inner = store.record("inner", {"y": [1]})
+        store.release("inner")
+        again = store.record("inner", {"y": [1]})
+        self.assertIsNone(store.delta(again)[0])
+        self.assertEqual(store.resolve(outer), {"x": 1})
+        self.assertEqual(store.resolve(inner), {"y": [1]})
+
+    def test_aliases_share_one_copy(self):
+        store = SnapshotStore()
+        shared = [[1], [2]]
+        state = store.resolve(store.record("frame", {"a": shared, "b": shared}))
+        self.assertIs(state["a"], state["b"])
+        self.assertIsNot(state["a"], shared)
+        self.assertIsNone(store.resolve(None))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import os
+import sys
+import json
+import unittest
+
+os.environ.setdefault("DHRISTI_WORKERS", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+import executor
+
+# the caller changes every list right after make() returned it
+MUTATED = """
+def make(n):
+    out = []
+    for i in range(n):
+        out.append(i)
+    return out
+
+rows = []
+for k in range(300):
+    r = make(3)
+    r.append(-1)
+    r.clear()
+    rows.append(r)
+"""
+
+
+def return_values(steps):
+    return [step["return_value"] for step in steps if "return_value" in step]
+
+
+class StreamCacheTest(unittest.TestCase):
+    # streamed batches hold each value as it was returned, so a stream
+    # caches the result /execute would have computed
+
+    def test_stream_matches_run_code(self):
+        for state_format in ("full", "table"):
+            result = executor.run_code(MUTATED, state_format=state_format)
+            messages = list(executor.run_code_stream(MUTATED, state_format=state_format))
+            streamed = [s for m in messages if m["type"] == "steps" for s in m["steps"]]
+            self.assertEqual(return_values(streamed), return_values(result["steps"]))
+        self.assertEqual(return_values(executor.run_code(MUTATED)["steps"]), [[0, 1, 2]] * 300 + [None])
+
+    def test_stream_caches_what_execute_returns(self):
+        code = MUTATED + "# streamed first\n"
+        client = app.app.test_client()
+        cached_before = len(app.cache.results.entries)
+        lines = client.post("/execute/stream", json={"code": code}).get_data(as_text=True).splitlines()
+        self.assertEqual(json.loads(lines[-1])["type"], "done")
+        self.assertEqual(len(app.cache.results.entries), cached_before + 1)
+
+        cached = client.post("/execute", json={"code": code}).get_json()
+        self.assertEqual(return_values(cached["steps"]), [[0, 1, 2]] * 300 + [None])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,144 +1,390 @@
 import sys
-import copy
 import math
 import types
+import contextvars
+from collections import deque
 
-execution_log = []
-last_line = None
-current_lineno = None
-call_stack = [] # track function calls
-call_tree = [] # store recursive call tree
-call_counter = 0 # unique id for each call
-
-def tracer(frame, event, arg):
-    global last_line
-    global call_counter 
-    current_call_id = call_stack[-1]["call_id"] if call_stack else None
-
-
-    if frame.f_globals.get("__name__") != "__main__":
-        return tracer
-    
-    try:
-        frame.f_trace_opcodes = True
-    except Exception:
-        pass
-
-    def clean_vars(variables):
-        cleaned = {}
-        for k, v in variables.items():
-            if k.startswith("__"):
-                continue
-            if callable(v) and not hasattr(v, '__dict__'): # -> to check if an object can be called (checking if v is callable, if it is, then continue)
-                continue
-            if isinstance(v, types.ModuleType):
-                continue
-            if isinstance(v, type): # -> checks whether an object or variable is an instance of a specified type or class. (checks whether v is of type math)
+from snapshots import SnapshotStore
+from steplog import StepLog, CALL, LINE, RETURN, FOLD
+from budgets import BudgetExceeded
+
+# sys.monitoring (PEP 669) only fires callbacks for the code objects we ask for,
+# so library code runs untraced. Older interpreters fall back to sys.settrace.
+USE_MONITORING = sys.version_info >= (3, 12)
+
+# session traced by the current thread / task
+_current_session = contextvars.ContextVar("trace_session", default=None)
+
+def current_session():
+    return _current_session.get()
+
+def clean_vars(variables):
+    cleaned = {}
+    for k, v in variables.items():
+        if k.startswith("__"):
+            continue
+        if callable(v) and not hasattr(v, '__dict__'): # -> to check if an object can be called (checking if v is callable, if it is, then continue)
+            continue
+        if isinstance(v, types.ModuleType):
+            continue
+        if isinstance(v, type): # -> checks whether an object or variable is an instance of a specified type or class. (checks whether v is of type math)
+            continue
+        # if hasattr(v, '__module__') and v.__module__ == '__future__':
+        #     continue
+        cleaned[k] = v
+    return cleaned
+
+
+def nested_codes(compiled, functions):
+    # code objects of the (name, co_firstlineno) functions in compiled, and
+    # the comprehensions, lambdas and inner functions nested in them
+    stack = [(compiled, False)]
+    while stack:
+        code, inside = stack.pop()
+        inside = inside or (code.co_name, code.co_firstlineno) in functions
+        if inside:
+            yield code
+        for const in code.co_consts:
+            if isinstance(const, types.CodeType):
+                stack.append((const, inside))
+
+
+class TraceSession:
+    """
+    All state of one traced execution. start() binds the session to the
+    calling thread (or task), so concurrent requests each trace into their own
+    session and traced_print / the monitoring callbacks find it through
+    current_session().
+    """
+
+    def __init__(self, opcodes=True, fold=None, spans=None, modules=None, budget=None, untraced=None, catches=None):
+        self.execution_log = StepLog() # one row per traced event
+        self.last_line = None
+        self.current_lineno = None
+        self.call_stack = [] # track function calls
+        self.call_tree = [] # store recursive call tree
+        self.call_counter = 0 # unique id for each call
+        self.snapshots = SnapshotStore() # delta-encoded variable states, entries hold snapshot ids
+        self.open_entries = {} # call_id -> log indices still waiting for their "after" state
+        self.printed_output = [] # traced print() calls with the step they belong to
+
+        self.trace_opcodes = opcodes # attach "after" states on opcode/instruction events
+        self.fold_loops = fold # (head, tail) iterations of each loop kept in full, None disables folding
+        self.loop_spans = spans or {} # loop header line -> last line of the loop, from the LoopSpanDetector
+        self.loop_stacks = {} # call_id -> loops the frame is currently inside
+
+        self.traced_modules = {"__main__", *(modules or ())} # module __name__s whose frames are traced
+        self.untraced = set(untraced or ()) # (name, first line) of user functions run without tracing
+        self.untraced_codes = set() # their code objects and everything nested in them, set by start()
+        self.budget = budget # budgets.Budget checked on every call and line, None for no limits
+        self.truncated = None # {"reason", "limit"} once a budget stopped the run
+        self.tripped = None # the BudgetExceeded that did, nothing is recorded after it
+        self.catch_spans = catches or () # (first, last) lines of the program's try bodies catching BaseException
+        self.compiled = None # the program's module code, set by start()
+        self.listener = None # called with no arguments every listen_every traced lines
+        self.listen_every = 0
+        self.next_listen = 0
+
+        self.user_codes = set() # code objects under sys.monitoring
+        self.local_events = 0 # sys.monitoring events enabled on each of them
+        self._token = None
+
+    def snap_locals(self, frame, key):
+        return self.snapshots.record(key, clean_vars(frame.f_locals))
+
+    def open_entry(self, key, index):
+        pending = self.open_entries.get(key)
+        if pending is None:
+            self.open_entries[key] = [index]
+        else:
+            pending.append(index)
+
+    def close_entries(self, frame, key):
+        # attach the frame's current state to everything it left open
+        pending = self.open_entries.get(key)
+        if not pending:
+            return
+        after = self.snap_locals(frame, key)
+        column = self.execution_log.after
+        for index in pending:
+            column[index] = after
+        pending.clear()
+
+    def close_all_entries(self, variables):
+        # end of the run, nothing is left to report a later state
+        if any(self.open_entries.values()):
+            after = self.snapshots.record("final", clean_vars(variables))
+            column = self.execution_log.after
+            for pending in self.open_entries.values():
+                for index in pending:
+                    column[index] = after
+        self.open_entries.clear()
+
+    def fold_iteration(self, loop, start, end):
+        # turn log[start:end] (one finished iteration) into the loop's fold record,
+        # the first step becomes the record and the other slots are dropped
+        log = self.execution_log
+        fold = loop["fold"]
+        if fold is None:
+            fold = start
+            log.kind[fold] = FOLD
+            log.lineno[fold] = loop["header"]
+            log.return_values.pop(fold, None)
+            log.folds[fold] = {"iterations": 0, "changed": {}}
+            loop["fold"] = fold
+            loop["base"] = self.snapshots.resolve(log.get(log.before, fold))
+            start += 1
+
+        for i in range(start, end):
+            log.drop(i)
+
+        # state of the loop's frame once the iteration finished
+        after = log.before[end]
+        log.after[fold] = after
+        summary = log.folds[fold]
+        summary["iterations"] += 1
+
+        base = loop["base"]
+        for name, value in self.snapshots.resolve(after).items():
+            if name in base and base[name] is value:
                 continue
-            # if hasattr(v, '__module__') and v.__module__ == '__future__':
-            #     continue
-            cleaned[k] = v
-        return cleaned
-
-    def snap_locals():
-        try:
-            raw = copy.deepcopy(frame.f_locals)
-        except Exception:
-            raw = dict(frame.f_locals)
-        return clean_vars(raw)
-        
-    if event == "call":
+            stats = summary["changed"].setdefault(name, {})
+            stats["last"] = value
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                stats["min"] = min(stats.get("min", value), value)
+                stats["max"] = max(stats.get("max", value), value)
+
+    def track_loops(self, key, lineno, index):
+        stack = self.loop_stacks.get(key)
+        while stack and not (stack[-1]["header"] <= lineno <= stack[-1]["end"]):
+            stack.pop()
+
+        if stack and stack[-1]["next"] is not None and lineno != stack[-1]["header"]:
+            # into the body, the header visit began an iteration
+            self.count_iteration(stack[-1])
+
+        if lineno not in self.loop_spans:
+            return
+
+        if not stack or stack[-1]["header"] != lineno:
+            self.loop_stacks.setdefault(key, []).append({
+                "first": index, # log index of the loop's first header line
+                "header": lineno,
+                "end": self.loop_spans[lineno],
+                "iterations": 1,
+                "next": None, # log index of a header visit that may still leave the loop
+                "starts": deque(), # log index where each of the last iterations began
+                "fold": None,
+                "base": None
+            })
+            return
+
+        # back at the header. The visit that ends the loop looks the same, it
+        # only counts once the loop goes on (a one-line body comes back here)
+        loop = stack[-1]
+        if loop["next"] is not None:
+            self.count_iteration(loop)
+        loop["next"] = index
+
+    def count_iteration(self, loop):
+        head, tail = self.fold_loops
+        index, loop["next"] = loop["next"], None
+        loop["iterations"] += 1
+        if loop["iterations"] <= head:
+            return
+
+        starts = loop["starts"]
+        starts.append(index)
+        if len(starts) > tail:
+            self.fold_iteration(loop, starts.popleft(), starts[0])
+
+    def check_budget(self, frame):
+        # raises BudgetExceeded once a budget is used up, and again on later
+        # events for as long as the program catches it
+        if self.tripped is None:
+            try:
+                self.budget.check(len(self.execution_log), self.snapshots.nbytes)
+                return
+            except BudgetExceeded as e:
+                self.truncated = {"reason": e.reason, "limit": e.limit}
+                self.tripped = e
+        # sys.settrace removes a trace function that raised, so it waits for
+        # a line where the program can't catch it
+        if USE_MONITORING or not self.caught(frame):
+            raise BudgetExceeded(self.tripped.reason, self.tripped.limit)
+
+    def caught(self, frame):
+        # a frame of the program on the stack is inside one of its catch spans
+        while frame is not None:
+            if frame.f_code.co_filename == self.compiled.co_filename:
+                lineno = frame.f_lineno
+                if any(first <= lineno <= last for first, last in self.catch_spans):
+                    return True
+            if frame.f_code is self.compiled:
+                break
+            frame = frame.f_back
+        return False
+
+    def listen(self, listener, every):
+        # listener runs inside the trace callback, no events fire while it does
+        self.listener = listener
+        self.listen_every = every
+        self.next_listen = every
+
+    def settled(self):
+        # log rows below this index are final: their "after" state is attached
+        # and no loop that is still running can fold them any more
+        bound = len(self.execution_log)
+        for pending in self.open_entries.values():
+            if pending:
+                bound = min(bound, pending[0])
+        for stack in self.loop_stacks.values():
+            if stack:
+                bound = min(bound, stack[0]["first"])
+        return bound
+
+    def on_call(self, frame):
+        if self.budget is not None:
+            self.check_budget(frame)
+            if self.tripped is not None:
+                return
+
         func_name = frame.f_code.co_name
-        lineno = frame.f_lineno
+        lineno = frame.f_lineno or frame.f_code.co_firstlineno
 
-        call_id = call_counter
-        call_counter = call_counter + 1
+        call_id = self.call_counter
+        self.call_counter = self.call_counter + 1
 
-        parent_id = call_stack[-1]["call_id"] if call_stack else None
+        parent_id = self.call_stack[-1]["call_id"] if self.call_stack else None
+        args = self.snap_locals(frame, call_id)
 
         call_info = {
             "call_id" : call_id,
             "func" : func_name,
             "lineno" : lineno,
-            "args" : snap_locals(),
+            "args" : args,
             "parent_id" : parent_id,
             "return_value" : None
         }
 
-        call_stack.append(call_info)
-        call_tree.append(call_info)
-
-        execution_log.append({
-            "event": "call",
-            "func": func_name,
-            "lineno": lineno,
-            "before": snap_locals(),
-            "after": None, 
-            "code": None,
-            "call_id" : call_id
-        })
-        return tracer
-    
-    if event == "line":
-        global current_lineno
-        # providing "after" state for the PREVIOUS line
-        if last_line is not None and execution_log:
-            after = snap_locals()
-            for entry in reversed(execution_log):
-                if entry.get("lineno") == last_line and entry.get("after") is None:
-                    entry["after"] = after
-                    break
+        self.call_stack.append(call_info)
+        self.call_tree.append(call_info)
+
+        index = self.execution_log.append(CALL, func_name, lineno, call_id, args)
+        self.open_entry(call_id, index)
+
+    def on_line(self, frame):
+        if self.budget is not None:
+            self.check_budget(frame)
+            if self.tripped is not None:
+                return
+
+        current_call_id = self.call_stack[-1]["call_id"] if self.call_stack else None
+
+        # providing "after" state for the PREVIOUS line of this frame
+        self.close_entries(frame, current_call_id)
 
         # log the CURRENT line (with "before" state)
-        last_line = frame.f_lineno
-        current_lineno = last_line
-        
-        before = snap_locals()
-        execution_log.append({
-            "event": "line",
-            "before": before,
-            "lineno": last_line,
-            "after": None, 
-            "code": None,
-            "func": frame.f_code.co_name, 
-            "call_id" : current_call_id
-        })
-        return tracer
-
-    if event == "opcode":
-        if last_line is not None and frame.f_lineno == last_line and execution_log:
-            after = snap_locals()
-            for entry in reversed(execution_log):
-                if entry.get("after") is None:
-                    entry["after"] = after
-                    break
-        return tracer
-    
-    if event == "return":
-        if last_line is not None and execution_log:
-            after = snap_locals()
-            for entry in reversed(execution_log):
-                if entry.get("event") == "line" and entry.get("after") is None:
-                    entry["after"] = after
-                    break
-        
-        ret = arg
+        self.last_line = frame.f_lineno
+        self.current_lineno = self.last_line
+
+        before = self.snap_locals(frame, current_call_id)
+        index = self.execution_log.append(LINE, frame.f_code.co_name, self.last_line, current_call_id, before)
+        self.open_entry(current_call_id, index)
+
+        if self.fold_loops is not None:
+            self.track_loops(current_call_id, self.last_line, index)
+
+        if self.listener is not None and index >= self.next_listen:
+            self.next_listen = index + self.listen_every
+            self.listener()
+
+    def on_opcode(self, frame):
+        if self.tripped is not None:
+            self.check_budget(frame)
+            return
+        current_call_id = self.call_stack[-1]["call_id"] if self.call_stack else None
+        self.close_entries(frame, current_call_id)
+
+    def on_return(self, frame, ret):
+        if self.tripped is not None:
+            # frames unwinding after a budget trip
+            return
+        current_call_id = self.call_stack[-1]["call_id"] if self.call_stack else None
+
+        self.close_entries(frame, current_call_id)
+        self.open_entries.pop(current_call_id, None)
+        self.loop_stacks.pop(current_call_id, None)
+        self.snapshots.release(current_call_id)
+
         lineno = frame.f_lineno
+        # a copy like the variables get, the caller may still change the object
+        ret, _ = self.snapshots.store_value(ret, {})
 
-        if call_stack:
-            call_info = call_stack.pop()
+        if self.call_stack:
+            call_info = self.call_stack.pop()
             call_info["return_value"] = ret
 
-        execution_log.append({
-            "event": "return",
-            "lineno": lineno,
-            "func": frame.f_code.co_name,
-            "return_value": ret, 
-            "before": None,
-            "after": None,
-            "code": None, 
-            "call_id" : current_call_id
-        })
-        return tracer
-    
-    return tracer
\ No newline at end of file
+        # the caller's next event supplies the state after the return
+        parent_id = self.call_stack[-1]["call_id"] if self.call_stack else None
+        log = self.execution_log
+        index = log.append(RETURN, frame.f_code.co_name, lineno, current_call_id)
+        log.return_values[index] = ret
+        self.open_entry(parent_id, index)
+
+    def is_traced(self, frame):
+        return frame.f_code not in self.untraced_codes and frame.f_globals.get("__name__") in self.traced_modules
+
+    def tracer(self, frame, event, arg):
+        # global trace function, sys.settrace only calls it for "call" events.
+        # Foreign frames (numpy, sympy, torch, stdlib) get no local tracer and
+        # no opcode tracing, so their lines run without a Python callback.
+        if not self.is_traced(frame):
+            return None
+
+        if self.trace_opcodes:
+            try:
+                frame.f_trace_opcodes = True
+            except Exception:
+                pass
+
+        self.on_call(frame)
+        return self.local_tracer
+
+    def local_tracer(self, frame, event, arg):
+        if event == "line":
+            self.on_line(frame)
+        elif event == "opcode":
+            self.on_opcode(frame)
+        elif event == "return":
+            self.on_return(frame, arg)
+
+        return self.local_tracer
+
+    def start(self, compiled):
+        self.compiled = compiled
+        if self.untraced:
+            self.untraced_codes = set(nested_codes(compiled, self.untraced))
+
+        self._token = _current_session.set(self)
+        if self.budget is not None:
+            self.budget.start()
+
+        if USE_MONITORING:
+            import monitoring
+            monitoring.start(self, compiled)
+        else:
+            sys.settrace(self.tracer)
+
+    def stop(self):
+        if self._token is None:
+            return
+
+        if USE_MONITORING:
+            import monitoring
+            monitoring.stop(self)
+        else:
+            sys.settrace(None)
+
+        _current_session.reset(self._token)
+        self._token = None
@@ -2,6 +2,9 @@ import { useEffect, useMemo, useState } from "react";
 import CodeEditor from "./components/CodeEditor";
 import Controls from "./components/Controls";
 import VisualCanvas from "./components/VisualCanvas";
+import { createStateTable } from "./utils/stateTable";
+
+const API_URL = "https://dhristi-executor.onrender.com";
 
 export default function App() {
   const [code, setCode] = useState(
@@ -13,10 +16,13 @@ export default function App() {
   const [autoPlay, setAutoPlay] = useState(false);
   const [isRunning, setIsRunning] = useState(false);
   const [error, setError] = useState(null);
+  const [truncated, setTruncated] = useState(null);
   const [nnModels, setNnModels] = useState([]);
   const [callTree, setCallTree] = useState([]);
   const [recursiveFuncs, setRecursiveFuncs] = useState([]);
   const [language, setLanguage] = useState("python");
+  // source of the last run, tiles are cut from its trace even after edits
+  const [ranCode, setRanCode] = useState("");
 
 
   const currentStepData = executionLog[currentStep] || null;
@@ -40,6 +46,8 @@ export default function App() {
     const changed = new Set();
 
     Object.keys(curr).forEach((key) => {
+      // unchanged values are the same object from the value table
+      if (prev[key] === curr[key]) return;
       if (JSON.stringify(prev[key]) !== JSON.stringify(curr[key])) {
         changed.add(key);
       }
@@ -67,30 +75,67 @@ export default function App() {
   const runCode = async () => {
     setIsRunning(true);
     setError(null);
+    setTruncated(null);
     setExecutionLog([]);
+    setCallTree([]);
+    setNnModels([]);
+    setRecursiveFuncs([]);
     setCurrentStep(0);
     setAutoPlay(false);
+    setRanCode(code);
 
     try {
-      const res = await fetch("https://dhristi-executor.onrender.com/execute", {
+      // steps arrive in batches while the program is still running
+      const res = await fetch(`${API_URL}/execute/stream`, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ code }),
+        body: JSON.stringify({
+          code,
+          fold_loops: true,
+          state_format: "table",
+          array_encoding: "binary",
+          capture_activations: true,
+          call_tree_format: "collapsed",
+        }),
       });
 
-      const data = await res.json();
-
       if (!res.ok) {
+        const data = await res.json();
         throw new Error(data.error || "Execution failed");
       }
 
-      if (data.success) {
-        setExecutionLog(data.steps || []);
-        setNnModels(data.nn_models || []);
-        setCallTree(data.call_tree || []);
-        setRecursiveFuncs(data.recursive_funcs || []);
-      } else {
-        throw new Error(data.error || "Execution failed");
+      // variable states are sent once in shared tables and rebuilt on demand
+      const table = createStateTable();
+
+      const handleMessage = (message) => {
+        if (message.type === "steps") {
+          table.add(message);
+          setExecutionLog((log) => log.concat(message.steps.map(table.step)));
+          setCallTree((tree) => tree.concat(message.calls.map(table.call)));
+        } else if (message.type === "done") {
+          setNnModels(message.nn_models || []);
+          setRecursiveFuncs(message.recursive_funcs || []);
+          setTruncated(message.truncated || null);
+        } else if (message.type === "error") {
+          throw new Error(message.error || "Execution failed");
+        }
+      };
+
+      // newline-delimited JSON, a message may be split across chunks
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffered = "";
+      for (;;) {
+        const { done, value } = await reader.read();
+        if (done) break;
+
+        buffered += decoder.decode(value, { stream: true });
+        const lines = buffered.split("\n");
+        buffered = lines.pop();
+        lines.filter(Boolean).forEach((line) => handleMessage(JSON.parse(line)));
+      }
+      if (buffered.trim()) {
+        handleMessage(JSON.parse(buffered));
       }
     } catch (err) {
       setError(err.message);
@@ -99,6 +144,48 @@ export default function App() {
     }
   };
 
+  // zoomed window of a large array variable at the current step
+  const loadTile = async (name, rows, cols) => {
+    const res = await fetch(`${API_URL}/tile`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({
+        code: ranCode,
+        fold_loops: true,
+        step: currentStep,
+        state: currentStepData?.after ? "after" : "before",
+        name,
+        rows,
+        cols,
+      }),
+    });
+    const data = await res.json();
+    if (!data.success) throw new Error(data.error || "Tile failed");
+    return data.tile;
+  };
+
+  // more of the collapsed call tree below one call, offset being the
+  // child entries it already has
+  const expandCall = async (callId, offset) => {
+    const res = await fetch(`${API_URL}/calls`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({
+        code: ranCode,
+        fold_loops: true,
+        call_id: callId,
+        offset,
+      }),
+    });
+    const data = await res.json();
+    if (!data.success) throw new Error(data.error || "Expand failed");
+    setCallTree((tree) =>
+      tree
+        .map((c) => (c.call_id === callId ? { ...c, hidden: data.hidden } : c))
+        .concat(data.calls)
+    );
+  };
+
   return (
     <div className="h-screen w-screen bg-neutral-900">
       <div className="flex h-full w-full max-w-[1800px] mx-auto flex-col">
@@ -129,6 +216,7 @@ export default function App() {
               runCode={runCode}
               isRunning={isRunning}
               error={error}
+              truncated={truncated}
               executionLog={executionLog}
               currentStep={currentStep}
               currentStepData={currentStepData}
@@ -147,6 +235,8 @@ export default function App() {
               nnModels={nnModels}
               callTree={callTree}
               recursiveFuncs={recursiveFuncs}
+              loadTile={loadTile}
+              expandCall={expandCall}
             />
           </div>
         </div>
@@ -0,0 +1,168 @@
+import { useEffect, useRef, useState } from "react";
+
+// Heatmap of a pooled grid ({mean, max, block, rows, cols} from the backend),
+// one canvas pixel block per cell. null cells had no finite value.
+function Heatmap({ grid, mode, onSelect }) {
+  const canvasRef = useRef(null);
+  const cells = grid[mode] || [];
+  const rows = cells.length;
+  const cols = rows ? cells[0].length : 0;
+  const cellSize = Math.max(3, Math.floor(256 / Math.max(rows, cols, 1)));
+
+  useEffect(() => {
+    const canvas = canvasRef.current;
+    if (!canvas) return;
+    const ctx = canvas.getContext("2d");
+
+    let lo = Infinity;
+    let hi = -Infinity;
+    cells.forEach((row) =>
+      row.forEach((v) => {
+        if (v === null) return;
+        lo = Math.min(lo, v);
+        hi = Math.max(hi, v);
+      })
+    );
+    const range = hi - lo || 1;
+
+    cells.forEach((row, i) =>
+      row.forEach((v, j) => {
+        if (v === null) {
+          ctx.fillStyle = "rgb(127, 29, 29)";
+        } else {
+          const t = (v - lo) / range;
+          ctx.fillStyle = `rgb(${Math.round(20 + 60 * t)}, ${Math.round(40 + 200 * t)}, ${Math.round(30 + 90 * t)})`;
+        }
+        ctx.fillRect(j * cellSize, i * cellSize, cellSize, cellSize);
+      })
+    );
+  }, [cells, cellSize]);
+
+  const handleClick = (e) => {
+    if (!onSelect) return;
+    const rect = e.currentTarget.getBoundingClientRect();
+    const i = Math.floor((e.clientY - rect.top) / cellSize);
+    const j = Math.floor((e.clientX - rect.left) / cellSize);
+    if (i < rows && j < cols) onSelect(i, j);
+  };
+
+  return (
+    <canvas
+      ref={canvasRef}
+      width={cols * cellSize}
+      height={rows * cellSize}
+      onClick={handleClick}
+      className={`rounded border border-green-700/40 ${onSelect ? "cursor-zoom-in" : ""}`}
+    />
+  );
+}
+
+function Histogram({ histogram }) {
+  const peak = Math.max(...histogram.counts, 1);
+  return (
+    <div>
+      <div className="flex h-12 items-end gap-px">
+        {histogram.counts.map((count, i) => (
+          <div
+            key={i}
+            className="flex-1 bg-green-500/60"
+            style={{ height: `${(count / peak) * 100}%` }}
+          />
+        ))}
+      </div>
+      <div className="flex justify-between text-[10px] text-gray-500">
+        <span>{histogram.min.toPrecision(4)}</span>
+        <span>{histogram.max.toPrecision(4)}</span>
+      </div>
+    </div>
+  );
+}
+
+// Summary of an array too large to send in full: stats, distribution and a
+// pooled thumbnail. Clicking a cell loads that block through loadTile.
+export default function ArraySummary({ summary, name, loadTile }) {
+  const [mode, setMode] = useState("mean");
+  const [tile, setTile] = useState(null);
+  const [loading, setLoading] = useState(false);
+  const [tileError, setTileError] = useState(null);
+
+  const thumbnail = summary.thumbnail;
+  const grid = tile || thumbnail;
+
+  // a new value for this variable resets the zoom
+  useEffect(() => {
+    setTile(null);
+    setTileError(null);
+  }, [summary]);
+
+  const zoom = async (i, j) => {
+    const [bh, bw] = grid.block;
+    if (bh === 1 && bw === 1) return;
+    const r0 = grid.rows[0] + i * bh;
+    const c0 = grid.cols[0] + j * bw;
+
+    setLoading(true);
+    setTileError(null);
+    try {
+      // the clicked block, pooled again by the backend if it is still large
+      setTile(await loadTile(name, [r0, r0 + bh], [c0, c0 + bw]));
+    } catch (err) {
+      setTileError(err.message);
+    } finally {
+      setLoading(false);
+    }
+  };
+
+  return (
+    <div className="space-y-2">
+      <div className="bg-slate-700 p-3 rounded text-sm text-gray-300 space-y-1">
+        <div>Min: {summary.min?.toFixed(4)}</div>
+        <div>Max: {summary.max?.toFixed(4)}</div>
+        <div>Mean: {summary.mean?.toFixed(4)}</div>
+        {summary.quantiles && (
+          <div className="text-xs text-gray-400">
+            {Object.entries(summary.quantiles)
+              .map(([q, v]) => `${q} ${v}`)
+              .join(" · ")}
+          </div>
+        )}
+        {(summary.nan > 0 || summary.inf > 0) && (
+          <div className="text-xs text-red-400">
+            NaN: {summary.nan} · Inf: {summary.inf}
+          </div>
+        )}
+      </div>
+
+      {summary.histogram && <Histogram histogram={summary.histogram} />}
+
+      {grid && (
+        <div className="space-y-1">
+          <div className="flex items-center gap-2 text-xs text-gray-400">
+            <span>
+              rows {grid.rows[0]}–{grid.rows[1]}, cols {grid.cols[0]}–{grid.cols[1]}
+              {grid.block[0] * grid.block[1] > 1 &&
+                ` · ${grid.block[0]}×${grid.block[1]} blocks`}
+            </span>
+            <button
+              className="rounded bg-neutral-700 px-2 text-gray-200"
+              onClick={() => setMode(mode === "mean" ? "max" : "mean")}
+            >
+              {mode}
+            </button>
+            {tile && (
+              <button
+                className="rounded bg-neutral-700 px-2 text-gray-200"
+                onClick={() => setTile(null)}
+              >
+                back
+              </button>
+            )}
+            {loading && <span>loading…</span>}
+          </div>
+          <Heatmap grid={grid} mode={mode} onSelect={loadTile ? zoom : null} />
+          {tileError && <div className="text-xs text-red-400">{tileError}</div>}
+        </div>
+      )}
+    </div>
+  );
+}
@@ -2,6 +2,13 @@ import { useEffect, useRef } from "react";
 import { Play } from "./icons";
 import Editor from "@monaco-editor/react";
 
+const TRUNCATED_LABELS = {
+  seconds: "Time (seconds)",
+  steps: "Step",
+  snapshot_mb: "Snapshot memory (MB)",
+  rss_mb: "Process memory (MB)",
+};
+
 
 export default function CodeEditor({
   code,
@@ -9,6 +16,7 @@ export default function CodeEditor({
   runCode,
   isRunning,
   error,
+  truncated,
   executionLog,
   currentStep,
   currentStepData,
@@ -147,6 +155,16 @@ export default function CodeEditor({
         </button>
       </div>
 
+      {/* BUDGET HIT, PARTIAL TRACE */}
+      {truncated && (
+        <div className="mt-2 rounded-md border border-amber-500/60 bg-amber-500/10 p-3">
+          <div className="text-xs font-semibold text-amber-400">Execution stopped early</div>
+          <div className="text-xs font-mono text-amber-300">
+            {TRUNCATED_LABELS[truncated.reason] || truncated.reason} limit of {truncated.limit} reached, showing the steps traced so far
+          </div>
+        </div>
+      )}
+
       {/* ERROR */}
       {error && (
         <div className="mt-2 rounded-md border border-red-500/60 bg-red-500/10 p-3">
@@ -106,6 +106,9 @@ export default function Controls({
           `RETURN ${currentStepData.func}()`}
 
         {currentStepData?.event === "line" && `Line ${currentStepData.lineno}`}
+
+        {currentStepData?.event === "fold" &&
+          `LOOP Line ${currentStepData.lineno} (${currentStepData.fold?.iterations} iterations folded)`}
       </div>
     </div>
   );
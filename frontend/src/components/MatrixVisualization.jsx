@@ -1,6 +1,7 @@
 import ArrayVisualization from "./ArrayVisualization";
+import ArraySummary from "./ArraySummary";
 
-export default function MatrixVisualization({ matrix, name }) {
+export default function MatrixVisualization({ matrix, name, loadTile }) {
   // NumPy array from backend
   if (matrix && matrix.type === "ndarray") {
     const values = matrix.values;
@@ -44,11 +45,7 @@ export default function MatrixVisualization({ matrix, name }) {
           <div className="text-xs text-yellow-400 mb-2">
             Large numpy array (size: {matrix.summary.size})
           </div>
-          <div className="bg-slate-700 p-3 rounded text-sm text-gray-300">
-            <div>Min: {matrix.summary.min?.toFixed(4)}</div>
-            <div>Max: {matrix.summary.max?.toFixed(4)}</div>
-            <div>Mean: {matrix.summary.mean?.toFixed(4)}</div>
-          </div>
+          <ArraySummary summary={matrix.summary} name={name} loadTile={loadTile} />
         </div>
       );
     }
@@ -1,3 +1,93 @@
+// Neurons drawn per layer without a weight summary (those arrive pooled into
+// buckets), wider layers show their first ones and a "+N"
+const MAX_NEURONS = 12;
+
+const formatCount = (n) =>
+  n === null || n === undefined ? "?" : n.toLocaleString();
+
+function Bars({ histogram }) {
+  const peak = Math.max(...histogram, 1);
+  return (
+    <div className="flex h-4 w-24 items-end gap-px">
+      {histogram.map((count, i) => (
+        <div
+          key={i}
+          className="flex-1 bg-cyan-400/70"
+          style={{ height: `${(count / peak) * 100}%` }}
+        />
+      ))}
+    </div>
+  );
+}
+
+function LayerTable({ layers }) {
+  return (
+    <table className="w-full text-left text-xs text-gray-300">
+      <thead className="text-gray-500">
+        <tr>
+          <th className="pr-2 font-normal">layer</th>
+          <th className="pr-2 font-normal">type</th>
+          <th className="pr-2 font-normal">params</th>
+          <th className="pr-2 font-normal">weights</th>
+          <th className="pr-2 font-normal">output</th>
+          <th className="font-normal">activation</th>
+        </tr>
+      </thead>
+      <tbody>
+        {layers.map((layer, i) => {
+          const act = layer.activation;
+          const w = layer.weights;
+          return (
+            <tr key={i} className="border-t border-slate-700/60">
+              <td className="pr-2 font-mono">{layer.name ?? i}</td>
+              <td className="pr-2">
+                {layer.layer}
+                {layer.in !== undefined &&
+                  layer.in !== null &&
+                  ` (${layer.in} → ${layer.out ?? "?"})`}
+              </td>
+              <td className="pr-2">
+                {layer.parameters !== undefined
+                  ? formatCount(layer.parameters)
+                  : ""}
+              </td>
+              <td className="pr-2">
+                {w && w.mean !== undefined && (
+                  <div className="flex items-center gap-2">
+                    <span>
+                      μ {w.mean.toPrecision(3)} σ {w.std.toPrecision(3)}
+                    </span>
+                    {w.histogram && <Bars histogram={w.histogram.counts} />}
+                  </div>
+                )}
+              </td>
+              <td className="pr-2 font-mono">
+                {act ? `[${act.shape.join(", ")}]` : ""}
+              </td>
+              <td>
+                {act && act.mean !== undefined && (
+                  <div className="flex items-center gap-2">
+                    <span>
+                      μ {act.mean.toPrecision(3)} σ {act.std.toPrecision(3)}
+                    </span>
+                    {act.histogram && <Bars histogram={act.histogram} />}
+                    {act.nonfinite > 0 && (
+                      <span className="text-red-400">{act.nonfinite} NaN/Inf</span>
+                    )}
+                    {act.calls > 1 && (
+                      <span className="text-gray-500">×{act.calls}</span>
+                    )}
+                  </div>
+                )}
+              </td>
+            </tr>
+          );
+        })}
+      </tbody>
+    </table>
+  );
+}
+
 export default function NeuralNetworkVisualization({ model }) {
   if (!model || !model.layers || model.layers.length === 0) {
     return null;
@@ -9,15 +99,40 @@ export default function NeuralNetworkVisualization({ model }) {
      1. Expand layers into neurons
   -------------------------------- */
 
-  const neuronLayers = layers.map((layer, layerIndex) => {
-    const count =
-      layerIndex === 0 ? layer.in : layer.out;
+  // only layers with a known size are columns, activations and other
+  // shape-preserving layers are listed in the table below
+  const sized = layers.filter((layer) => Number.isInteger(layer.out));
+  const widths = sized.length
+    ? [sized[0].in, ...sized.map((layer) => layer.out)]
+    : [];
 
-    return Array.from({ length: count }, (_, i) => ({
-      id: `${layerIndex}-${i}`,
-      layerIndex,
-      neuronIndex: i,
-    }));
+  // a layer with a weight summary has its neurons pooled into buckets of
+  // neighbouring ones, the column then draws one neuron per bucket
+  const bucketsOf = (c) => {
+    const outs = c > 0 && sized[c - 1].weights?.buckets;
+    if (outs) return { count: outs.out, block: outs.block[0] };
+    const ins = sized[c]?.weights?.buckets;
+    if (ins) return { count: ins.in, block: ins.block[1] };
+    return null;
+  };
+
+  const neuronLayers = widths.map((width, layerIndex) => {
+    const count = Number.isInteger(width) ? width : 0;
+    const buckets = bucketsOf(layerIndex);
+    const drawn = buckets ? buckets.count : Math.min(count, MAX_NEURONS);
+    return {
+      count: buckets ? drawn : count,
+      neurons: Array.from({ length: drawn }, (_, i) => {
+        const first = buckets ? i * buckets.block : i;
+        const last = buckets ? Math.min(first + buckets.block, count) - 1 : i;
+        return {
+          id: `${layerIndex}-${i}`,
+          layerIndex,
+          neuronIndex: i,
+          label: first === last ? `Neuron ${first}` : `Neurons ${first}–${last}`,
+        };
+      }),
+    };
   });
 
   /* -------------------------------
@@ -28,9 +143,9 @@ export default function NeuralNetworkVisualization({ model }) {
   const Y_GAP = 48;
   const NEURON_SIZE = 24;
 
-  const positionedLayers = neuronLayers.map((layer, x) => {
-    const totalHeight = (layer.length - 1) * Y_GAP;
-    return layer.map((n, y) => ({
+  const positionedLayers = neuronLayers.map(({ neurons }, x) => {
+    const totalHeight = (neurons.length - 1) * Y_GAP;
+    return neurons.map((n, y) => ({
       ...n,
       x: x * X_GAP,
       y: y * Y_GAP - totalHeight / 2,
@@ -39,16 +154,36 @@ export default function NeuralNetworkVisualization({ model }) {
 
   const neurons = positionedLayers.flat();
 
+  // "+N" under each column that was cut
+  const hidden = neuronLayers
+    .map(({ count, neurons: drawn }, x) => ({
+      x: x * X_GAP,
+      y: positionedLayers[x][drawn.length - 1]?.y ?? 0,
+      more: count - drawn.length,
+    }))
+    .filter((h) => h.more > 0);
+
   /* -------------------------------
-     3. Build edges (fully connected)
+     3. Build edges: the strongest weights
+        when known, else fully connected
   -------------------------------- */
 
   const edges = [];
 
   for (let l = 0; l < positionedLayers.length - 1; l++) {
+    const ranked = sized[l].weights?.edges;
+    if (ranked) {
+      const peak = Math.max(...ranked.map((e) => e[3]), 1e-12);
+      for (const [i, o, mean, strength] of ranked) {
+        const from = positionedLayers[l][i];
+        const to = positionedLayers[l + 1][o];
+        if (from && to) edges.push({ from, to, mean, weight: strength / peak });
+      }
+      continue;
+    }
     for (const from of positionedLayers[l]) {
       for (const to of positionedLayers[l + 1]) {
-        edges.push({ from, to });
+        edges.push({ from, to, mean: 1, weight: 0.3 });
       }
     }
   }
@@ -58,18 +193,22 @@ export default function NeuralNetworkVisualization({ model }) {
   -------------------------------- */
 
   const maxX =
-    Math.max(...neurons.map((n) => n.x)) +
+    Math.max(0, ...neurons.map((n) => n.x)) +
     NEURON_SIZE +
     40;
 
-  const minY = Math.min(...neurons.map((n) => n.y));
+  const minY = Math.min(0, ...neurons.map((n) => n.y));
   const maxY =
-    Math.max(...neurons.map((n) => n.y)) +
-    NEURON_SIZE;
+    Math.max(0, ...neurons.map((n) => n.y)) +
+    NEURON_SIZE +
+    (hidden.length ? 20 : 0);
 
   const canvasWidth = maxX;
   const canvasHeight = maxY - minY + 40;
 
+  const first = sized[0];
+  const last = sized[sized.length - 1];
+
   /* -------------------------------
      5. Render
   -------------------------------- */
@@ -78,64 +217,90 @@ export default function NeuralNetworkVisualization({ model }) {
     <div className="space-y-3">
       <div className="text-xs text-cyan-400 font-semibold">
         Neural Network: {model.model_name}
+        {model.source === "runtime" && model.type && (
+          <span className="ml-2 font-normal text-gray-400">{model.type}</span>
+        )}
       </div>
 
-      <div className="relative bg-slate-900 rounded-lg p-4 overflow-visible">
-        {/* SVG edges */}
-        <svg
-          width={canvasWidth}
-          height={canvasHeight}
-          className="absolute top-0 left-0"
-          style={{ pointerEvents: "none" }}
-        >
-          {edges.map((e, i) => (
-            <line
-              key={i}
-              x1={e.from.x + NEURON_SIZE / 2}
-              y1={e.from.y - minY + NEURON_SIZE / 2}
-              x2={e.to.x + NEURON_SIZE / 2}
-              y2={e.to.y - minY + NEURON_SIZE / 2}
-              stroke="#06b6d4"
-              strokeWidth="1"
-              opacity="0.35"
-            />
-          ))}
-        </svg>
-
-        {/* Neurons */}
-        <div
-          style={{
-            width: canvasWidth,
-            height: canvasHeight,
-            position: "relative",
-          }}
-        >
-          {neurons.map((n) => (
-            <div
-              key={n.id}
-              className="absolute rounded-full bg-cyan-400 border border-cyan-200 shadow"
-              style={{
-                width: NEURON_SIZE,
-                height: NEURON_SIZE,
-                left: n.x,
-                top: n.y - minY,
-              }}
-              title={`Layer ${n.layerIndex}, Neuron ${n.neuronIndex}`}
-            />
-          ))}
+      {neurons.length > 0 && (
+        <div className="relative bg-slate-900 rounded-lg p-4 overflow-visible">
+          {/* SVG edges */}
+          <svg
+            width={canvasWidth}
+            height={canvasHeight}
+            className="absolute top-0 left-0"
+            style={{ pointerEvents: "none" }}
+          >
+            {edges.map((e, i) => (
+              <line
+                key={i}
+                x1={e.from.x + NEURON_SIZE / 2}
+                y1={e.from.y - minY + NEURON_SIZE / 2}
+                x2={e.to.x + NEURON_SIZE / 2}
+                y2={e.to.y - minY + NEURON_SIZE / 2}
+                stroke={e.mean < 0 ? "#f472b6" : "#06b6d4"}
+                strokeWidth={0.5 + 2 * e.weight}
+                opacity={0.15 + 0.75 * e.weight}
+              />
+            ))}
+          </svg>
+
+          {/* Neurons */}
+          <div
+            style={{
+              width: canvasWidth,
+              height: canvasHeight,
+              position: "relative",
+            }}
+          >
+            {neurons.map((n) => (
+              <div
+                key={n.id}
+                className="absolute rounded-full bg-cyan-400 border border-cyan-200 shadow"
+                style={{
+                  width: NEURON_SIZE,
+                  height: NEURON_SIZE,
+                  left: n.x,
+                  top: n.y - minY,
+                }}
+                title={`Layer ${n.layerIndex}, ${n.label}`}
+              />
+            ))}
+            {hidden.map((h) => (
+              <div
+                key={h.x}
+                className="absolute text-[10px] text-cyan-300"
+                style={{ left: h.x - 4, top: h.y - minY + NEURON_SIZE + 4 }}
+              >
+                +{h.more}
+              </div>
+            ))}
+          </div>
         </div>
-      </div>
+      )}
 
       {/* Summary */}
-      <div className="bg-slate-800 p-3 rounded text-xs text-gray-300">
+      <div className="bg-slate-800 p-3 rounded text-xs text-gray-300 space-y-2">
         <div className="font-semibold mb-1">
           Architecture Summary
         </div>
         <div>{layers.length} layers</div>
-        <div>
-          Input: {layers[0].in} → Output:{" "}
-          {layers[layers.length - 1].out}
-        </div>
+        {first && (
+          <div>
+            Input: {first.in ?? "?"} → Output: {last.out}
+          </div>
+        )}
+        {model.parameters !== undefined && (
+          <div>
+            Parameters: {formatCount(model.parameters)}
+            {model.trainable !== undefined &&
+              model.trainable !== model.parameters &&
+              ` (${formatCount(model.trainable)} trainable)`}
+          </div>
+        )}
+        {layers.some((layer) => layer.weights || layer.activation) && (
+          <LayerTable layers={layers} />
+        )}
       </div>
     </div>
   );
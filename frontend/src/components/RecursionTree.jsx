@@ -58,9 +58,23 @@
 // }
 
 
-import React from "react";
+import React, { useMemo, useState } from "react";
+
+export default function RecursionTree({ callTree, currentStep, executionLog, expandCall }) {
+  const [expanding, setExpanding] = useState(null);
+  const [expandError, setExpandError] = useState(null);
+
+  // -------- CHILDREN INDEX --------
+  // parent call_id -> child calls, in the order they arrived
+  const childrenOf = useMemo(() => {
+    const index = new Map();
+    (callTree || []).forEach((c) => {
+      if (!index.has(c.parent_id)) index.set(c.parent_id, []);
+      index.get(c.parent_id).push(c);
+    });
+    return index;
+  }, [callTree]);
 
-export default function RecursionTree({ callTree, currentStep, executionLog }) {
   if (!callTree || callTree.length === 0) return null;
 
   // -------- ACTIVE CALL (optional highlighting) --------
@@ -76,13 +90,28 @@ export default function RecursionTree({ callTree, currentStep, executionLog }) {
   const moduleCall = callTree.find(c => c.func === "<module>");
 
   const rootCalls = moduleCall
-    ? callTree.filter(c => c.parent_id === moduleCall.call_id)
-    : callTree.filter(c => c.parent_id === null);
+    ? childrenOf.get(moduleCall.call_id) || []
+    : childrenOf.get(null) || [];
+
+  // -------- EXPAND --------
+  // collapsed trees only send the top levels, the rest is fetched per call
+  const expand = async (call) => {
+    setExpanding(call.call_id);
+    setExpandError(null);
+    try {
+      await expandCall(call.call_id, (childrenOf.get(call.call_id) || []).length);
+    } catch (err) {
+      setExpandError(err.message);
+    } finally {
+      setExpanding(null);
+    }
+  };
 
   // -------- RECURSIVE RENDER --------
   const renderCall = (call) => {
-    const children = callTree.filter(c => c.parent_id === call.call_id);
+    const children = childrenOf.get(call.call_id) || [];
     const isActive = activeCallIds.has(call.call_id);
+    const isRepeat = call.repeat_of !== undefined;
 
     return (
       <div key={call.call_id} className="flex flex-col items-center">
@@ -93,7 +122,9 @@ export default function RecursionTree({ callTree, currentStep, executionLog }) {
             ${isActive
               ? "bg-yellow-900/40 border-yellow-400 text-yellow-200"
               : "bg-slate-900 border-purple-500 text-purple-300"}
+            ${isRepeat ? "border-dashed opacity-80" : ""}
           `}
+          title={isRepeat ? `Same arguments as call #${call.repeat_of}` : undefined}
         >
           <div>
             {call.func}(
@@ -101,6 +132,9 @@ export default function RecursionTree({ callTree, currentStep, executionLog }) {
               .map(([k, v]) => `${k}=${v}`)
               .join(", ")}
             )
+            {call.count > 1 && (
+              <span className="ml-2 text-xs text-amber-300">×{call.count}</span>
+            )}
           </div>
 
           {call.return_value !== null && (
@@ -108,6 +142,24 @@ export default function RecursionTree({ callTree, currentStep, executionLog }) {
               → returns {String(call.return_value)}
             </div>
           )}
+
+          {(call.calls > 1 || call.repeats > 1) && (
+            <div className="text-xs mt-1 text-slate-400">
+              {call.calls > 1 && `${call.calls} calls`}
+              {call.calls > 1 && call.repeats > 1 && " · "}
+              {call.repeats > 1 && `computed ${call.repeats}×`}
+            </div>
+          )}
+
+          {call.hidden > 0 && expandCall && (
+            <button
+              className="mt-1 rounded bg-purple-900/60 px-2 text-xs text-purple-200"
+              disabled={expanding !== null}
+              onClick={() => expand(call)}
+            >
+              {expanding === call.call_id ? "loading…" : `+${call.hidden} more`}
+            </button>
+          )}
         </div>
 
         {/* VERTICAL CONNECTOR */}
@@ -149,6 +201,10 @@ export default function RecursionTree({ callTree, currentStep, executionLog }) {
         Recursion Tree
       </div>
 
+      {expandError && (
+        <div className="mb-2 text-xs text-red-400">{expandError}</div>
+      )}
+
       <div className="overflow-x-auto flex justify-center">
         {rootCalls.map(renderCall)}
       </div>
@@ -3,6 +3,7 @@ import MatrixVisualization from "./MatrixVisualization";
 import DictVisualization from "./DictVisualization";
 import NeuralNetworkVisualization from "./NeuralNetworkVisualization";
 import RecursionTree from "./RecursionTree";
+import ArraySummary from "./ArraySummary";
 
 import { detectType } from "../utils/detectType";
 import { renderFormula } from "../utils/renderFormula";
@@ -16,6 +17,8 @@ export default function VisualCanvas({
   callTree,
   recursiveFuncs,
   currentStep,
+  loadTile,
+  expandCall,
 }) {
   const renderValue = (value, name) => {
     const type = detectType(value);
@@ -25,7 +28,7 @@ export default function VisualCanvas({
         return <ArrayVisualization arr={value} name={name} />;
 
       case "ndarray":
-        return <MatrixVisualization matrix={value} name={name} />;
+        return <MatrixVisualization matrix={value} name={name} loadTile={loadTile} />;
 
       case "tensor_scalar": {
         const scalarValue = Array.isArray(value.values)
@@ -48,7 +51,11 @@ export default function VisualCanvas({
             <div className="text-xs text-gray-500">
               torch tensor: shape {value.shape.join("x")} | {value.dtype}
             </div>
-            <ArrayVisualization arr={value.values} name={name} />
+            {value.summary ? (
+              <ArraySummary summary={value.summary} name={name} loadTile={loadTile} />
+            ) : (
+              <ArrayVisualization arr={value.values} name={name} />
+            )}
           </div>
         );
 
@@ -59,8 +66,9 @@ export default function VisualCanvas({
               torch tensor: shape {value.shape.join("x")} | {value.dtype}
             </div>
             <MatrixVisualization
-              matrix={{ type: "ndarray", values: value.values }}
+              matrix={{ type: "ndarray", values: value.values, summary: value.summary }}
               name={name}
+              loadTile={loadTile}
             />
           </div>
         );
@@ -77,15 +85,7 @@ export default function VisualCanvas({
                   <div className="text-sm text-gray-300">
                     Size: {value.summary.size}
                   </div>
-                  <div className="text-sm text-gray-300">
-                    Min: {value.summary.min?.toFixed(4)}
-                  </div>
-                  <div className="text-sm text-gray-300">
-                    Max: {value.summary.max?.toFixed(4)}
-                  </div>
-                  <div className="text-sm text-gray-300">
-                    Mean: {value.summary.mean?.toFixed(4)}
-                  </div>
+                  <ArraySummary summary={value.summary} name={name} loadTile={loadTile} />
                 </>
               ) : (
                 <div className="text-sm text-gray-400">
@@ -162,9 +162,32 @@ export default function VisualCanvas({
                   callTree={callTree}
                   currentStep={currentStep}
                   executionLog={executionLog}
+                  expandCall={expandCall}
                 />
               )}
 
+            {/* Folded loop iterations */}
+            {currentStepData?.event === "fold" && currentStepData.fold && (
+              <div className="rounded-xl border border-amber-500 p-4 bg-neutral-900">
+                <div className="mb-2 text-xs font-bold text-amber-400">
+                  Loop at Line {currentStepData.lineno}:{" "}
+                  {currentStepData.fold.iterations} iterations folded
+                </div>
+                <div className="flex flex-col gap-1 font-mono text-sm text-gray-300">
+                  {Object.entries(currentStepData.fold.changed).map(
+                    ([name, stats]) => (
+                      <div key={name}>
+                        <span className="text-blue-400">{name}</span>
+                        {stats.min !== undefined &&
+                          ` min ${stats.min} | max ${stats.max} |`}
+                        {` last ${JSON.stringify(stats.last)}`}
+                      </div>
+                    )
+                  )}
+                </div>
+              </div>
+            )}
+
             {/* Console Output */}
             {currentStepData?.stdout?.length > 0 && (
               <div className="rounded-xl border border-green-500 bg-neutral-900 p-4">
@@ -0,0 +1,51 @@
+// Arrays sent with array_encoding "binary" carry {dtype, shape, data} where
+// data is the base64 of their little-endian buffer. The nested `values` the
+// visualizations read are only built when first asked for.
+const TYPED_ARRAYS = {
+  bool: Uint8Array,
+  int8: Int8Array,
+  uint8: Uint8Array,
+  int16: Int16Array,
+  uint16: Uint16Array,
+  int32: Int32Array,
+  uint32: Uint32Array,
+  int64: BigInt64Array,
+  uint64: BigUint64Array,
+  float32: Float32Array,
+  float64: Float64Array,
+};
+
+function toNested(flat, shape) {
+  if (shape.length === 0) return flat[0];
+  if (shape.length === 1) return flat;
+
+  const [rows, ...rest] = shape;
+  const size = rest.reduce((a, b) => a * b, 1);
+  return Array.from({ length: rows }, (_, i) =>
+    toNested(flat.slice(i * size, (i + 1) * size), rest)
+  );
+}
+
+function decodeBuffer({ dtype, shape, data }) {
+  const bytes = Uint8Array.from(atob(data), (c) => c.charCodeAt(0));
+  const typed = new TYPED_ARRAYS[dtype](bytes.buffer);
+
+  let flat;
+  if (dtype === "bool") flat = Array.from(typed, Boolean);
+  else if (dtype === "int64" || dtype === "uint64") flat = Array.from(typed, Number);
+  else flat = Array.from(typed);
+
+  return toNested(flat, shape);
+}
+
+// gives a binary-encoded ndarray / tensor its `values`, anything else is returned as is
+export function decodeArrays(value) {
+  if (!value || typeof value !== "object" || !value.binary) return value;
+
+  let values;
+  Object.defineProperty(value, "values", {
+    get: () => (values ??= decodeBuffer(value.binary)),
+    enumerable: true,
+  });
+  return value;
+}
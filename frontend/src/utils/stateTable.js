@@ -0,0 +1,80 @@
+import { decodeArrays } from "./binaryArrays";
+
+// Decoder for traces sent with state_format "table".
+//
+// A step arrives as [event, func, lineno, before, after, extra?]. before and
+// after index the state table, where each state is [parent, {name: value
+// index}, removed names?], a delta on its parent state. Values, states and
+// lines only ever grow, every "steps" message appends what it added.
+export function createStateTable() {
+  const values = [];
+  const states = [];
+  const lines = {};
+  const resolved = new Map();
+
+  // full variable dict of a state, built once from its parent and cached
+  const state = (index) => {
+    if (index === null || index === undefined) return null;
+    if (resolved.has(index)) return resolved.get(index);
+
+    // walk back to a cached state or a keyframe, then apply the deltas
+    const chain = [];
+    let cur = index;
+    while (cur !== null && !resolved.has(cur)) {
+      chain.push(cur);
+      cur = states[cur][0];
+    }
+
+    let vars = cur === null ? {} : resolved.get(cur);
+    for (let i = chain.length - 1; i >= 0; i--) {
+      const [, set, removed] = states[chain[i]];
+      vars = { ...vars };
+      (removed || []).forEach((name) => delete vars[name]);
+      Object.entries(set).forEach(([name, value]) => {
+        vars[name] = values[value];
+      });
+      resolved.set(chain[i], vars);
+    }
+    return vars;
+  };
+
+  const add = (message) => {
+    values.push(...(message.values || []).map(decodeArrays));
+    states.push(...(message.states || []));
+    Object.assign(lines, message.lines || {});
+  };
+
+  // a step in the shape of the "full" format, states are resolved on first read
+  const step = ([event, func, lineno, before, after, extra = {}]) => {
+    const line = lines[lineno] || {};
+    const { stdout = [], ...rest } = extra;
+    if ("return_value" in rest) rest.return_value = decodeArrays(rest.return_value);
+    if (rest.fold) {
+      Object.values(rest.fold.changed).forEach((stats) => {
+        Object.keys(stats).forEach((key) => {
+          stats[key] = decodeArrays(stats[key]);
+        });
+      });
+    }
+    const decoded = {
+      event,
+      func,
+      lineno,
+      code: line.code ?? null,
+      formula: line.formula ?? null,
+      stdout,
+      ...rest,
+    };
+    Object.defineProperty(decoded, "before", { get: () => state(before), enumerable: true });
+    Object.defineProperty(decoded, "after", { get: () => state(after), enumerable: true });
+    return decoded;
+  };
+
+  const call = (node) => {
+    const decoded = { ...node, return_value: decodeArrays(node.return_value) };
+    Object.defineProperty(decoded, "args", { get: () => state(node.args), enumerable: true });
+    return decoded;
+  };
+
+  return { add, state, step, call };
+}